@@ -0,0 +1,305 @@
+import argparse
+import ast
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+from loguru import logger
+
+# Repository modules, when run as a script rather than python -m benchmarks.crawler
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import settings
+from benchmarks.mock_github import (
+    add_config_arguments,
+    config_from_args,
+    config_to_argv,
+)
+from metrics import endpoint_of
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers (None when empty)."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, round(fraction * (len(values) - 1)))]
+
+
+class LatencyRecorder:
+    """
+    Records the latency of every request made by a client session, from the
+    request being sent until its response headers arrive, by endpoint. Time
+    spent waiting for the rate limiter or the semaphore is not included.
+    """
+
+    def __init__(self):
+        self.latencies = {}  # Endpoint -> seconds of each request
+        self.failures = 0  # Requests that raised, e.g. timeouts
+        self.trace_config = aiohttp.TraceConfig()
+        self.trace_config.on_request_start.append(self._on_start)
+        self.trace_config.on_request_end.append(self._on_end)
+        self.trace_config.on_request_exception.append(self._on_exception)
+
+    async def _on_start(self, session, context, params):
+        context.start = time.perf_counter()
+
+    async def _on_end(self, session, context, params):
+        self.latencies.setdefault(endpoint_of(params.url), []).append(
+            time.perf_counter() - context.start
+        )
+
+    async def _on_exception(self, session, context, params):
+        self.failures += 1
+
+    def summary(self):
+        """p50/p99 latency in milliseconds, overall and by endpoint."""
+        every = [value for values in self.latencies.values() for value in values]
+        groups = {"all": every, **self.latencies}
+        return {
+            name: {
+                "requests": len(values),
+                "p50_ms": percentile(values, 0.5) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+            }
+            for name, values in groups.items()
+            if values
+        }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_until_ready(url, server, timeout=30):
+    """Polls the mock server's stats endpoint until it answers."""
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError("Mock GitHub server exited during startup")
+            try:
+                async with session.get(f"{url}/_stats") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientConnectionError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Mock GitHub server at {url} did not start")
+
+
+async def fetch_stats(url):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{url}/_stats") as response:
+            return await response.json()
+
+
+def crawl_outcome(work_dir):
+    """Repository statuses, files and content bytes written by the crawl."""
+    conn = sqlite3.connect(os.path.join(work_dir, settings.CRAWL_STATE_FILE))
+    statuses = dict(conn.execute("SELECT status, COUNT(*) FROM repos GROUP BY status"))
+    conn.close()
+    files = content_bytes = 0
+    raw_output_path = os.path.join(work_dir, settings.RAW_OUTPUT_FILE)
+    if os.path.exists(raw_output_path):
+        with open(raw_output_path, encoding="utf-8") as f:
+            for line in f:
+                files += 1
+                content_bytes += len(json.loads(line)["content"])
+    return statuses, files, content_bytes
+
+
+async def run_crawl(config, concurrency, mode, overrides, work_dir, timeout):
+    """
+    Runs one crawl against a fresh mock server and returns its measurements.
+    A crawl still running after timeout seconds is cancelled and marked as
+    timed out, so a hang fails the benchmark instead of stalling it.
+    """
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    previous_dir = os.getcwd()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_github", "--port", str(port)]
+        + config_to_argv(config),
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        await wait_until_ready(url, server)
+
+        settings.GITHUB_API_URL = url
+        settings.GITHUB_TOKENS = settings.GITHUB_TOKENS or ["benchmark-token"]
+        settings.MAX_REPOS_TO_PROCESS = config.repos
+        settings.MAX_CONCURRENT_REQUESTS = concurrency
+        for name, value in overrides.items():
+            setattr(settings, name, value)
+
+        # The crawler writes its raw output and crawl state to the working directory
+        os.makedirs(work_dir, exist_ok=True)
+        os.chdir(work_dir)
+        import main as crawler
+
+        # main.py logs every request; keep the benchmark output readable
+        logger.remove()
+        logger.add(sys.stderr, level="WARNING", format="{message}")
+
+        recorder = LatencyRecorder()
+        timed_out = False
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                crawler.main(
+                    crawl_mode=mode,
+                    cache_dir=None,
+                    blob_store_dir=None,
+                    trace_configs=[recorder.trace_config],
+                ),
+                timeout,
+            )
+        except TimeoutError:
+            timed_out = True
+        elapsed = time.perf_counter() - start
+        stats = await fetch_stats(url)
+    finally:
+        server.terminate()
+        server.wait()
+        os.chdir(previous_dir)
+
+    statuses, files, content_bytes = crawl_outcome(work_dir)
+    repos = sum(
+        count
+        for status, count in statuses.items()
+        if status not in ("failed", "in_progress")
+    )
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "timed_out": timed_out,
+        "seconds": elapsed,
+        "repos": repos,
+        "repo_statuses": statuses,
+        "files": files,
+        "repos_per_second": repos / elapsed,
+        "blobs_per_second": files / elapsed,
+        "content_mb_per_second": content_bytes / 1e6 / elapsed,
+        "latency": recorder.summary(),
+        "client_failures": recorder.failures,
+        "requests": stats["requests"],
+        "requests_by_endpoint": stats["by_endpoint"],
+        "wasted_calls": sum(stats["wasted"].values()),
+        "wasted_by_kind": stats["wasted"],
+    }
+
+
+def print_result(result):
+    latency = result["latency"].get("all", {})
+    print(
+        f"{result['mode']:<8} {result['concurrency']:>5} {result['seconds']:>8.2f} "
+        f"{result['repos_per_second']:>8.2f} {result['blobs_per_second']:>8.1f} "
+        f"{latency.get('p50_ms', 0):>8.1f} {latency.get('p99_ms', 0):>8.1f} "
+        f"{result['requests']:>8} {result['wasted_calls']:>7}"
+    )
+    wasted = ", ".join(
+        f"{kind} {count}" for kind, count in result["wasted_by_kind"].items() if count
+    )
+    if wasted:
+        print(f"{'':<15}wasted: {wasted}")
+    if result["timed_out"]:
+        print(f"{'':<15}TIMED OUT after {result['seconds']:.0f} s")
+
+
+def parse_override(text):
+    """Parses a NAME=VALUE settings override; values are Python literals."""
+    name, _, value = text.partition("=")
+    if not hasattr(settings, name):
+        raise argparse.ArgumentTypeError(f"Unknown setting: {name}")
+    try:
+        return name, ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return name, value
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the crawler end to end against a local mock GitHub API."
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        nargs="+",
+        default=[settings.MAX_CONCURRENT_REQUESTS],
+        help="MAX_CONCURRENT_REQUESTS values to compare, one crawl each",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["blobs", "archive"],
+        nargs="+",
+        default=["blobs", "archive"],
+        help="Crawl modes to run, one crawl per concurrency each (default: both)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=300,
+        help="Seconds before a crawl counts as hung and the benchmark fails",
+    )
+    parser.add_argument(
+        "--set",
+        dest="overrides",
+        type=parse_override,
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="Override a setting for the crawl, e.g. CORE_MAX_REQUESTS_PER_SECOND=100",
+    )
+    parser.add_argument("--json", help="Also write the full results to this file")
+    mock = parser.add_argument_group("mock server")
+    add_config_arguments(mock)
+    return parser.parse_args()
+
+
+async def run_benchmark(args):
+    config = config_from_args(args)
+    overrides = dict(args.overrides)
+    results = []
+    print(
+        f"{'mode':<8} {'conc':>5} {'seconds':>8} {'repos/s':>8} {'blobs/s':>8} "
+        f"{'p50 ms':>8} {'p99 ms':>8} {'requests':>8} {'wasted':>7}"
+    )
+    with tempfile.TemporaryDirectory() as work_root:
+        for mode in args.mode:
+            for concurrency in args.concurrency:
+                work_dir = os.path.join(work_root, f"{mode}-{concurrency}")
+                result = await run_crawl(
+                    config, concurrency, mode, overrides, work_dir, args.timeout
+                )
+                print_result(result)
+                results.append(result)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(config), "runs": results}, f, indent=2)
+    # A crawl that hung or finished no repository at all fails the benchmark
+    failed = [
+        f"{result['mode']} x{result['concurrency']}"
+        for result in results
+        if result["timed_out"] or not result["repos"]
+    ]
+    if failed:
+        print(f"\nFailed crawls: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(run_benchmark(parse_args()))
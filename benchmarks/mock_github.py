@@ -0,0 +1,394 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import sys
+import tarfile
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, fields
+from datetime import date, timedelta
+from functools import lru_cache
+
+from aiohttp import web
+
+# Repository modules, when run as a script rather than python -m benchmarks.mock_github
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers import git_blob_sha
+
+
+@dataclass
+class MockConfig:
+    """Shape of the synthetic GitHub served by the mock, and how it behaves."""
+
+    repos: int = 20
+    files_per_repo: int = 40  # Tree entries, some of them irrelevant to the crawler
+    file_size: int = 4096  # Median size of a source file, in bytes
+    latency: float = 0.05  # Median response latency, in seconds
+    jitter: float = 0.5  # Sigma of the lognormal latency distribution
+    # Core requests per token and window. The crawler paces itself to the
+    # reported quota, so this bounds its request rate (limit / window).
+    core_limit: int = 1_000_000
+    search_limit: int = 30  # Search requests per token and window
+    window: int = 3600  # Core rate-limit window, in seconds (search: 60)
+    # Concurrent requests per token that trigger a secondary limit (0: none)
+    max_in_flight: int = 0
+    error_rate: float = 0.0  # Fraction of core requests answered with a 502
+    seed: int = 0
+
+
+LICENSES = ("MIT", "Apache-2.0", "BSD-3-Clause", "GPL-3.0", "Unlicense")
+SEARCH_RESULT_CAP = 1000
+_SEARCH_WINDOW = 60
+_STARS_RE = re.compile(r"stars:(\d+)\.\.(\d+|\*)")
+_PUSHED_RE = re.compile(r"pushed:(\d{4}-\d{2}-\d{2})\.\.(\d{4}-\d{2}-\d{2})")
+
+# Source lines that synthetic files are cut from, with comments and blanks
+# in roughly the proportions of real code
+_LINES = (
+    "import os",
+    "",
+    "# Compute the running total",
+    "def handler(event, context):",
+    '    """Handle one event."""',
+    "    total = sum(item['value'] for item in event['items'])",
+    "    if total > 100:",
+    "        return {'status': 'large', 'total': total}",
+    "    return {'status': 'ok', 'total': total}",
+    "",
+    "class Model:",
+    "    def __init__(self, name):",
+    "        self.name = name  # Display name",
+    "    def fit(self, data):",
+    "        for row in data:",
+    "            self.update(row)",
+)
+
+
+class MockGitHub:
+    """
+    Synthetic GitHub API serving search, repository info, trees, blobs and
+    tarballs. Everything is derived from the seed, so every run sees the same
+    repositories and files. Rate limits are tracked per token and reported in
+    X-RateLimit-* headers like GitHub's; every request is counted so wasted
+    calls (rate-limited, failed or repeated requests) can be reported.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.requests = Counter()  # (endpoint, status) -> count
+        self.served = Counter()  # Successfully served path -> count
+        self.in_flight = Counter()  # Token -> requests being served
+        self.quota = {}  # (token, resource) -> (remaining, reset epoch)
+
+        rng = random.Random(config.seed)
+        today = date.today()
+        self.repos = [
+            {
+                "id": i,
+                "owner": {"login": f"owner{i % 50}"},
+                "name": f"repo{i}",
+                "full_name": f"owner{i % 50}/repo{i}",
+                "html_url": f"https://github.com/owner{i % 50}/repo{i}",
+                "stargazers_count": int(50 * rng.paretovariate(1.2)) + 1,
+                "pushed_at": (today - timedelta(days=rng.randrange(700))).isoformat(),
+                "default_branch": "main",
+                "license": {
+                    "key": LICENSES[i % len(LICENSES)].lower(),
+                    "spdx_id": LICENSES[i % len(LICENSES)],
+                },
+            }
+            for i in range(config.repos)
+        ]
+
+    # --- Synthetic content ---
+
+    @lru_cache(maxsize=256)
+    def repo_files(self, index):
+        """Tree entries of a repository with the content of each blob, by SHA."""
+        config = self.config
+        rng = random.Random(config.seed * 1_000_003 + index)
+        entries, contents = [], {}
+        for i in range(config.files_per_repo):
+            kind = rng.random()
+            if kind < 0.1:
+                path = f"docs/page{i}.md"
+            elif kind < 0.2:
+                path = f"tests/test_module{i}.py"
+            else:
+                path = f"src/pkg{i % 5}/module{i}.py"
+            size = max(64, int(rng.lognormvariate(0, 0.8) * config.file_size))
+            lines = [f"# repo{index}/{path}"]
+            length = len(lines[0])
+            while length < size:
+                line = _LINES[rng.randrange(len(_LINES))]
+                lines.append(line)
+                length += len(line) + 1
+            data = ("\n".join(lines) + "\n").encode("utf-8")
+            sha = git_blob_sha(data)
+            contents[sha] = (path, data)
+            entries.append(
+                {
+                    "path": path,
+                    "mode": "100644",
+                    "type": "blob",
+                    "sha": sha,
+                    "size": len(data),
+                }
+            )
+        entries.append(
+            {"path": "src", "mode": "040000", "type": "tree", "sha": "0" * 40}
+        )
+        return entries, contents
+
+    def repo_index(self, owner, name):
+        index = int(name[4:]) if name.startswith("repo") and name[4:].isdigit() else -1
+        if (
+            not 0 <= index < len(self.repos)
+            or self.repos[index]["owner"]["login"] != owner
+        ):
+            raise web.HTTPNotFound()
+        return index
+
+    # --- Rate limits and bookkeeping ---
+
+    def _limit_headers(self, token, resource):
+        """Charges a request to the token's quota and returns the rate-limit headers."""
+        limit, window = (
+            (self.config.search_limit, _SEARCH_WINDOW)
+            if resource == "search"
+            else (self.config.core_limit, self.config.window)
+        )
+        now = time.time()
+        remaining, reset = self.quota.get((token, resource), (limit, now + window))
+        if now >= reset:
+            remaining, reset = limit, now + window
+        remaining = max(remaining - 1, -1)
+        self.quota[token, resource] = (remaining, reset)
+        return {
+            "X-RateLimit-Limit": str(limit),
+            "X-RateLimit-Remaining": str(max(remaining, 0)),
+            "X-RateLimit-Reset": str(int(reset)),
+            "X-RateLimit-Resource": resource,
+        }, remaining < 0
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        endpoint = request.match_info.route.name
+        if endpoint is None:  # Control endpoints are not part of the API
+            return await handler(request)
+
+        token = request.headers.get("Authorization", "")
+        resource = "search" if endpoint == "search" else "core"
+        headers, exhausted = self._limit_headers(token, resource)
+        self.in_flight[token] += 1
+        try:
+            await asyncio.sleep(
+                self.rng.lognormvariate(0, self.config.jitter) * self.config.latency
+            )
+            if exhausted:
+                response = web.json_response(
+                    {"message": "API rate limit exceeded"}, status=403, headers=headers
+                )
+            elif (
+                self.config.max_in_flight
+                and self.in_flight[token] > self.config.max_in_flight
+            ):
+                response = web.json_response(
+                    {"message": "You have exceeded a secondary rate limit"},
+                    status=403,
+                    headers={**headers, "Retry-After": "1"},
+                )
+            elif resource == "core" and self.rng.random() < self.config.error_rate:
+                response = web.json_response({"message": "Server Error"}, status=502)
+            else:
+                try:
+                    response = await handler(request)
+                except web.HTTPException as e:
+                    response = e
+                response.headers.update(headers)
+        finally:
+            self.in_flight[token] -= 1
+
+        if response.status == 200:
+            self.served[request.path_qs] += 1
+        self.requests[endpoint, response.status] += 1
+        return response
+
+    def _json(self, request, data, headers=None):
+        """JSON response with an ETag, answering a matching If-None-Match with a 304."""
+        body = json.dumps(data).encode("utf-8")
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag, **(headers or {})})
+        return web.Response(
+            body=body,
+            content_type="application/json",
+            headers={"ETag": etag, **(headers or {})},
+        )
+
+    # --- API endpoints ---
+
+    async def search(self, request):
+        query = request.query.get("q", "")
+        per_page = min(int(request.query.get("per_page", 30)), 100)
+        page = int(request.query.get("page", 1))
+
+        repos = self.repos
+        if match := _STARS_RE.search(query):
+            low, high = int(match.group(1)), match.group(2)
+            high = float("inf") if high == "*" else int(high)
+            repos = [r for r in repos if low <= r["stargazers_count"] <= high]
+        if match := _PUSHED_RE.search(query):
+            low, high = match.groups()
+            repos = [r for r in repos if low <= r["pushed_at"] <= high]
+        repos = sorted(repos, key=lambda r: (-r["stargazers_count"], r["id"]))
+
+        start = (page - 1) * per_page
+        if start >= SEARCH_RESULT_CAP:
+            raise web.HTTPUnprocessableEntity(
+                text="Only the first 1000 search results are available"
+            )
+        end = min(start + per_page, SEARCH_RESULT_CAP, len(repos))
+        items = repos[start:end]
+        headers = {}
+        if end < min(len(repos), SEARCH_RESULT_CAP):
+            next_url = request.url.update_query(page=page + 1)
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        data = {"total_count": len(repos), "incomplete_results": False, "items": items}
+        return self._json(request, data, headers)
+
+    async def repo(self, request):
+        index = self.repo_index(request.match_info["owner"], request.match_info["repo"])
+        return self._json(request, self.repos[index])
+
+    async def tree(self, request):
+        index = self.repo_index(request.match_info["owner"], request.match_info["repo"])
+        entries, _ = self.repo_files(index)
+        return self._json(
+            request,
+            {"sha": request.match_info["ref"], "tree": entries, "truncated": False},
+        )
+
+    async def blob(self, request):
+        index = self.repo_index(request.match_info["owner"], request.match_info["repo"])
+        _, contents = self.repo_files(index)
+        sha = request.match_info["sha"]
+        if sha not in contents:
+            raise web.HTTPNotFound()
+        _, data = contents[sha]
+        return self._json(
+            request,
+            {
+                "sha": sha,
+                "size": len(data),
+                "encoding": "base64",
+                "content": base64.b64encode(data).decode("ascii"),
+            },
+        )
+
+    async def tarball(self, request):
+        owner, name = request.match_info["owner"], request.match_info["repo"]
+        _, contents = self.repo_files(self.repo_index(owner, name))
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+            for path, data in contents.values():
+                member = tarfile.TarInfo(f"{owner}-{name}-0000000/{path}")
+                member.size = len(data)
+                archive.addfile(member, io.BytesIO(data))
+        return web.Response(body=buffer.getvalue(), content_type="application/x-gzip")
+
+    # --- Control endpoints ---
+
+    async def stats(self, request):
+        """Request counts by endpoint and status, and the wasted calls among them."""
+        by_endpoint = {}
+        for (endpoint, status), count in sorted(self.requests.items()):
+            by_endpoint.setdefault(endpoint, {})[str(status)] = count
+        statuses = Counter()
+        for (_, status), count in self.requests.items():
+            statuses[status] += count
+        wasted = {
+            "rate_limited": statuses[403] + statuses[429],
+            "server_errors": sum(
+                count for status, count in statuses.items() if status >= 500
+            ),
+            "not_found": statuses[404],
+            "repeated": sum(count - 1 for count in self.served.values()),
+        }
+        return web.json_response(
+            {
+                "requests": sum(statuses.values()),
+                "by_endpoint": by_endpoint,
+                "wasted": wasted,
+                "config": asdict(self.config),
+            }
+        )
+
+    def app(self):
+        app = web.Application(middlewares=[self.middleware])
+        app.router.add_get("/search/repositories", self.search, name="search")
+        app.router.add_get("/repos/{owner}/{repo}", self.repo, name="repo")
+        app.router.add_get(
+            "/repos/{owner}/{repo}/git/trees/{ref}", self.tree, name="tree"
+        )
+        app.router.add_get(
+            "/repos/{owner}/{repo}/git/blobs/{sha}", self.blob, name="blob"
+        )
+        app.router.add_get(
+            "/repos/{owner}/{repo}/tarball/{ref}", self.tarball, name="tarball"
+        )
+        app.router.add_get("/_stats", self.stats)
+        return app
+
+
+def add_config_arguments(parser):
+    """Adds a command line option for every MockConfig field."""
+    for field in fields(MockConfig):
+        parser.add_argument(
+            f"--{field.name.replace('_', '-')}",
+            type=type(field.default),
+            default=field.default,
+        )
+
+
+def config_from_args(args):
+    return MockConfig(
+        **{field.name: getattr(args, field.name) for field in fields(MockConfig)}
+    )
+
+
+def config_to_argv(config):
+    """Command line options reproducing a MockConfig."""
+    return [
+        argument
+        for name, value in asdict(config).items()
+        for argument in (f"--{name.replace('_', '-')}", str(value))
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve a synthetic GitHub API for crawler benchmarks."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    mock = MockGitHub(config_from_args(args))
+    print(
+        f"Serving {args.repos} synthetic repositories on http://{args.host}:{args.port}",
+        flush=True,
+    )
+    web.run_app(mock.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Repository modules, when run as a script rather than python -m benchmarks.parquet_codecs
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import settings
+from parquet_output import OUTPUT_SCHEMA, conform_table, writer_options
+
+# Configurations compared against the one in settings.py. Each is a set of
+# writer_options arguments; "snappy" is the output before per-column settings.
+PRESETS = {
+    "snappy": dict(
+        compression="snappy",
+        column_compression={},
+        dictionary_columns=True,
+        column_encodings={},
+    ),
+    "lz4": dict(
+        compression="lz4",
+        column_compression={},
+        dictionary_columns=True,
+        column_encodings={},
+    ),
+    "zstd-3": dict(
+        compression="zstd",
+        compression_level=3,
+        column_compression={},
+        dictionary_columns=True,
+        column_encodings={},
+    ),
+    "zstd-9": dict(
+        compression="zstd",
+        compression_level=9,
+        column_compression={},
+        dictionary_columns=True,
+        column_encodings={},
+    ),
+    "configured": {},
+}
+
+
+def load_sample(path, rows):
+    """Reads up to `rows` records of the final Parquet file or dataset directory."""
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    return conform_table(dataset.head(rows), OUTPUT_SCHEMA)
+
+
+def benchmark(table, options, directory, name, repeat):
+    """Writes and reads the table with the writer options; returns the best timings."""
+    path = os.path.join(directory, f"{name}.parquet")
+    write_seconds = read_seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with pq.ParquetWriter(path, table.schema, **options) as writer:
+            writer.write_table(table, row_group_size=settings.PARQUET_ROW_GROUP_SIZE)
+        write_seconds = min(write_seconds, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        pq.read_table(path)
+        read_seconds = min(read_seconds, time.perf_counter() - start)
+    return os.path.getsize(path), write_seconds, read_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare Parquet codec and encoding configurations on a sample "
+        "of the final dataset."
+    )
+    parser.add_argument(
+        "path",
+        nargs="?",
+        default=settings.FINAL_DATASET_DIR or settings.FINAL_PARQUET_FILE,
+        help="Final Parquet file or dataset directory to sample",
+    )
+    parser.add_argument(
+        "--rows", type=int, default=20000, help="Number of records to sample"
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Runs per configuration; the fastest is reported",
+    )
+    parser.add_argument(
+        "--preset",
+        action="append",
+        choices=list(PRESETS),
+        help="Configuration to run (repeatable, default: all)",
+    )
+    args = parser.parse_args()
+
+    table = load_sample(args.path, args.rows)
+    raw_mb = table.nbytes / 1e6
+    print(f"Sample: {table.num_rows} records, {raw_mb:.1f} MB in memory\n")
+    print(
+        f"{'configuration':<12} {'size MB':>9} {'ratio':>7} {'write MB/s':>11} {'read MB/s':>10}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.preset or PRESETS:
+            options = writer_options(table.schema, **PRESETS[name])
+            size, write_seconds, read_seconds = benchmark(
+                table, options, directory, name, args.repeat
+            )
+            print(
+                f"{name:<12} {size / 1e6:>9.2f} {raw_mb / (size / 1e6):>7.2f} "
+                f"{raw_mb / write_seconds:>11.1f} {raw_mb / read_seconds:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from loguru import logger
+
+# Repository modules, when run as a script rather than python -m benchmarks.pipeline
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import settings
+from benchmarks.corpus import (
+    add_corpus_arguments,
+    config_from_args,
+    write_corpus,
+)
+
+STAGES = (
+    "parse",
+    "filter_and_sanitize",
+    "score_and_annotate",
+    "near_dedup",
+    "parquet_write",
+)
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak resident set size of this process (or its largest child), in MB."""
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _import_pipeline(work_dir):
+    """
+    Imports process_pipeline from the working directory, where its log file is
+    created, and quiets its per-batch logging.
+    """
+    os.chdir(work_dir)
+    import process_pipeline
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING", format="{message}")
+    return process_pipeline
+
+
+def measure_stages(input_path, work_dir, near_dedup):
+    """
+    Runs the record stages one after another over every batch of the input,
+    timing each on its own. Runs in a fresh process, so the peak RSS is this
+    measurement's alone.
+    """
+    pipeline = _import_pipeline(work_dir)
+    from near_dedup import NearDuplicateIndex, minhash_signatures
+    from parquet_output import StreamingParquetWriter
+
+    seconds = Counter()
+    records = Counter()
+    content_bytes = Counter()
+    near_duplicates = NearDuplicateIndex()
+    seen_hashes = set()
+
+    def timed(stage, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        seconds[stage] += time.perf_counter() - start
+        return result
+
+    writer = StreamingParquetWriter(os.path.join(work_dir, "stages.parquet"))
+    with open(input_path, encoding="utf-8") as infile:
+        for batch in pipeline.iter_batches(infile, settings.PIPELINE_BATCH_SIZE):
+            raw = timed(
+                "parse", lambda lines: [json.loads(line) for line in lines], batch
+            )
+            records["parse"] += len(raw)
+            content_bytes["parse"] += sum(len(line) for line in batch)
+
+            kept = []
+            for record in raw:
+                content = record.get("content") or ""
+                stats = timed("filter_and_sanitize", pipeline.analyze_lines, content)
+                record = timed(
+                    "filter_and_sanitize",
+                    pipeline.filter_and_sanitize,
+                    record,
+                    None,
+                    False,
+                    stats,
+                )
+                records["filter_and_sanitize"] += 1
+                content_bytes["filter_and_sanitize"] += len(content)
+                if record is None:
+                    continue
+                record = timed(
+                    "score_and_annotate", pipeline.score_and_annotate, record, stats
+                )
+                records["score_and_annotate"] += 1
+                content_bytes["score_and_annotate"] += len(content)
+                if record["processed_content_hash"] not in seen_hashes:
+                    seen_hashes.add(record["processed_content_hash"])
+                    kept.append(record)
+
+            if near_dedup:
+                contents = [record["content"] for record in kept]
+                signatures = timed("near_dedup", minhash_signatures, contents)
+                unique = []
+                for record, signature in zip(kept, signatures):
+                    if signature is None or not timed(
+                        "near_dedup", near_duplicates.is_near_duplicate, signature
+                    ):
+                        unique.append(record)
+                records["near_dedup"] += len(kept)
+                content_bytes["near_dedup"] += sum(map(len, contents))
+                kept = unique
+
+            for record in kept:
+                timed("parquet_write", writer.write, record)
+                records["parquet_write"] += 1
+                content_bytes["parquet_write"] += len(record["content"])
+    timed("parquet_write", writer.close)
+
+    return {
+        "stages": {
+            stage: {
+                "seconds": seconds[stage],
+                "records": records[stage],
+                "records_per_second": records[stage] / seconds[stage],
+                "mb_per_second": content_bytes[stage] / 1e6 / seconds[stage],
+            }
+            for stage in STAGES
+            if seconds[stage]
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def measure_pipeline(input_path, work_dir, engine, workers, near_dedup):
+    """Times run_pipeline end to end in a fresh process."""
+    pipeline = _import_pipeline(work_dir)
+    settings.RAW_OUTPUT_FILE = input_path
+    settings.FINAL_PARQUET_FILE = os.path.join(work_dir, f"{engine}-{workers}.parquet")
+
+    start = time.perf_counter()
+    pipeline.run_pipeline(workers=workers, near_dedup=near_dedup, engine=engine)
+    elapsed = time.perf_counter() - start
+
+    with open(input_path, "rb") as f:
+        lines = sum(1 for _ in f)
+    return {
+        "engine": engine,
+        "workers": workers,
+        "seconds": elapsed,
+        "records_per_second": lines / elapsed,
+        "mb_per_second": os.path.getsize(input_path) / 1e6 / elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_worker_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN)
+        if workers > 1
+        else None,
+    }
+
+
+def in_fresh_process(function, *args):
+    """Runs a measurement in a newly spawned process and returns its result."""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(function, *args).result()
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the throughput of each measurement relative to a baseline run.
+    Returns the names of measurements slower than the tolerance allows.
+    """
+    regressions = []
+    pairs = [
+        (f"stage {stage}", result, baseline["stages"]["stages"].get(stage))
+        for stage, result in results["stages"]["stages"].items()
+    ]
+    baseline_runs = {(run["engine"], run["workers"]): run for run in baseline["runs"]}
+    pairs += [
+        (
+            f"pipeline {run['engine']} x{run['workers']}",
+            run,
+            baseline_runs.get((run["engine"], run["workers"])),
+        )
+        for run in results["runs"]
+    ]
+
+    print("\nAgainst baseline (records/s):")
+    for name, result, previous in pairs:
+        if previous is None:
+            continue
+        ratio = result["records_per_second"] / previous["records_per_second"]
+        slower = ratio < 1 - tolerance
+        if slower:
+            regressions.append(name)
+        print(f"  {name:<32} {ratio:>6.2f}x{'  REGRESSION' if slower else ''}")
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Measure process_pipeline throughput per stage and end to end."
+    )
+    parser.add_argument(
+        "--input",
+        help="Raw JSONL to process instead of a generated corpus",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["python", "arrow"],
+        action="append",
+        help="Engine of the end-to-end runs (repeatable, default: both)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[1],
+        help="Worker counts of the end-to-end runs",
+    )
+    parser.add_argument(
+        "--near-dedup",
+        action=argparse.BooleanOptionalAction,
+        default=settings.NEAR_DEDUPLICATION,
+        help="Include near deduplication in the stages and runs",
+    )
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument(
+        "--baseline", help="Results of an earlier --json run to compare against"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Slowdown against the baseline reported as a regression (0.1 = 10%%)",
+    )
+    corpus = parser.add_argument_group("generated corpus")
+    add_corpus_arguments(corpus)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_path = args.input and os.path.abspath(args.input)
+        if input_path is None:
+            input_path = os.path.join(work_dir, "corpus.jsonl")
+            records, content_bytes = write_corpus(input_path, config_from_args(args))
+            print(
+                f"Generated {records} records ({content_bytes / 1e6:.1f} MB of content)"
+            )
+
+        stages = in_fresh_process(measure_stages, input_path, work_dir, args.near_dedup)
+        print(f"\n{'stage':<22} {'seconds':>8} {'records/s':>10} {'MB/s':>8}")
+        for stage, result in stages["stages"].items():
+            print(
+                f"{stage:<22} {result['seconds']:>8.2f} "
+                f"{result['records_per_second']:>10.0f} {result['mb_per_second']:>8.1f}"
+            )
+        print(f"Peak RSS: {stages['peak_rss_mb']:.0f} MB")
+
+        runs = []
+        print(
+            f"\n{'engine':<8} {'workers':>7} {'seconds':>8} {'records/s':>10} "
+            f"{'MB/s':>8} {'peak RSS MB':>12}"
+        )
+        for engine in args.engine or ["python", "arrow"]:
+            for workers in args.workers:
+                run = in_fresh_process(
+                    measure_pipeline,
+                    input_path,
+                    work_dir,
+                    engine,
+                    workers,
+                    args.near_dedup,
+                )
+                workers_rss = (
+                    f" (largest worker {run['peak_worker_rss_mb']:.0f})"
+                    if run["peak_worker_rss_mb"]
+                    else ""
+                )
+                print(
+                    f"{engine:<8} {workers:>7} {run['seconds']:>8.2f} "
+                    f"{run['records_per_second']:>10.0f} {run['mb_per_second']:>8.1f} "
+                    f"{run['peak_rss_mb']:>12.0f}{workers_rss}"
+                )
+                runs.append(run)
+
+    results = {"stages": stages, "runs": runs}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import os
+import zlib
+
+from loguru import logger
+
+
+class BlobStore:
+    """
+    Local content-addressed store of decoded file contents keyed by git blob SHA.
+    Blobs are zlib-compressed and sharded into directories by SHA prefix
+    (<root>/ab/cd/abcd...). Since a git SHA identifies the content, an entry
+    never goes stale and forks or vendored copies of a file share one entry.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, sha):
+        return os.path.join(self.root, sha[:2], sha[2:4], sha)
+
+    def __contains__(self, sha):
+        return os.path.exists(self._path(sha))
+
+    def get(self, sha):
+        """Returns the stored content for a blob SHA, or None if it is not stored."""
+        try:
+            with open(self._path(sha), "rb") as f:
+                return zlib.decompress(f.read()).decode("utf-8")
+        except FileNotFoundError:
+            return None
+        except (OSError, zlib.error, UnicodeDecodeError) as e:
+            logger.warning(f"Ignoring unreadable blob store entry {sha[:7]}: {e}")
+            return None
+
+    def put(self, sha, content):
+        """Stores the content of a blob SHA if it is not stored yet."""
+        path = self._path(sha)
+        if os.path.exists(path):
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(zlib.compress(content.encode("utf-8")))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to store blob {sha[:7]}: {e}")
+
+    def get_many(self, shas):
+        """Returns {sha: content} for the given blob SHAs that are stored."""
+        stored = {}
+        for sha in shas:
+            content = self.get(sha)
+            if content is not None:
+                stored[sha] = content
+        return stored
+
+    def put_many(self, blobs):
+        """Stores (sha, content) pairs not stored yet."""
+        for sha, content in blobs:
+            self.put(sha, content)
@@ -0,0 +1,71 @@
+import base64
+import hashlib
+import math
+
+import numpy as np
+
+import settings
+
+_MASK_64 = (1 << 64) - 1
+
+
+def _value_hashes(value):
+    """Two independent 64-bit hashes of a string value, for double hashing."""
+    digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+
+
+class BloomFilter:
+    """
+    Bloom filter over string values, for skipping Parquet row groups that
+    cannot contain a value. Probe i of a value is bit (h1 + i * h2) mod
+    num_bits of its two 64-bit BLAKE2b hashes, so filters built with NumPy
+    and probed from plain Python agree. Never gives false negatives.
+    """
+
+    def __init__(self, num_bits, num_hashes, bits=None):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytes((num_bits + 7) // 8)
+
+    @classmethod
+    def build(cls, values, false_positive_rate=None):
+        """Builds a filter sized for the distinct non-null values."""
+        false_positive_rate = false_positive_rate or settings.BLOOM_FILTER_FPP
+        values = {value for value in values if value is not None}
+        count = max(len(values), 1)
+        num_bits = max(
+            64, math.ceil(-count * math.log(false_positive_rate) / math.log(2) ** 2)
+        )
+        num_bits = (num_bits + 7) // 8 * 8
+        num_hashes = max(1, round(num_bits / count * math.log(2)))
+
+        if not values:
+            return cls(num_bits, num_hashes)
+        hashes = np.array([_value_hashes(value) for value in values], dtype=np.uint64)
+        # uint64 arithmetic wraps around, like the masking in __contains__
+        probes = hashes[:, :1] + np.arange(num_hashes, dtype=np.uint64) * hashes[:, 1:]
+        bitmap = np.zeros(num_bits, dtype=bool)
+        bitmap[(probes % np.uint64(num_bits)).ravel()] = True
+        return cls(
+            num_bits, num_hashes, np.packbits(bitmap, bitorder="little").tobytes()
+        )
+
+    def __contains__(self, value):
+        h1, h2 = _value_hashes(value)
+        for i in range(self.num_hashes):
+            bit = ((h1 + i * h2) & _MASK_64) % self.num_bits
+            if not self.bits[bit >> 3] & (1 << (bit & 7)):
+                return False
+        return True
+
+    def to_dict(self):
+        return {
+            "num_bits": self.num_bits,
+            "num_hashes": self.num_hashes,
+            "bits": base64.b64encode(self.bits).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["num_bits"], data["num_hashes"], base64.b64decode(data["bits"]))
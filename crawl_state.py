@@ -0,0 +1,124 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from loguru import logger
+
+# Repository statuses recorded in the ledger
+REPO_IN_PROGRESS = "in_progress"
+REPO_DONE = "done"  # Every relevant file was written
+REPO_INCOMPLETE = "incomplete"  # Some files could not be fetched
+REPO_SKIPPED = "skipped"  # Filtered out (e.g. license), nothing to fetch
+REPO_FAILED = "failed"  # Repository info, tree or archive unavailable
+
+# Statuses that need no more work on resume
+FINISHED_STATUSES = (REPO_DONE, REPO_SKIPPED)
+
+
+class CrawlState:
+    """
+    SQLite ledger of crawl progress, used to resume an interrupted crawl.
+    Records the status of every repository and each file already written to
+    the raw output, so a resumed crawl only spends API budget on what is left.
+    The connection may be used from worker threads, one at a time, so the
+    event loop can hand queries and commits off to asyncio.to_thread.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._batched = False
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL keeps the per-file commits cheap
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS repos (
+                full_name TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                files_written INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS blobs (
+                full_name TEXT NOT NULL,
+                path TEXT NOT NULL,
+                sha TEXT NOT NULL,
+                PRIMARY KEY (full_name, path)
+            );
+            """
+        )
+        self._conn.commit()
+
+    def reset(self):
+        """Forgets all recorded progress, for a fresh crawl."""
+        with self._lock:
+            self._conn.execute("DELETE FROM repos")
+            self._conn.execute("DELETE FROM blobs")
+            self._conn.commit()
+        logger.debug(f"Reset crawl state in '{self.path}'")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @contextmanager
+    def batch(self):
+        """Groups the updates made in the with block into a single commit."""
+        with self._lock:
+            self._batched = True
+            try:
+                yield self
+            finally:
+                self._batched = False
+                self._conn.commit()
+
+    def _commit(self):
+        if not self._batched:
+            self._conn.commit()
+
+    def finished_repos(self):
+        """Returns the names of repositories that need no more work."""
+        placeholders = ", ".join("?" for _ in FINISHED_STATUSES)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT full_name FROM repos WHERE status IN ({placeholders})",
+                FINISHED_STATUSES,
+            ).fetchall()
+        return {full_name for (full_name,) in rows}
+
+    def completed_files(self, full_name):
+        """Returns the paths of a repository's files already written to the raw output."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM blobs WHERE full_name = ?", (full_name,)
+            ).fetchall()
+        return {path for (path,) in rows}
+
+    def mark_repo(self, full_name, status):
+        """Records the status of a repository along with its count of written files."""
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO repos (full_name, status, files_written, updated_at)
+                VALUES (?, ?, (SELECT COUNT(*) FROM blobs WHERE full_name = ?), ?)
+                ON CONFLICT (full_name) DO UPDATE SET
+                    status = excluded.status,
+                    files_written = excluded.files_written,
+                    updated_at = excluded.updated_at
+                """,
+                (full_name, status, full_name, time.time()),
+            )
+            self._commit()
+
+    def mark_files_done(self, files):
+        """Records (full_name, path, sha) tuples of files written to the raw output."""
+        if not files:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO blobs (full_name, path, sha) VALUES (?, ?, ?)",
+                files,
+            )
+            self._commit()
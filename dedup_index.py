@@ -0,0 +1,203 @@
+import mmap
+import os
+import struct
+
+from loguru import logger
+
+import settings
+
+_MAGIC = b"TDPDEDUP"
+# Magic, slot capacity, entry count; padded to one slot
+_HEADER = struct.Struct("<8sQQ8x")
+_SLOT_SIZE = 32  # Raw SHA256 digest
+_EMPTY_SLOT = bytes(_SLOT_SIZE)
+_MAX_LOAD_FACTOR = 0.7
+
+
+def _to_digest(content_hash):
+    """Accepts a raw 32-byte digest or its hex form."""
+    return (
+        bytes.fromhex(content_hash) if isinstance(content_hash, str) else content_hash
+    )
+
+
+class DedupIndex:
+    """
+    Persistent set of SHA256 content digests, shared across pipeline runs.
+    The index is a memory-mapped, open-addressing hash table of raw 32-byte
+    digests with linear probing. Digests are uniformly distributed, so their
+    leading bytes serve directly as the hash and lookups are O(1) without
+    loading the table into memory. The table doubles once it is 70% full.
+    Supports the same `in` / `add` interface as the in-memory set it replaces.
+
+    Digests added since the last commit() are also appended to a journal
+    (<path>.journal). A run that fails before committing is rolled back, on
+    rollback() or the next open, so content that was never shipped does not
+    count as a duplicate later.
+    """
+
+    def __init__(self, path, initial_capacity=None):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        if not os.path.exists(path):
+            capacity = initial_capacity or settings.DEDUP_INDEX_INITIAL_CAPACITY
+            self._create(path, 1 << max(capacity - 1, 1).bit_length())
+        self._map = None
+        self._journal = None
+        self._open()
+        if os.path.exists(self.journal_path):
+            logger.warning(
+                f"Rolling back uncommitted dedup index entries from '{self.journal_path}'"
+            )
+            self.rollback()
+        logger.debug(
+            f"Opened dedup index '{path}': {self.count} digests, capacity {self.capacity}"
+        )
+
+    @staticmethod
+    def _create(path, capacity):
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, capacity, 0))
+            f.truncate(_HEADER.size + capacity * _SLOT_SIZE)
+
+    def _open(self):
+        self._file = open(self.path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, self.capacity, self.count = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"Not a dedup index file: {self.path}")
+        self._mask = self.capacity - 1
+
+    def __len__(self):
+        return self.count
+
+    def _slot(self, index):
+        offset = _HEADER.size + index * _SLOT_SIZE
+        return self._map[offset : offset + _SLOT_SIZE]
+
+    def _set_slot(self, index, digest):
+        offset = _HEADER.size + index * _SLOT_SIZE
+        self._map[offset : offset + _SLOT_SIZE] = digest
+
+    def _set_count(self, count):
+        self.count = count
+        _HEADER.pack_into(self._map, 0, _MAGIC, self.capacity, count)
+
+    def _find(self, digest):
+        """Returns (slot index, found) of the slot holding the digest or where it belongs."""
+        index = int.from_bytes(digest[:8], "little") & self._mask
+        while True:
+            slot = self._slot(index)
+            if slot == digest:
+                return index, True
+            if slot == _EMPTY_SLOT:
+                return index, False
+            index = (index + 1) & self._mask
+
+    def __contains__(self, content_hash):
+        return self._find(_to_digest(content_hash))[1]
+
+    def add(self, content_hash):
+        """Adds a digest. Returns False if it was already present."""
+        digest = _to_digest(content_hash)
+        index, found = self._find(digest)
+        if found:
+            return False
+        if self.count + 1 > self.capacity * _MAX_LOAD_FACTOR:
+            self._grow()
+            index, _ = self._find(digest)
+
+        # Journal first: an entry in the table is always rolled back if uncommitted
+        if self._journal is None:
+            self._journal = open(self.journal_path, "ab", buffering=0)
+        self._journal.write(digest)
+        self._set_slot(index, digest)
+        self._set_count(self.count + 1)
+        return True
+
+    def _remove(self, digest):
+        """Removes a digest, shifting back later entries of its probe run."""
+        hole, found = self._find(digest)
+        if not found:
+            return
+        index = hole
+        while True:
+            index = (index + 1) & self._mask
+            slot = self._slot(index)
+            if slot == _EMPTY_SLOT:
+                break
+            home = int.from_bytes(slot[:8], "little") & self._mask
+            # Entries whose home lies cyclically after the hole must stay put
+            if (index - home) & self._mask >= (index - hole) & self._mask:
+                self._set_slot(hole, slot)
+                hole = index
+        self._set_slot(hole, _EMPTY_SLOT)
+        self._set_count(self.count - 1)
+
+    def _grow(self):
+        """Rehashes every digest into a table twice the size."""
+        new_capacity = self.capacity * 2
+        logger.info(
+            f"Growing dedup index '{self.path}' to {new_capacity} slots ({self.count} digests)..."
+        )
+        tmp_path = f"{self.path}.tmp"
+        self._create(tmp_path, new_capacity)
+        with open(tmp_path, "r+b") as f, mmap.mmap(f.fileno(), 0) as new_map:
+            new_mask = new_capacity - 1
+            for index in range(self.capacity):
+                digest = self._slot(index)
+                if digest == _EMPTY_SLOT:
+                    continue
+                new_index = int.from_bytes(digest[:8], "little") & new_mask
+                while True:
+                    offset = _HEADER.size + new_index * _SLOT_SIZE
+                    if new_map[offset : offset + _SLOT_SIZE] == _EMPTY_SLOT:
+                        new_map[offset : offset + _SLOT_SIZE] = digest
+                        break
+                    new_index = (new_index + 1) & new_mask
+            _HEADER.pack_into(new_map, 0, _MAGIC, new_capacity, self.count)
+            new_map.flush()
+
+        self._close_map()
+        os.replace(tmp_path, self.path)
+        self._open()
+
+    def commit(self):
+        """Makes the digests added so far permanent."""
+        self._map.flush()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def rollback(self):
+        """Removes every digest added since the last commit."""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if not os.path.exists(self.journal_path):
+            return
+        removed = 0
+        with open(self.journal_path, "rb") as f:
+            while digest := f.read(_SLOT_SIZE):
+                if len(digest) == _SLOT_SIZE:
+                    self._remove(digest)
+                    removed += 1
+        self._map.flush()
+        os.remove(self.journal_path)
+        logger.info(f"Rolled back {removed} uncommitted dedup index entries")
+
+    def _close_map(self):
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+        self._map = None
+
+    def close(self):
+        """Closes the index. Uncommitted digests are rolled back on the next open."""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if self._map is not None:
+            self._close_map()
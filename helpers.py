@@ -1,137 +1,417 @@
 import asyncio
 import base64
+import hashlib
+import io
 import json
+import queue
 import re
-import time
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
 
 import aiohttp
 from loguru import logger
+from multidict import CIMultiDict
 
+import metrics
 import settings
+from profiling import profiler
+from rate_limit import TokenPool, is_rate_limited, rate_limit_wait
+from retry import (
+    CONNECTION,
+    RATE_LIMITED,
+    RETRYABLE_STATUSES,
+    SERVER_ERROR,
+    TIMEOUT,
+    RetryPolicy,
+    parse_retry_after,
+)
+from secret_scanner import redact_content, scan_content
 
 # --- Async API Request Handling ---
 
-
-async def make_api_request(session, url, headers, semaphore):
-    """Makes an asynchronous API request with rate limit handling and concurrency control."""
-    async with semaphore:  # Acquire semaphore before making request
-        # Add a small delay to be polite to the API
-        await asyncio.sleep(settings.REQUEST_DELAY)
-
-        try:
-            logger.trace(f"Requesting URL: {url}")
-            async with session.get(url, headers=headers) as response:
-                remaining = response.headers.get("X-RateLimit-Remaining")
-                reset_time = response.headers.get("X-RateLimit-Reset")
-
-                if remaining is not None:
-                    logger.trace(f"Rate Limit Remaining: {remaining}")
-                    if int(remaining) == 0:
-                        reset_timestamp = int(reset_time)
-                        sleep_time = (
-                            max(0, reset_timestamp - time.time())
-                            + settings.RATE_LIMIT_SLEEP_BUFFER
+# Optional on-disk response cache (see http_cache.ResponseCache)
+_response_cache = None
+# Tokens and their rate limits, shared by every request path (see rate_limit.TokenPool)
+_token_pool = TokenPool(settings.GITHUB_TOKENS)
+# Retries of failed requests (see retry.RetryPolicy)
+_retry_policy = RetryPolicy()
+
+
+def set_token_pool(pool):
+    """Sets the pool of GitHub tokens that requests are routed through."""
+    global _token_pool
+    _token_pool = pool
+
+
+def set_retry_policy(policy):
+    """Sets the policy that failed requests are retried under."""
+    global _retry_policy
+    _retry_policy = policy
+
+
+def set_response_cache(cache):
+    """Enables conditional requests backed by a ResponseCache, or disables them with None."""
+    global _response_cache
+    _response_cache = cache
+
+
+@profiler.timed("make_api_request")
+async def make_api_request(
+    session,
+    url,
+    headers,
+    semaphore,
+    params=None,
+    resource="core",
+    return_headers=False,
+):
+    """
+    Makes an asynchronous API request with rate limit handling and concurrency control.
+    Returns the decoded JSON body, or a (body, response headers) tuple when
+    return_headers is set. Returns None on failure.
+    Each request is routed to the pooled token with the most remaining budget
+    for its rate-limit resource ('core' or 'search') and paced by that token's
+    bucket; rate-limited requests are retried once a limit allows.
+    Server errors, connection errors and timeouts are retried with jittered
+    exponential backoff (or after the server's Retry-After), within the
+    per-error-class budgets of the retry policy. Backoff happens after the
+    concurrency slot is released.
+    When a response cache is set, requests for cached URLs are made conditional
+    and a 304 Not Modified (which does not count against the rate limit) is
+    answered from the cache.
+    """
+    cache_key = cached_entry = None
+    conditional_headers = {}
+    if _response_cache is not None:
+        cache_key = _response_cache.key_for(url, params)
+        cached_entry = await asyncio.to_thread(_response_cache.get, cache_key)
+        if cached_entry is not None:
+            conditional_headers = _response_cache.conditional_headers(cached_entry)
+
+    retries = _retry_policy.start()
+    while True:
+        # Wait for the rate limit *before* taking a concurrency slot
+        with (
+            profiler.stage("rate_limit_wait"),
+            metrics.requests_waiting.labels("rate_limit").track_inprogress(),
+        ):
+            token = await _token_pool.acquire(resource)
+        bucket = token.limiter.bucket(resource)
+        request_headers = {**headers, **token.auth_headers(), **conditional_headers}
+
+        error_class = retry_after = None
+        # Acquire semaphore before making request
+        async with metrics.request_slot(semaphore):
+            try:
+                logger.trace(f"Requesting URL: {url}")
+                async with session.get(
+                    url, headers=request_headers, params=params
+                ) as response:
+                    token.limiter.update(resource, response.headers)
+
+                    if response.status == 304 and cached_entry is not None:
+                        logger.trace(f"Not modified, serving from cache: {url}")
+                        profiler.count("not_modified")
+                        await asyncio.to_thread(_response_cache.touch, cache_key)
+                        data = cached_entry["body"]
+                        if not return_headers:
+                            return data
+                        # Replay stored headers (e.g. 'Link') that a 304 may omit
+                        response_headers = CIMultiDict(response.headers)
+                        response_headers.update(cached_entry["headers"])
+                        return data, response_headers
+
+                    if is_rate_limited(response.status, response.headers):
+                        wait_time = rate_limit_wait(response.headers)
+                        logger.warning(
+                            f"Rate limited ({response.status}) on {url}. "
+                            f"Pausing {resource} requests on {token.label} for {wait_time:.2f} seconds "
+                            f"(attempt {retries.attempts})."
                         )
+                        bucket.block_for(wait_time)
+                        profiler.count("rate_limited")
+                        error_class = RATE_LIMITED
+                    elif response.status in RETRYABLE_STATUSES:
                         logger.warning(
-                            f"Rate limit 0 reached. Sleeping for {sleep_time:.2f} seconds."
+                            f"Server error {response.status} for URL: {url} "
+                            f"(attempt {retries.attempts})."
                         )
-                        await asyncio.sleep(sleep_time)
-                        # Retry the request after sleeping
-                        logger.info(
-                            f"Retrying request to {url} after rate limit sleep."
+                        retry_after = parse_retry_after(
+                            response.headers.get("Retry-After")
                         )
-                        # Need to release and re-acquire semaphore for the retry
-                        # NOTE: This simple retry might fail if the rate limit persists.
-                        # A more robust solution would involve a loop or backoff strategy.
-                        return await make_api_request(session, url, headers, semaphore)
-
-                response.raise_for_status()  # Raise AiohttpHttpProcessingError for bad status codes
-                # Check if response is JSON before trying to decode
-                if "application/json" in response.headers.get("Content-Type", ""):
-                    return await response.json()
-                else:
-                    logger.warning(
-                        f"Non-JSON response received from {url}. Content-Type: {response.headers.get('Content-Type')}"
+                        error_class = SERVER_ERROR
+                    else:
+                        response.raise_for_status()  # Raise AiohttpHttpProcessingError for bad status codes
+                        # Check if response is JSON before trying to decode
+                        if "application/json" in response.headers.get(
+                            "Content-Type", ""
+                        ):
+                            data = await response.json()
+                            if _response_cache is not None:
+                                await asyncio.to_thread(
+                                    _response_cache.put,
+                                    cache_key,
+                                    url,
+                                    response.headers,
+                                    data,
+                                )
+                            return (data, response.headers) if return_headers else data
+                        else:
+                            logger.warning(
+                                f"Non-JSON response received from {url}. Content-Type: {response.headers.get('Content-Type')}"
+                            )
+                            return None
+
+            except aiohttp.ClientResponseError as e:
+                logger.error(f"HTTP Error: {e.status} for URL: {url}")
+                logger.error(f"Message: {e.message}")
+                # Specific handling for 404 Not Found might be useful
+                if e.status == 404:
+                    logger.warning(f"Resource not found (404): {url}")
+                # Specific handling for 403 Forbidden (rate limits are handled above)
+                elif e.status == 403:
+                    logger.error(
+                        f"Forbidden (403). Check token/permissions. URL: {url}"
                     )
-                    return None
-
-        except aiohttp.ClientResponseError as e:
-            logger.error(f"HTTP Error: {e.status} for URL: {url}")
-            logger.error(f"Message: {e.message}")
-            # Specific handling for 404 Not Found might be useful
-            if e.status == 404:
-                logger.warning(f"Resource not found (404): {url}")
-            # Specific handling for 403 Forbidden (often rate limits or auth issues)
-            elif e.status == 403:
-                logger.error(
-                    f"Forbidden (403). Check token/permissions or potential secondary rate limit. URL: {url}"
+                return None
+            except aiohttp.ClientConnectionError as e:
+                logger.warning(
+                    f"Connection Error: {e} for URL: {url} (attempt {retries.attempts})."
                 )
-                # Check headers for rate limit info even on 403
-                remaining = e.headers.get("X-RateLimit-Remaining")
-                reset_time = e.headers.get("X-RateLimit-Reset")
-                if remaining == "0":
-                    reset_timestamp = int(reset_time)
-                    sleep_time = (
-                        max(0, reset_timestamp - time.time())
-                        + settings.RATE_LIMIT_SLEEP_BUFFER
-                    )
-                    logger.warning(
-                        f"Secondary rate limit likely hit. Sleeping for {sleep_time:.2f} seconds based on 403 header."
-                    )
-                    await asyncio.sleep(sleep_time)
-            # NOTE: We might want to implement retries for transient server errors (5xx) here
-            return None
-        except aiohttp.ClientConnectionError as e:
-            logger.error(f"Connection Error: {e} for URL: {url}")
-            return None
-        except asyncio.TimeoutError:
-            logger.error(f"Request timed out for URL: {url}")
+                error_class = CONNECTION
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"Request timed out for URL: {url} (attempt {retries.attempts})."
+                )
+                error_class = TIMEOUT
+            except Exception as e:
+                logger.error(f"Unexpected error during API request to {url}: {e}")
+                return None
+
+        # Out of the semaphore, so backing off does not hold a concurrency slot
+        attempts = retries.attempts
+        if not retries.allow(error_class):
+            logger.error(
+                f"Giving up on {url} after {attempts} attempts ({error_class})."
+            )
             return None
-        except Exception as e:
-            logger.error(f"Unexpected error during API request to {url}: {e}")
+        metrics.retries_total.labels(error_class).inc()
+        # Rate-limited requests wait for their paused token bucket instead
+        if error_class != RATE_LIMITED:
+            await asyncio.sleep(retries.delay(retry_after))
+
+
+@dataclass(frozen=True)
+class SearchShard:
+    """A slice of the repository search space, bounded by push date and star count."""
+
+    pushed_from: date
+    pushed_to: date
+    stars_min: int
+    stars_max: int | None = None  # None means no upper bound
+
+    def query(self):
+        """Builds the search query string for this shard."""
+        stars_max = "*" if self.stars_max is None else self.stars_max
+        return build_search_query(
+            f"pushed:{self.pushed_from.isoformat()}..{self.pushed_to.isoformat()}",
+            f"stars:{self.stars_min}..{stars_max}",
+        )
+
+    def split(self):
+        """
+        Splits the shard in two, by push date first and by stars once a single day remains.
+        Returns None when the shard cannot be split any further.
+        """
+        if self.pushed_from < self.pushed_to:
+            middle = self.pushed_from + (self.pushed_to - self.pushed_from) // 2
+            return (
+                SearchShard(self.pushed_from, middle, self.stars_min, self.stars_max),
+                SearchShard(
+                    middle + timedelta(days=1),
+                    self.pushed_to,
+                    self.stars_min,
+                    self.stars_max,
+                ),
+            )
+
+        if self.stars_max is None:
+            middle = max(self.stars_min * 2, self.stars_min + 1)
+        elif self.stars_min < self.stars_max:
+            middle = (self.stars_min + self.stars_max + 1) // 2
+        else:
             return None
+        return (
+            SearchShard(self.pushed_from, self.pushed_to, self.stars_min, middle - 1),
+            SearchShard(self.pushed_from, self.pushed_to, middle, self.stars_max),
+        )
 
 
-async def search_repositories(session, query, headers, semaphore, per_page=100):
-    """Searches repositories asynchronously."""
-    # NOTE: GitHub search API has stricter rate limits (e.g., 30 reqs/min)
-    logger.info(f"Searching repos with query: {query}")
+def build_search_query(pushed_qualifier, stars_qualifier):
+    """Builds a repository search query from the configured search criteria."""
+    license_query_part = ""
+    if settings.REQUIRED_LICENSES:
+        license_query_part = " ".join(
+            [f"license:{lic}" for lic in settings.REQUIRED_LICENSES]
+        )
+
+    # Focus search on the target language
+    return (
+        f"language:{settings.TARGET_LANGUAGE} {stars_qualifier} {pushed_qualifier} {license_query_part}".strip()
+        + " is:public"
+    )
+
+
+def get_root_search_shard():
+    """Returns the shard covering the whole configured search space."""
+    # Configured bounds are exclusive ('stars:>N', 'pushed:>DATE')
+    pushed_from = datetime.strptime(settings.MIN_PUSH_DATE, "%Y-%m-%d").date()
+    return SearchShard(
+        pushed_from=pushed_from + timedelta(days=1),
+        pushed_to=date.today(),
+        stars_min=settings.MIN_STARS + 1,
+    )
+
+
+def parse_next_link(link_header):
+    """Extracts the rel="next" URL from a GitHub 'Link' pagination header."""
+    if not link_header:
+        return None
+    match = re.search(r'<([^>]+)>;\s*rel="next"', link_header)
+    return match.group(1) if match else None
+
+
+async def make_search_request(session, url, headers, semaphore, params=None):
+    """Makes a search API request, paced by the stricter search rate limit."""
+    return await make_api_request(
+        session,
+        url,
+        headers,
+        semaphore,
+        params=params,
+        resource="search",
+        return_headers=True,
+    )
+
+
+async def count_search_results(session, query, headers, semaphore):
+    """Gets the total number of repositories matching a query, or None on failure."""
     search_url = f"{settings.GITHUB_API_URL}/search/repositories"
-    # Fetch more per page with async
+    result = await make_search_request(
+        session, search_url, headers, semaphore, params={"q": query, "per_page": 1}
+    )
+    if not result:
+        return None
+    data, _ = result
+    return data.get("total_count", 0)
+
+
+async def iter_search_pages(session, query, headers, semaphore, per_page=100):
+    """Asynchronously yields pages of repositories for a query, following 'Link' headers."""
+    logger.info(f"Searching repos with query: {query}")
+    url = f"{settings.GITHUB_API_URL}/search/repositories"
     params = {"q": query, "per_page": per_page, "sort": "stars", "order": "desc"}
 
-    # Use a separate semaphore or adjust delays if search rate limit is hit often
-    async with semaphore:
-        await asyncio.sleep(settings.REQUEST_DELAY)  # Polite delay
-        try:
-            async with session.get(
-                search_url, headers=headers, params=params
-            ) as response:
-                remaining = response.headers.get("X-RateLimit-Remaining")
-                if remaining is not None:
-                    logger.trace(f"Search Rate Limit Remaining: {remaining}")
-                    # Add specific sleep logic if search limit (0) is hit
-
-                response.raise_for_status()
-                if "application/json" in response.headers.get("Content-Type", ""):
-                    data = await response.json()
-                    return data.get("items", [])
-                else:
-                    logger.error(f"Non-JSON response from search API: {search_url}")
-                    return []
-        except aiohttp.ClientResponseError as e:
-            logger.error(f"Search request failed: {e.status} - {e.message}")
-            return []
-        except Exception as e:
-            logger.error(f"Unexpected error during search: {e}")
-            return []
+    while url:
+        result = await make_search_request(session, url, headers, semaphore, params)
+        if not result:
+            logger.error(f"Search request failed for query: {query}")
+            return
+        data, response_headers = result
+        items = data.get("items", [])
+        if items:
+            yield items
+        if data.get("incomplete_results"):
+            logger.warning(f"Search results may be incomplete for query: {query}")
+
+        # The next link already carries the query parameters
+        url = parse_next_link(response_headers.get("Link"))
+        params = None
+
+
+async def search_repositories(
+    session, query, headers, semaphore, per_page=100, max_results=None
+):
+    """Searches repositories asynchronously, following pagination up to max_results."""
+    repositories = []
+    async for items in iter_search_pages(session, query, headers, semaphore, per_page):
+        repositories.extend(items)
+        if max_results is not None and len(repositories) >= max_results:
+            return repositories[:max_results]
+    return repositories
+
+
+async def plan_search_shards(session, shard, headers, semaphore):
+    """
+    Recursively splits a shard until each sub-query matches no more results than
+    the search API will return. Sibling shards are counted concurrently.
+    """
+    query = shard.query()
+    total_count = await count_search_results(session, query, headers, semaphore)
+    if not total_count:
+        return []
+    if total_count <= settings.SEARCH_RESULT_CAP:
+        return [shard]
+
+    halves = shard.split()
+    if halves is None:
+        logger.warning(
+            f"Cannot split query further; only {settings.SEARCH_RESULT_CAP} of {total_count} results reachable: {query}"
+        )
+        return [shard]
 
+    logger.debug(f"Splitting query with {total_count} results: {query}")
+    planned = await asyncio.gather(
+        *(plan_search_shards(session, half, headers, semaphore) for half in halves)
+    )
+    return [sub_shard for shards in planned for sub_shard in shards]
+
+
+async def search_all_repositories(session, headers, semaphore, max_results=None):
+    """
+    Enumerates repositories matching the configured criteria beyond the 1000-result
+    search cap by sharding the search space and paging through every shard concurrently.
+    """
+    root_shard = get_root_search_shard()
+    if max_results is not None and max_results <= settings.SEARCH_RESULT_CAP:
+        # A single paginated query already reaches far enough
+        return await search_repositories(
+            session,
+            root_shard.query(),
+            headers,
+            semaphore,
+            per_page=settings.SEARCH_PER_PAGE,
+            max_results=max_results,
+        )
 
-async def get_repo_tree(session, owner, repo, headers, semaphore):
-    """Gets the recursive file tree asynchronously."""
-    logger.info(f"Getting tree for {owner}/{repo}")
+    shards = await plan_search_shards(session, root_shard, headers, semaphore)
+    logger.info(f"Searching {len(shards)} query shard(s) concurrently.")
+    results = await asyncio.gather(
+        *(
+            search_repositories(
+                session,
+                shard.query(),
+                headers,
+                semaphore,
+                per_page=settings.SEARCH_PER_PAGE,
+            )
+            for shard in shards
+        )
+    )
 
-    # Get repo info to find default branch and license
+    # Shards do not overlap, but a repository pushed mid-crawl can move between them
+    repositories = {}
+    for items in results:
+        for item in items:
+            repositories.setdefault(item["id"], item)
+    repositories = list(repositories.values())
+    return repositories if max_results is None else repositories[:max_results]
+
+
+async def get_repo_info(session, owner, repo, headers, semaphore):
+    """Gets the default branch and license of a repository asynchronously."""
     repo_info_url = f"{settings.GITHUB_API_URL}/repos/{owner}/{repo}"
     repo_info = await make_api_request(session, repo_info_url, headers, semaphore)
     if not repo_info:
@@ -146,6 +426,33 @@ async def get_repo_tree(session, owner, repo, headers, semaphore):
 
     if not default_branch:
         logger.error(f"Could not determine default branch for {owner}/{repo}")
+
+    return default_branch, repo_license
+
+
+def is_license_allowed(owner, repo, repo_license):
+    """Checks a repository license against the required licenses."""
+    if (
+        settings.REQUIRED_LICENSES
+        and repo_license.lower() not in settings.REQUIRED_LICENSES
+        and repo_license.upper() != "NOASSERTION"
+    ):
+        logger.info(
+            f"Skipping repo {owner}/{repo}: License '{repo_license}' not in required list {settings.REQUIRED_LICENSES}."
+        )
+        return False
+    return True
+
+
+async def get_repo_tree(session, owner, repo, headers, semaphore):
+    """Gets the recursive file tree asynchronously."""
+    logger.info(f"Getting tree for {owner}/{repo}")
+
+    # Get repo info to find default branch and license
+    default_branch, repo_license = await get_repo_info(
+        session, owner, repo, headers, semaphore
+    )
+    if not default_branch:
         return None, repo_license
 
     # Get the tree using the default branch name
@@ -158,14 +465,7 @@ async def get_repo_tree(session, owner, repo, headers, semaphore):
         )
 
     # Check license against requirements
-    if (
-        settings.REQUIRED_LICENSES
-        and repo_license.lower() not in settings.REQUIRED_LICENSES
-        and repo_license.upper() != "NOASSERTION"
-    ):
-        logger.info(
-            f"Skipping repo {owner}/{repo}: License '{repo_license}' not in required list {settings.REQUIRED_LICENSES}."
-        )
+    if not is_license_allowed(owner, repo, repo_license):
         return None, repo_license  # Return None for tree to skip processing files
 
     return tree_data.get("tree", []) if tree_data else [], repo_license
@@ -197,6 +497,247 @@ async def get_blob_content(session, owner, repo, file_sha, headers, semaphore):
     return None
 
 
+class ArchiveStream(io.RawIOBase):
+    """
+    Read-only file object over archive chunks downloaded on the event loop.
+    The downloader feeds chunks while tarfile reads them from a worker thread,
+    so the archive is decompressed as it arrives and never held in full.
+    Feeding never blocks the event loop or needs a thread of its own: chunks
+    are put on an unbounded queue, and the downloader awaits (on the loop)
+    while max_chunks are queued until the reader signals it took one.
+    """
+
+    def __init__(self, max_chunks):
+        self.max_chunks = max_chunks
+        self._chunks = queue.SimpleQueue()
+        self._loop = asyncio.get_running_loop()
+        self._space = asyncio.Event()
+        self._buffer = b""
+        self._eof = False
+        self.abandoned = False  # Set by the reader once it needs no more data
+
+    def readable(self):
+        return True
+
+    async def feed(self, chunk):
+        """Queues a chunk for the reader, waiting while max_chunks are already queued."""
+        while self._chunks.qsize() >= self.max_chunks and not self.abandoned:
+            self._space.clear()
+            # The reader may have taken a chunk between the check and the clear
+            if self._chunks.qsize() < self.max_chunks:
+                break
+            await self._space.wait()
+        if not self.abandoned:
+            self._chunks.put(chunk)
+
+    def finish(self):
+        """Marks the end of the archive for the reader. Never waits."""
+        self._chunks.put(None)
+
+    def _signal_space(self):
+        try:
+            self._loop.call_soon_threadsafe(self._space.set)
+        except RuntimeError:
+            pass  # The event loop is closed; nobody is feeding anymore
+
+    def abandon(self):
+        """Stops the download early and wakes a downloader waiting for space."""
+        self.abandoned = True
+        while True:
+            try:
+                self._chunks.get_nowait()
+            except queue.Empty:
+                break
+        self._signal_space()
+
+    def readinto(self, buffer):
+        while not self._buffer and not self._eof:
+            chunk = self._chunks.get()
+            self._signal_space()
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer = chunk
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+# Threads extracting streamed archives, kept apart from the default executor
+_archive_readers = None
+
+
+def _archive_reader_executor():
+    global _archive_readers
+    if _archive_readers is None:
+        _archive_readers = ThreadPoolExecutor(
+            max_workers=settings.ARCHIVE_READER_THREADS,
+            thread_name_prefix="archive-reader",
+        )
+    return _archive_readers
+
+
+def git_blob_sha(data):
+    """Calculates the git blob SHA-1 of raw file bytes (same value as the tree API's 'sha')."""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def read_archive_files(stream, max_files):
+    """
+    Reads relevant files from a streamed .tar.gz repository archive.
+    Returns a list of (file_info, content) tuples, file_info mirroring tree entries.
+    Runs in a worker thread; stops reading once max_files relevant files are found.
+    """
+    files = []
+    try:
+        with tarfile.open(fileobj=stream, mode="r|gz") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                # Members are prefixed with a '<owner>-<repo>-<sha>/' directory
+                _, _, path = member.name.partition("/")
+                file_info = {"path": path, "size": member.size, "type": "blob"}
+                if not is_file_relevant(file_info):
+                    continue
+
+                data = archive.extractfile(member).read()
+                file_info["sha"] = git_blob_sha(data)
+                files.append((file_info, data.decode("utf-8", errors="replace")))
+                if len(files) >= max_files:
+                    logger.debug(f"Reached max files ({max_files}) in archive")
+                    break
+    finally:
+        stream.abandon()
+    return files
+
+
+async def get_repo_archive_files(session, owner, repo, ref, headers, semaphore):
+    """
+    Downloads a repository tarball in a single request and extracts relevant files
+    while it streams in. Returns a list of (file_info, content) tuples, or None on failure.
+    The download is paced, routed and retried like make_api_request: a rate
+    limited response pauses the token's bucket, and server errors, connection
+    errors and timeouts (also part way through the download) are retried
+    under the retry policy, restarting the extraction.
+    """
+    logger.info(f"Downloading archive for {owner}/{repo}@{ref}")
+    archive_url = f"{settings.GITHUB_API_URL}/repos/{owner}/{repo}/tarball/{ref}"
+
+    retries = _retry_policy.start()
+    while True:
+        with (
+            profiler.stage("rate_limit_wait"),
+            metrics.requests_waiting.labels("rate_limit").track_inprogress(),
+        ):
+            token = await _token_pool.acquire("core")
+        bucket = token.limiter.bucket("core")
+
+        error_class = retry_after = reader = None
+        failed = False
+        async with metrics.request_slot(semaphore):
+            try:
+                # GitHub redirects to codeload.github.com, which aiohttp follows
+                async with session.get(
+                    archive_url, headers={**headers, **token.auth_headers()}
+                ) as response:
+                    # Rate-limit headers come from the API response, before any redirect
+                    api_response = response.history[0] if response.history else response
+                    token.limiter.update("core", api_response.headers)
+
+                    if is_rate_limited(response.status, response.headers):
+                        wait_time = rate_limit_wait(response.headers)
+                        logger.warning(
+                            f"Rate limited ({response.status}) on archive of {owner}/{repo}. "
+                            f"Pausing core requests on {token.label} for {wait_time:.2f} seconds "
+                            f"(attempt {retries.attempts})."
+                        )
+                        bucket.block_for(wait_time)
+                        profiler.count("rate_limited")
+                        error_class = RATE_LIMITED
+                    elif response.status in RETRYABLE_STATUSES:
+                        logger.warning(
+                            f"Server error {response.status} on archive of {owner}/{repo} "
+                            f"(attempt {retries.attempts})."
+                        )
+                        retry_after = parse_retry_after(
+                            response.headers.get("Retry-After")
+                        )
+                        error_class = SERVER_ERROR
+                    else:
+                        response.raise_for_status()
+                        # Started only once the download begins, so idle readers never hold threads
+                        stream = ArchiveStream(settings.ARCHIVE_MAX_BUFFERED_CHUNKS)
+                        reader = asyncio.get_running_loop().run_in_executor(
+                            _archive_reader_executor(),
+                            read_archive_files,
+                            stream,
+                            settings.MAX_FILES_PER_REPO,
+                        )
+                        try:
+                            async for chunk in response.content.iter_chunked(
+                                settings.ARCHIVE_CHUNK_SIZE
+                            ):
+                                if stream.abandoned:
+                                    logger.debug(
+                                        f"Stopping archive download early for {owner}/{repo}"
+                                    )
+                                    break
+                                metrics.downloaded_bytes_total.labels("tarball").inc(
+                                    len(chunk)
+                                )
+                                await stream.feed(chunk)
+                        finally:
+                            stream.finish()
+            except aiohttp.ClientResponseError as e:
+                logger.error(f"Archive request failed: {e.status} for {owner}/{repo}")
+                failed = True
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError) as e:
+                # A payload error is a connection lost part way through the download
+                logger.warning(
+                    f"Connection error downloading archive for {owner}/{repo}: {e} "
+                    f"(attempt {retries.attempts})."
+                )
+                error_class = CONNECTION
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"Archive download timed out for {owner}/{repo} "
+                    f"(attempt {retries.attempts})."
+                )
+                error_class = TIMEOUT
+            except Exception as e:
+                logger.error(
+                    f"Unexpected error downloading archive for {owner}/{repo}: {e}"
+                )
+                failed = True
+
+        if reader is not None:
+            try:
+                files = await reader
+            except Exception as e:
+                # Expected after a broken download, which ends the archive early
+                if not failed and error_class is None:
+                    logger.error(f"Failed to read archive for {owner}/{repo}: {e}")
+                    failed = True
+            if not failed and error_class is None:
+                return files
+        if failed:
+            return None
+
+        # Out of the semaphore, so backing off does not hold a concurrency slot
+        attempts = retries.attempts
+        if not retries.allow(error_class):
+            logger.error(
+                f"Giving up on archive of {owner}/{repo} after {attempts} attempts "
+                f"({error_class})."
+            )
+            return None
+        metrics.retries_total.labels(error_class).inc()
+        # Rate-limited requests wait for their paused token bucket instead
+        if error_class != RATE_LIMITED:
+            await asyncio.sleep(retries.delay(retry_after))
+
+
 # --- Sync Helper Functions (Can remain synchronous as they are CPU-bound) ---
 
 
@@ -227,29 +768,16 @@ def is_file_relevant(file_info):
     return True
 
 
-def sanitize_content(content):
-    """Performs basic checks for PII or secrets (Placeholder)."""
-    # NOTE: Consider moving regex compilation outside the function for performance
-    # if called very frequently.
-    email_regex = re.compile(r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}")
-    key_regex = re.compile(r"-----BEGIN (?:RSA|OPENSSH|EC|PGP) PRIVATE KEY")
-
-    findings = []
-
+def sanitize_content(content, redact=False):
+    """
+    Scans content for PII and secrets (see secret_scanner).
+    Returns (content, findings). With redact, matches in the returned content
+    are replaced with typed placeholders; otherwise it is returned unchanged.
+    """
     try:
-        emails = email_regex.findall(content)
-        if emails:
-            findings.append(
-                {"type": "pii_email", "matches": list(set(emails))}
-            )  # Store unique emails
-
-        keys = key_regex.findall(content)
-        if keys:
-            findings.append({"type": "potential_private_key", "count": len(keys)})
+        if redact:
+            return redact_content(content)
+        return content, scan_content(content)
     except Exception as e:
-        logger.error(f"Error during sanitization regex: {e}")
-        # TODO: Decide how to handle content that causes regex errors
-
-    # TODO: Add more checks here (e.g., common API key patterns)
-
-    return findings
+        logger.error(f"Error during sanitization scan: {e}")
+        return content, []
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from loguru import logger
+
+# Response headers kept with cached bodies so they can be replayed on a 304
+STORED_HEADERS = ("ETag", "Last-Modified", "Link")
+
+
+class ResponseCache:
+    """
+    On-disk cache of JSON API responses keyed by URL.
+    Entries keep their ETag/Last-Modified validators so requests can be made
+    conditional, and the cache is trimmed least-recently-used first once it
+    grows beyond max_bytes. Recency survives restarts through file mtimes.
+    get, touch and put do file I/O and are meant to run in worker threads
+    (asyncio.to_thread); a lock guards the LRU index they share.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # key -> size in bytes, oldest first
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuilds the LRU index from the files already in the cache directory."""
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                files.append((stat.st_mtime, name[: -len(".json")], stat.st_size))
+
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self.total_bytes += size
+        logger.debug(
+            f"Loaded HTTP cache index: {len(self._entries)} entries, {self.total_bytes} bytes in '{self.cache_dir}'"
+        )
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    @staticmethod
+    def key_for(url, params=None):
+        """Builds the cache key for a request URL and its query parameters."""
+        if params:
+            url = f"{url}?{urlencode(sorted(params.items()))}"
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Returns the cached entry for a key, or None if it is not cached."""
+        with self._lock:
+            if key not in self._entries:
+                return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Dropping unreadable HTTP cache entry {key[:8]}: {e}")
+            with self._lock:
+                self._remove(key)
+            return None
+
+    @staticmethod
+    def conditional_headers(entry):
+        """Builds the validator headers that make a request conditional on a cached entry."""
+        headers = {}
+        if entry["headers"].get("ETag"):
+            headers["If-None-Match"] = entry["headers"]["ETag"]
+        if entry["headers"].get("Last-Modified"):
+            headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+        return headers
+
+    def touch(self, key):
+        """Marks an entry as recently used."""
+        with self._lock:
+            if key not in self._entries:
+                return
+            self._entries.move_to_end(key)
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+
+    def put(self, key, url, response_headers, body):
+        """Stores a response body if it carries a validator, then evicts old entries as needed."""
+        headers = {
+            name: response_headers[name]
+            for name in STORED_HEADERS
+            if response_headers.get(name)
+        }
+        if "ETag" not in headers and "Last-Modified" not in headers:
+            return  # Nothing to revalidate against
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = json.dumps({"url": url, "headers": headers, "body": body})
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to write HTTP cache entry for {url}: {e}")
+            return
+
+        size = os.path.getsize(path)
+        with self._lock:
+            self.total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = size
+            self.total_bytes += size
+            self._evict()
+
+    def _remove(self, key):
+        self.total_bytes -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes."""
+        while self.total_bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            self._remove(key)
+            logger.trace(f"Evicted HTTP cache entry {key[:8]}")
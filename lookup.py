@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+import sys
+from urllib.parse import unquote
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from loguru import logger
+
+import settings
+from parquet_output import parquet_files, read_bloom_filters
+
+# Columns printed for matching records unless --columns is given
+DEFAULT_COLUMNS = (
+    "repo_url",
+    "path",
+    "license",
+    "processed_content_hash",
+    "quality_score",
+)
+
+
+def _may_contain(statistics, value):
+    """Whether a column chunk's min/max statistics allow the value."""
+    if statistics is None or not statistics.has_min_max:
+        return True
+    return statistics.min <= value <= statistics.max
+
+
+def candidate_row_groups(metadata, column, values, bloom_filters=None):
+    """
+    Yields (row group, values it may contain) for the row groups of a file
+    that may hold any of the values, pruned by min/max statistics first and
+    then by the row group's bloom filter. Only the footer is read.
+    """
+    if bloom_filters is None:
+        bloom_filters = read_bloom_filters(metadata)
+    blooms = bloom_filters.get(column)
+    paths = [metadata.schema.column(i).path for i in range(metadata.num_columns)]
+    index = paths.index(column)
+    for row_group in range(metadata.num_row_groups):
+        statistics = metadata.row_group(row_group).column(index).statistics
+        candidates = [value for value in values if _may_contain(statistics, value)]
+        if blooms is not None:
+            candidates = [value for value in candidates if value in blooms[row_group]]
+        if candidates:
+            yield row_group, candidates
+
+
+def partition_values(root, file_path):
+    """Hive partition values of a dataset shard, from its directory names."""
+    directory = os.path.relpath(os.path.dirname(file_path), root)
+    values = {}
+    for part in directory.split(os.sep):
+        if "=" in part:
+            name, value = part.split("=", 1)
+            values[name] = (
+                None if value == "__HIVE_DEFAULT_PARTITION__" else unquote(value)
+            )
+    return values
+
+
+def lookup(path, column, values, columns=None):
+    """
+    Finds the records whose column equals one of the values in the Parquet
+    file or dataset directory at path. Returns (matching rows as a table,
+    row groups read, row groups in total). Only candidate row groups are
+    read, and only the requested columns of them. Partition columns of
+    dataset shards are filled in from the shard's directory.
+    """
+    columns = list(columns or [column])
+    if column not in columns:
+        columns.append(column)
+    tables, read, total = [], 0, 0
+    for file_path in parquet_files(path):
+        parquet_file = pq.ParquetFile(file_path)
+        total += parquet_file.metadata.num_row_groups
+        available = [
+            name for name in columns if name in parquet_file.schema_arrow.names
+        ]
+        for row_group, candidates in candidate_row_groups(
+            parquet_file.metadata, column, values
+        ):
+            read += 1
+            table = parquet_file.read_row_group(row_group, columns=available)
+            mask = pc.is_in(
+                table.column(column).cast(pa.string()), value_set=pa.array(candidates)
+            )
+            table = table.filter(mask)
+            if os.path.isdir(path):
+                for name, value in partition_values(path, file_path).items():
+                    if name in columns:
+                        table = table.append_column(
+                            name, pa.array([value] * table.num_rows, pa.string())
+                        )
+            tables.append(
+                table.select([name for name in columns if name in table.column_names])
+            )
+    if not tables:
+        return None, read, total
+    return pa.concat_tables(tables, promote_options="default"), read, total
+
+
+def parse_args():
+    """Parses command line arguments for the lookup."""
+    parser = argparse.ArgumentParser(
+        description="Look up records in the final dataset by content hash or repository, "
+        "reading only the row groups that may contain them."
+    )
+    parser.add_argument(
+        "path",
+        nargs="?",
+        default=settings.FINAL_DATASET_DIR or settings.FINAL_PARQUET_FILE,
+        help="Final Parquet file or dataset directory",
+    )
+    keys = parser.add_mutually_exclusive_group(required=True)
+    keys.add_argument(
+        "--hash",
+        dest="hashes",
+        action="append",
+        help="processed_content_hash to look up (repeatable)",
+    )
+    keys.add_argument(
+        "--repo-url",
+        dest="repo_urls",
+        action="append",
+        help="repo_url whose files to look up (repeatable)",
+    )
+    parser.add_argument(
+        "--exists",
+        action="store_true",
+        help="Only report whether each value is present",
+    )
+    parser.add_argument(
+        "--columns",
+        help="Comma-separated columns to print for matching records",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logger.remove()
+    logger.add(sys.stderr, level="INFO", format="{message}")  # stdout holds the results
+    args = parse_args()
+
+    column = "processed_content_hash" if args.hashes else "repo_url"
+    values = args.hashes or args.repo_urls
+    if args.exists:
+        columns = [column]
+    elif args.columns:
+        columns = args.columns.split(",")
+    else:
+        columns = DEFAULT_COLUMNS
+    table, read, total = lookup(args.path, column, values, columns)
+    logger.info(f"Read {read} of {total} row groups")
+
+    found = (
+        set(table.column(column).cast(pa.string()).to_pylist())
+        if table is not None
+        else set()
+    )
+    if args.exists:
+        for value in values:
+            print(f"{value}\t{'present' if value in found else 'absent'}")
+    elif table is not None:
+        for record in table.to_pylist():
+            print(json.dumps(record))
+    sys.exit(0 if found else 1)
@@ -1,30 +1,153 @@
+import argparse
 import asyncio
-import json
+import os
 import time
 import aiohttp
 from loguru import logger
 
+import metrics
 import settings
+from blob_store import BlobStore
+from crawl_state import (
+    REPO_DONE,
+    REPO_FAILED,
+    REPO_IN_PROGRESS,
+    REPO_INCOMPLETE,
+    REPO_SKIPPED,
+    CrawlState,
+)
 from helpers import (
     get_blob_content,
+    get_repo_archive_files,
+    get_repo_info,
     get_repo_tree,
     is_file_relevant,
+    is_license_allowed,
     sanitize_content,
-    search_repositories,
+    search_all_repositories,
+    set_response_cache,
+    set_retry_policy,
+    set_token_pool,
 )
+from http_cache import ResponseCache
+from profiling import add_profiling_arguments, profiler, start_from_args
+from rate_limit import TokenPool
+from raw_output import RawOutput
+from retry import RetryPolicy
 
 logger.remove()  # Remove default logger
 logger.add("crawler_debug.log", rotation="10 MB", level="TRACE", encoding="utf-8")
 logger.add(lambda msg: print(msg, end=""), level="DEBUG", format="{message}")
 
 
-async def process_repo(session, repo_info, headers, semaphore, output_file_handle):
-    """Fetches tree, filters files, fetches content, and writes raw data to output file."""
+async def process_repo(
+    session,
+    repo_info,
+    headers,
+    semaphore,
+    raw_output,
+    crawl_mode="blobs",
+    blob_store=None,
+):
+    """
+    Fetches relevant files of a repository and writes raw data to output file.
+    Returns the number of files written, or None if the repository was skipped.
+    """
     owner = repo_info["owner"]["login"]
     repo_name = repo_info["name"]
     repo_url = repo_info["html_url"]
-    logger.info(f"Processing Repository: {owner}/{repo_name}")
+    logger.info(f"Processing Repository: {owner}/{repo_name} ({crawl_mode} mode)")
+    await raw_output.mark_repo(f"{owner}/{repo_name}", REPO_IN_PROGRESS)
+
+    if crawl_mode == "archive":
+        return await process_repo_archive(
+            session,
+            owner,
+            repo_name,
+            repo_url,
+            headers,
+            semaphore,
+            raw_output,
+            blob_store,
+        )
+    return await process_repo_blobs(
+        session,
+        owner,
+        repo_name,
+        repo_url,
+        headers,
+        semaphore,
+        raw_output,
+        blob_store,
+    )
+
+
+async def process_repo_archive(
+    session,
+    owner,
+    repo_name,
+    repo_url,
+    headers,
+    semaphore,
+    raw_output,
+    blob_store=None,
+):
+    """Downloads the repository tarball once and writes its relevant files to output file."""
+    full_name = f"{owner}/{repo_name}"
+    default_branch, repo_license = await get_repo_info(
+        session, owner, repo_name, headers, semaphore
+    )
+
+    if not default_branch:
+        logger.warning(f"Skipping repo {full_name} (Repo info invalid).")
+        await raw_output.mark_repo(full_name, REPO_FAILED)
+        return None
+    if not is_license_allowed(owner, repo_name, repo_license):
+        await raw_output.mark_repo(full_name, REPO_SKIPPED)
+        return None
+
+    files = await get_repo_archive_files(
+        session, owner, repo_name, default_branch, headers, semaphore
+    )
+    if files is None:
+        logger.warning(f"Skipping repo {full_name} (Archive unavailable).")
+        await raw_output.mark_repo(full_name, REPO_FAILED)
+        return None
+
+    completed_files = await raw_output.completed_files(full_name)
+    files_written_count = 0
+    for file_info, content in files:
+        if file_info["path"] in completed_files:
+            continue  # Written before the crawl was interrupted
+        await raw_output.write_record(
+            full_name, repo_url, repo_license, file_info, content
+        )
+        files_written_count += 1
+    if blob_store is not None:
+        await asyncio.to_thread(
+            blob_store.put_many,
+            [(file_info["sha"], content) for file_info, content in files],
+        )
+
+    await raw_output.mark_repo(full_name, REPO_DONE)
+    logger.info(
+        f"Finished processing {full_name} ({files_written_count} raw files written)"
+    )
+    return files_written_count
+
 
+async def process_repo_blobs(
+    session,
+    owner,
+    repo_name,
+    repo_url,
+    headers,
+    semaphore,
+    raw_output,
+    blob_store=None,
+):
+    """Fetches tree, filters files, fetches content blob by blob, and writes raw data to output file."""
+    full_name = f"{owner}/{repo_name}"
     tree, repo_license = await get_repo_tree(
         session, owner, repo_name, headers, semaphore
     )
@@ -32,7 +155,11 @@ async def process_repo(session, repo_info, headers, semaphore, output_file_handl
     if tree is None:
         # Reason for skipping (e.g., license mismatch) might be logged in get_repo_tree
         logger.warning(f"Skipping repo {owner}/{repo_name} (Tree invalid or filtered).")
-        return 0
+        # Without a license the repository info itself could not be fetched
+        await raw_output.mark_repo(
+            full_name, REPO_SKIPPED if repo_license else REPO_FAILED
+        )
+        return None
 
     files_to_process = []
     for file_info in tree:
@@ -44,43 +171,71 @@ async def process_repo(session, repo_info, headers, semaphore, output_file_handl
         if is_file_relevant(file_info):
             files_to_process.append(file_info)
 
+    # Leave out files written before the crawl was interrupted
+    completed_files = await raw_output.completed_files(full_name)
+    if completed_files:
+        files_to_process = [
+            file_info
+            for file_info in files_to_process
+            if file_info["path"] not in completed_files
+        ]
+        logger.info(
+            f"Resuming {full_name}: {len(completed_files)} files already written."
+        )
+
     if not files_to_process:
         logger.info(
             f"No relevant files found in {owner}/{repo_name} after initial filtering."
         )
+        await raw_output.mark_repo(full_name, REPO_DONE)
         return 0
 
-    logger.info(
-        f"Fetching content for {len(files_to_process)} files in {owner}/{repo_name}..."
-    )
-
-    # Create tasks to fetch blob content concurrently
+    # Create tasks to fetch blob content concurrently, skipping blobs already
+    # in the local store (e.g. shared with a fork or fetched by an earlier crawl)
     blob_tasks = []
+    stored_count = 0
+    stored = {}
+    if blob_store is not None:
+        stored = await asyncio.to_thread(
+            blob_store.get_many, [file_info["sha"] for file_info in files_to_process]
+        )
     for file_info in files_to_process:
+        stored_content = stored.get(file_info["sha"])
+        if stored_content is not None:
+            blob_tasks.append((None, file_info, stored_content))
+            stored_count += 1
+            continue
         task = asyncio.create_task(
             get_blob_content(
                 session, owner, repo_name, file_info["sha"], headers, semaphore
             )
         )
-        blob_tasks.append((task, file_info))  # Keep track of file_info with its task
+        # Keep track of file_info with its task
+        blob_tasks.append((task, file_info, None))
+
+    logger.info(
+        f"Fetching content for {len(files_to_process) - stored_count} files in {owner}/{repo_name} "
+        f"({stored_count} already in blob store)..."
+    )
 
     files_written_count = 0
-    for task, file_info in blob_tasks:
+    fetched = []  # (sha, content) of blobs to add to the store
+    for task, file_info, stored_content in blob_tasks:
         try:
-            # Timeout per blob fetch task can be added here if needed
-            content = await asyncio.wait_for(task, timeout=60.0)
+            if task is None:
+                content = stored_content
+            else:
+                # No overall timeout: the task also waits for rate limit tokens
+                # and retry backoff, and the session's ClientTimeout already
+                # bounds each request
+                content = await task
+                if content and blob_store is not None:
+                    fetched.append((file_info["sha"], content))
 
             if content:
-                # Prepare RAW output data - Sanitization will happen in the next pipeline stage
-                output_data = {
-                    "repo_url": repo_url,
-                    "path": file_info["path"],
-                    "size": file_info.get("size"),
-                    "license": repo_license,
-                    "content_sha": file_info["sha"],  # Git SHA of the blob
-                    "content": content,  # Store the full content
-                }
-                output_file_handle.write(json.dumps(output_data) + "\n")
+                await raw_output.write_record(
+                    full_name, repo_url, repo_license, file_info, content
+                )
                 files_written_count += 1
             else:
                 logger.warning(
@@ -94,77 +249,164 @@ async def process_repo(session, repo_info, headers, semaphore, output_file_handl
             logger.error(
                 f"Error processing blob task for {file_info['path']} in {owner}/{repo_name}: {e}"
             )
+    if fetched:
+        await asyncio.to_thread(blob_store.put_many, fetched)
 
+    await raw_output.mark_repo(
+        full_name,
+        REPO_DONE if files_written_count == len(files_to_process) else REPO_INCOMPLETE,
+    )
     logger.info(
         f"Finished processing {owner}/{repo_name} ({files_written_count} raw files written)"
     )
     return files_written_count
 
 
-async def main():
-    """Main async function to run the crawler."""
+def open_raw_output_file(resume):
+    """Opens the raw output file, appending to it when resuming a crawl."""
+    if not resume:
+        return open(settings.RAW_OUTPUT_FILE, "w", encoding="utf-8")
+
+    # Terminate a line cut short by the interruption so appended records stay valid
+    needs_newline = False
+    if os.path.exists(settings.RAW_OUTPUT_FILE):
+        with open(settings.RAW_OUTPUT_FILE, "rb") as f:
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+
+    output_file = open(settings.RAW_OUTPUT_FILE, "a", encoding="utf-8")
+    if needs_newline:
+        output_file.write("\n")
+    return output_file
+
+
+async def main(
+    crawl_mode=None,
+    cache_dir=settings.HTTP_CACHE_DIR,
+    blob_store_dir=settings.BLOB_STORE_DIR,
+    resume=False,
+    trace_configs=None,
+    metrics_port=settings.METRICS_PORT,
+):
+    """
+    Main async function to run the crawler.
+    trace_configs are aiohttp TraceConfigs attached to the session, e.g. to
+    measure request latency in benchmarks.
+    With a metrics port, crawl metrics are served for Prometheus at
+    /metrics on that port while the crawl runs.
+    """
     start_time = time.time()
+    crawl_mode = crawl_mode or settings.CRAWL_MODE
 
-    if not settings.GITHUB_TOKEN:
-        logger.error("GITHUB_TOKEN environment variable not set.")
+    if not settings.GITHUB_TOKENS:
+        logger.error("GITHUB_TOKEN or GITHUB_TOKENS environment variable not set.")
         exit(1)
 
+    # Each request carries the Authorization header of the token it is routed to
+    token_pool = TokenPool(settings.GITHUB_TOKENS)
+    set_token_pool(token_pool)
+    set_retry_policy(RetryPolicy())
+    metrics.rate_limit_remaining.set_function(
+        lambda: {
+            (token.label, resource): bucket.remaining
+            for token in token_pool.tokens
+            for resource, bucket in token.limiter.buckets.items()
+        }
+    )
+    logger.info(f"Using a pool of {len(settings.GITHUB_TOKENS)} GitHub token(s).")
     headers = {
-        "Authorization": f"token {settings.GITHUB_TOKEN}",
         "Accept": "application/vnd.github.v3+json",
     }
 
+    if cache_dir:
+        logger.info(f"Using HTTP response cache in '{cache_dir}'")
+        set_response_cache(ResponseCache(cache_dir, settings.HTTP_CACHE_MAX_BYTES))
+
+    blob_store = None
+    if blob_store_dir:
+        logger.info(f"Using blob store in '{blob_store_dir}'")
+        blob_store = BlobStore(blob_store_dir)
+
+    crawl_state = CrawlState(settings.CRAWL_STATE_FILE)
+    if not resume:
+        crawl_state.reset()
+
     # Create a semaphore to limit concurrent requests
     semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_REQUESTS)
+    metrics.max_concurrent_requests.set(settings.MAX_CONCURRENT_REQUESTS)
 
     # Use a single session for connection pooling
     # Increase timeout settings for potentially slow API responses
     timeout = aiohttp.ClientTimeout(
         total=120, connect=30, sock_connect=30, sock_read=60
     )
-    async with aiohttp.ClientSession(headers=headers, timeout=timeout) as session:
-        # Construct search query
-        license_query_part = ""
-        if settings.REQUIRED_LICENSES:
-            license_query_part = " ".join(
-                [f"license:{lic}" for lic in settings.REQUIRED_LICENSES]
-            )
-
-        # Focus search on the target language
-        query = (
-            f"language:{settings.TARGET_LANGUAGE} stars:>{settings.MIN_STARS} pushed:>{settings.MIN_PUSH_DATE} {license_query_part}".strip()
-            + " is:public"
-        )
-
-        # Initial search
-        # TODO: Handle paginated responses
-        repositories = await search_repositories(
-            session, query, headers, semaphore, per_page=100
+    if metrics_port:
+        trace_configs = [metrics.trace_config(), *(trace_configs or [])]
+    async with (
+        aiohttp.ClientSession(
+            headers=headers, timeout=timeout, trace_configs=trace_configs
+        ) as session,
+        metrics.serve_metrics(metrics_port),
+    ):
+        # Search has its own, much stricter rate limit
+        search_semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_SEARCH_REQUESTS)
+        repositories = await search_all_repositories(
+            session,
+            headers,
+            search_semaphore,
+            max_results=settings.MAX_REPOS_TO_PROCESS,
         )
 
         if not repositories:
             logger.info("No repositories found matching the criteria.")
             return
 
-        logger.info(
-            f"Found {len(repositories)} potential repositories from initial search."
-        )
+        logger.info(f"Found {len(repositories)} potential repositories from search.")
 
         # Limit the number of repos we actually process fully
         repos_to_process = repositories[: settings.MAX_REPOS_TO_PROCESS]
+
+        if resume:
+            finished_repos = await asyncio.to_thread(crawl_state.finished_repos)
+            repos_to_process = [
+                repo
+                for repo in repos_to_process
+                if f"{repo['owner']['login']}/{repo['name']}" not in finished_repos
+            ]
+            logger.info(
+                f"Resuming crawl: {len(finished_repos)} repositories already finished."
+            )
+
         logger.info(
             f"Attempting to process details for {len(repos_to_process)} repositories."
         )
 
-        with open(settings.RAW_OUTPUT_FILE, "w", encoding="utf-8") as f:
+        with open_raw_output_file(resume) as f:
+            # A single writer task owns the output file
+            raw_output = RawOutput(f, crawl_state)
+            raw_output.start()
+            metrics.raw_output_queue_depth.set_function(raw_output.queue_depth)
             # Create tasks to process repositories concurrently
             repo_tasks = [
-                process_repo(session, repo, headers, semaphore, f)
+                process_repo(
+                    session,
+                    repo,
+                    headers,
+                    semaphore,
+                    raw_output,
+                    crawl_mode,
+                    blob_store,
+                )
                 for repo in repos_to_process
             ]
 
             # Wait for all repository processing tasks to complete
-            results = await asyncio.gather(*repo_tasks, return_exceptions=True)
+            try:
+                results = await asyncio.gather(*repo_tasks, return_exceptions=True)
+            finally:
+                # Flush whatever is still queued, even if the crawl is interrupted
+                await raw_output.close()
 
             total_files_written = 0
             processed_repo_count = 0
@@ -172,25 +414,14 @@ async def main():
                 repo_name = f"{repos_to_process[i]['owner']['login']}/{repos_to_process[i]['name']}"
                 if isinstance(result, Exception):
                     logger.error(f"Error processing repository {repo_name}: {result}")
-                elif (
-                    result is not None
-                ):  # process_repo returns file count or None on initial skip
-                    # Only count repos where we actually attempted to process files
-                    if (
-                        await get_repo_tree(
-                            session,
-                            repos_to_process[i]["owner"]["login"],
-                            repos_to_process[i]["name"],
-                            headers,
-                            semaphore,
-                        )
-                        is not None
-                    ):
-                        processed_repo_count += 1
+                elif result is not None:  # process_repo returns None when skipped
+                    processed_repo_count += 1
                     total_files_written += (
                         result  # Add count of files processed for this repo
                     )
 
+    crawl_state.close()
+
     end_time = time.time()
     logger.info("Crawling Stage Summary")
     logger.info(f"Crawling finished in {end_time - start_time:.2f} seconds.")
@@ -202,5 +433,61 @@ async def main():
     logger.info(f"Raw output data saved to {settings.RAW_OUTPUT_FILE}")
 
 
+def parse_args():
+    """Parses command line arguments for the crawler."""
+    parser = argparse.ArgumentParser(description="Crawl code files from GitHub.")
+    parser.add_argument(
+        "--mode",
+        choices=["blobs", "archive"],
+        default=settings.CRAWL_MODE,
+        help="'blobs' fetches files one API call at a time, 'archive' downloads one tarball per repository.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=settings.HTTP_CACHE_DIR,
+        help="Directory of the on-disk HTTP response cache.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Disable the HTTP response cache.",
+    )
+    parser.add_argument(
+        "--blob-store-dir",
+        default=settings.BLOB_STORE_DIR,
+        help="Directory of the local content-addressed blob store.",
+    )
+    parser.add_argument(
+        "--no-blob-store",
+        action="store_true",
+        help="Disable the local blob store.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Resume an interrupted crawl: skip finished repositories and append to the raw output.",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=settings.METRICS_PORT,
+        help="Serve Prometheus metrics at /metrics on this port while crawling.",
+    )
+    add_profiling_arguments(parser, settings.CRAWLER_PROFILE_FILE)
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    profile_path = start_from_args(args, settings.CRAWLER_PROFILE_FILE)
+    asyncio.run(
+        main(
+            crawl_mode=args.mode,
+            cache_dir=None if args.no_cache else args.cache_dir,
+            blob_store_dir=None if args.no_blob_store else args.blob_store_dir,
+            resume=args.resume,
+            metrics_port=args.metrics_port,
+        )
+    )
+    if profile_path:
+        profiler.write_summary(profile_path, args.cprofile)
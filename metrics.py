@@ -0,0 +1,203 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import aiohttp
+from loguru import logger
+from prometheus_client import (
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    start_http_server,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+import settings
+
+
+class CallbackGauge:
+    """
+    A labelled gauge read from a callback at scrape time, which returns
+    {label values: value}. For values owned by other objects, such as the
+    rate limit buckets of every token, that are cheaper to read on demand
+    than to keep in sync.
+    """
+
+    def __init__(self, name, documentation, labelnames, registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._function = None
+        registry.register(self)
+
+    def set_function(self, function):
+        self._function = function
+
+    def describe(self):
+        return [
+            GaugeMetricFamily(self.name, self.documentation, labels=self.labelnames)
+        ]
+
+    def collect(self):
+        family = GaugeMetricFamily(
+            self.name, self.documentation, labels=self.labelnames
+        )
+        values = {}
+        if self._function is not None:
+            # Scrapes run on the server thread, concurrently with the crawl
+            try:
+                values = self._function()
+            except Exception as e:
+                logger.warning(f"Could not collect metric {self.name}: {e}")
+        for labels, value in values.items():
+            family.add_metric([str(label) for label in labels], value)
+        yield family
+
+
+# --- Crawler Metrics ---
+
+max_concurrent_requests = Gauge(
+    "tadpole_max_concurrent_requests",
+    "Configured MAX_CONCURRENT_REQUESTS.",
+)
+requests_in_flight = Gauge(
+    "tadpole_requests_in_flight",
+    "API requests holding a concurrency slot.",
+)
+requests_waiting = Gauge(
+    "tadpole_requests_waiting",
+    "Requests waiting for a rate limit token or a concurrency slot.",
+    ["stage"],
+)
+semaphore_wait_seconds = Histogram(
+    "tadpole_semaphore_wait_seconds",
+    "Time requests waited for a concurrency slot.",
+    buckets=settings.METRICS_LATENCY_BUCKETS,
+)
+request_duration_seconds = Histogram(
+    "tadpole_request_duration_seconds",
+    "Time from sending a request until its response headers arrived, by endpoint.",
+    ["endpoint"],
+    buckets=settings.METRICS_LATENCY_BUCKETS,
+)
+responses_total = Counter(
+    "tadpole_responses_total",
+    "HTTP responses received, by endpoint and status code.",
+    ["endpoint", "status"],
+)
+retries_total = Counter(
+    "tadpole_retries_total",
+    "Failed requests retried, by error class.",
+    ["reason"],
+)
+request_errors_total = Counter(
+    "tadpole_request_errors_total",
+    "Requests that failed without a response, by endpoint and exception.",
+    ["endpoint", "error"],
+)
+downloaded_bytes_total = Counter(
+    "tadpole_downloaded_bytes_total",
+    "Response body bytes read, by endpoint.",
+    ["endpoint"],
+)
+rate_limit_remaining = CallbackGauge(
+    "tadpole_rate_limit_remaining",
+    "Requests left in the current rate limit window, by token and resource.",
+    ["token", "resource"],
+)
+repos_total = Counter(
+    "tadpole_repos_total",
+    "Repository status changes (in_progress counts started repositories).",
+    ["status"],
+)
+files_written_total = Counter(
+    "tadpole_files_written_total",
+    "Raw records queued for the output file.",
+)
+raw_output_queue_depth = Gauge(
+    "tadpole_raw_output_queue_depth",
+    "Records and status updates waiting for the raw output writer.",
+)
+
+
+def endpoint_of(url):
+    """Name of the GitHub API endpoint a request URL belongs to."""
+    path = url.path
+    if path.startswith("/search/"):
+        return "search"
+    for marker, name in (("/git/blobs/", "blob"), ("/git/trees/", "tree")):
+        if marker in path:
+            return name
+    return "tarball" if "/tarball/" in path else "repo"
+
+
+def trace_config():
+    """
+    An aiohttp TraceConfig recording request latency, response statuses,
+    failures and bytes read for every request of a client session.
+    """
+
+    async def on_request_start(session, context, params):
+        context.start = time.perf_counter()
+
+    async def on_request_end(session, context, params):
+        endpoint = endpoint_of(params.url)
+        request_duration_seconds.labels(endpoint).observe(
+            time.perf_counter() - context.start
+        )
+        responses_total.labels(endpoint, params.response.status).inc()
+
+    async def on_request_exception(session, context, params):
+        request_errors_total.labels(
+            endpoint_of(params.url), type(params.exception).__name__
+        ).inc()
+
+    async def on_response_chunk_received(session, context, params):
+        # Sent once per fully read body; streamed downloads count their own chunks
+        downloaded_bytes_total.labels(endpoint_of(params.url)).inc(len(params.chunk))
+
+    config = aiohttp.TraceConfig()
+    config.on_request_start.append(on_request_start)
+    config.on_request_end.append(on_request_end)
+    config.on_request_exception.append(on_request_exception)
+    config.on_response_chunk_received.append(on_response_chunk_received)
+    return config
+
+
+@asynccontextmanager
+async def request_slot(semaphore):
+    """
+    Takes a concurrency slot from the semaphore like `async with semaphore`,
+    recording the wait and counting the request as in flight while held.
+    """
+    start = time.perf_counter()
+    with requests_waiting.labels("semaphore").track_inprogress():
+        await semaphore.acquire()
+    semaphore_wait_seconds.observe(time.perf_counter() - start)
+    try:
+        with requests_in_flight.track_inprogress():
+            yield
+    finally:
+        semaphore.release()
+
+
+@asynccontextmanager
+async def serve_metrics(port, host=None, registry=REGISTRY):
+    """
+    Serves the registry at http://host:port/metrics from a background thread
+    while the block runs. Does nothing without a port.
+    """
+    if not port:
+        yield None
+        return
+    host = host or settings.METRICS_HOST
+    server, thread = start_http_server(port, addr=host, registry=registry)
+    logger.info(f"Serving metrics at http://{host}:{port}/metrics")
+    try:
+        yield server
+    finally:
+        # shutdown() waits for the serving loop to notice, up to half a second
+        await asyncio.to_thread(server.shutdown)
+        server.server_close()
+        thread.join()
@@ -0,0 +1,167 @@
+import re
+import zlib
+
+import numpy as np
+
+import settings
+from profiling import profiler
+
+_TOKEN_RE = re.compile(r"\w+")
+# Fixed seed: signatures computed in different worker processes must agree
+_SEED = 0x7AD901E
+_SHINGLE_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+# Shingles hashed per vectorized step, bounding the (shingles x num_perm) matrix
+_MAX_SHINGLES_PER_CHUNK = 1 << 15
+
+_hash_params = {}
+
+
+def _permutation_params(num_perm):
+    """Multipliers and offsets of the num_perm hash functions standing in for permutations."""
+    if num_perm not in _hash_params:
+        rng = np.random.default_rng(_SEED)
+        # Multiply-shift hashing needs odd multipliers
+        a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+        _hash_params[num_perm] = (a, b)
+    return _hash_params[num_perm]
+
+
+def shingle_hashes(content, shingle_size=None):
+    """
+    64-bit hashes of the word k-grams of the content.
+    Content with fewer than k words is treated as a single shingle.
+    """
+    shingle_size = shingle_size or settings.NEAR_DEDUP_SHINGLE_SIZE
+    tokens = np.fromiter(
+        (
+            zlib.crc32(token.encode("utf-8", errors="replace"))
+            for token in _TOKEN_RE.findall(content)
+        ),
+        dtype=np.uint64,
+    )
+    shingle_size = min(shingle_size, len(tokens))
+    if not shingle_size:
+        return tokens
+
+    count = len(tokens) - shingle_size + 1
+    # Rolling polynomial over the window; uint64 arithmetic wraps around
+    hashes = tokens[:count].copy()
+    for offset in range(1, shingle_size):
+        hashes = hashes * _SHINGLE_MULTIPLIER + tokens[offset : offset + count]
+    return hashes
+
+
+def minhash_signatures(contents, num_perm=None):
+    """
+    Computes MinHash signatures for a batch of contents.
+    Returns one uint32 array of num_perm values per content, or None for
+    content without any words. Shingles of many documents are hashed in one
+    vectorized step and reduced to per-document minimums with reduceat.
+    """
+    num_perm = num_perm or settings.NEAR_DEDUP_NUM_PERM
+    a, b = _permutation_params(num_perm)
+    shingles = [shingle_hashes(content) for content in contents]
+    signatures = [None] * len(contents)
+
+    docs = [i for i, hashes in enumerate(shingles) if len(hashes)]
+    start = 0
+    while start < len(docs):
+        end, total = start, 0
+        while end < len(docs) and (
+            end == start or total + len(shingles[docs[end]]) <= _MAX_SHINGLES_PER_CHUNK
+        ):
+            total += len(shingles[docs[end]])
+            end += 1
+
+        chunk = docs[start:end]
+        lengths = [len(shingles[i]) for i in chunk]
+        offsets = np.cumsum([0] + lengths[:-1])
+        hashes = np.concatenate([shingles[i] for i in chunk])
+        values = ((hashes[:, None] * a + b) >> np.uint64(32)).astype(np.uint32)
+        minimums = np.minimum.reduceat(values, offsets, axis=0)
+        for i, signature in zip(chunk, minimums):
+            signatures[i] = signature
+        start = end
+
+    return signatures
+
+
+class NearDuplicateIndex:
+    """
+    LSH index of MinHash signatures, keeping the first file of each cluster.
+    Signatures are split into bands; files sharing any band are candidates,
+    and a candidate is a near duplicate when the fraction of equal signature
+    values (the estimated Jaccard similarity) reaches the threshold. Only
+    representatives are stored, so lookups never compare all pairs.
+    The index lives in memory for a single run, at about 2 KB per
+    representative with the default 128 permutations and 16 bands (the
+    signature plus one bucket entry per band); it is not persisted like
+    the exact DedupIndex, so near duplicates of earlier runs' files pass.
+    """
+
+    def __init__(self, num_perm=None, bands=None, threshold=None):
+        self.num_perm = num_perm or settings.NEAR_DEDUP_NUM_PERM
+        self.bands = bands or settings.NEAR_DEDUP_BANDS
+        self.threshold = threshold or settings.NEAR_DEDUP_THRESHOLD
+        if self.num_perm % self.bands:
+            raise ValueError(
+                f"num_perm ({self.num_perm}) must be a multiple of bands ({self.bands})"
+            )
+        self.rows = self.num_perm // self.bands
+
+        rng = np.random.default_rng(_SEED + 1)
+        self._band_weights = rng.integers(
+            1, 2**63, size=self.rows, dtype=np.uint64
+        ) | np.uint64(1)
+        # One dict per band: 64-bit band key -> index of the representative, or a
+        # list of indices once several share the key (most keys have just one)
+        self._buckets = [{} for _ in range(self.bands)]
+        self._signatures = np.empty((1024, self.num_perm), dtype=np.uint32)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _band_keys(self, signature):
+        """Hashes each band of a signature to a 64-bit key."""
+        bands = signature.reshape(self.bands, self.rows).astype(np.uint64)
+        return (bands * self._band_weights).sum(axis=1).tolist()
+
+    @profiler.timed("near_dedup")
+    def is_near_duplicate(self, signature):
+        """
+        Checks a signature against the representatives so far.
+        Registers it as a new representative when it is not a near duplicate.
+        """
+        keys = self._band_keys(signature)
+        candidates = set()
+        for bucket, key in zip(self._buckets, keys):
+            members = bucket.get(key)
+            if isinstance(members, list):
+                candidates.update(members)
+            elif members is not None:
+                candidates.add(members)
+        if candidates:
+            matches = self._signatures[list(candidates)] == signature
+            if matches.mean(axis=1).max() >= self.threshold:
+                return True
+
+        self._add(signature, keys)
+        return False
+
+    def _add(self, signature, keys):
+        if self.count == len(self._signatures):
+            self._signatures = np.concatenate(
+                [self._signatures, np.empty_like(self._signatures)]
+            )
+        self._signatures[self.count] = signature
+        for bucket, key in zip(self._buckets, keys):
+            members = bucket.get(key)
+            if members is None:
+                bucket[key] = self.count
+            elif isinstance(members, list):
+                members.append(self.count)
+            else:
+                bucket[key] = [members, self.count]
+        self.count += 1
@@ -0,0 +1,500 @@
+import json
+import math
+import os
+import time
+import uuid
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from loguru import logger
+
+import settings
+from bloom_filter import BloomFilter
+from profiling import profiler
+
+# --- Output Schema ---
+
+# Repeated values (a repository has many files, licenses are few) are
+# dictionary-encoded; content may exceed the 2 GB offset limit of a string
+# column within a row group, so it is a large_string.
+DICTIONARY_STRING = pa.dictionary(pa.int32(), pa.string())
+
+FINDINGS_TYPE = pa.list_(
+    pa.struct(
+        [
+            ("type", pa.string()),
+            ("count", pa.int64()),
+            ("matches", pa.list_(pa.string())),  # PII values, null for secrets
+            (
+                "spans",
+                pa.list_(pa.struct([("start", pa.int64()), ("end", pa.int64())])),
+            ),
+        ]
+    )
+)
+
+ANNOTATIONS_TYPE = pa.struct(
+    [
+        ("comment_ratio", pa.float64()),  # Null for files without lines
+        ("code_density", pa.float64()),
+        ("has_tests_keyword", pa.bool_()),
+    ]
+)
+
+OUTPUT_SCHEMA = pa.schema(
+    [
+        ("repo_url", DICTIONARY_STRING),
+        ("path", pa.string()),
+        ("size", pa.int64()),
+        ("license", DICTIONARY_STRING),
+        ("content_sha", pa.string()),
+        ("content", pa.large_string()),
+        ("processed_content_hash", pa.string()),
+        ("sanitization_findings", FINDINGS_TYPE),
+        ("line_count", pa.int64()),
+        ("quality_score", pa.float64()),
+        ("annotations", ANNOTATIONS_TYPE),
+    ]
+)
+
+
+def records_to_table(records, schema=OUTPUT_SCHEMA):
+    """Converts record dicts to a table with the schema, without inferring types."""
+    return pa.Table.from_pylist(records, schema=schema)
+
+
+def conform_table(table, schema=OUTPUT_SCHEMA):
+    """Casts a table with the schema's columns to the schema, in schema order."""
+    table = table.select(schema.names)
+    if table.schema.equals(schema):
+        return table
+    return table.cast(schema)
+
+
+# --- Codecs and Encodings ---
+
+
+def leaf_column_paths(schema):
+    """Dotted paths of the Parquet leaf columns of an Arrow schema."""
+
+    def walk(path, arrow_type):
+        if pa.types.is_dictionary(arrow_type):
+            arrow_type = arrow_type.value_type
+        if pa.types.is_struct(arrow_type):
+            for field in arrow_type:
+                yield from walk(f"{path}.{field.name}", field.type)
+        elif pa.types.is_list(arrow_type) or pa.types.is_large_list(arrow_type):
+            yield from walk(f"{path}.list.element", arrow_type.value_type)
+        else:
+            yield path
+
+    for field in schema:
+        yield from walk(field.name, field.type)
+
+
+def _covers(column, path):
+    """Whether a configured column (a leaf or one of its parents) covers a leaf path."""
+    return path == column or path.startswith(f"{column}.")
+
+
+def writer_options(
+    schema,
+    compression=None,
+    compression_level=None,
+    column_compression=None,
+    dictionary_columns=None,
+    column_encodings=None,
+):
+    """
+    Keyword arguments for pq.ParquetWriter with per-column codecs and encodings.
+    Arguments left as None come from the PARQUET_* settings. Settings name
+    columns by dotted path; they are expanded to every leaf column, since
+    pyarrow leaves columns missing from a codec mapping uncompressed.
+    """
+    compression = compression or settings.PARQUET_COMPRESSION
+    if compression_level is None:
+        compression_level = settings.PARQUET_COMPRESSION_LEVEL
+    if column_compression is None:
+        column_compression = settings.PARQUET_COLUMN_COMPRESSION
+    if dictionary_columns is None:
+        dictionary_columns = settings.PARQUET_DICTIONARY_COLUMNS
+    if column_encodings is None:
+        column_encodings = settings.PARQUET_COLUMN_ENCODINGS
+
+    codecs, levels, dictionary, encodings = {}, {}, [], {}
+    for path in leaf_column_paths(schema):
+        codec, level = compression, compression_level
+        for column, (column_codec, column_level) in column_compression.items():
+            if _covers(column, path):
+                codec, level = column_codec, column_level
+        codecs[path] = codec
+        if level is not None:
+            levels[path] = level
+
+        if dictionary_columns is True or any(
+            _covers(column, path) for column in dictionary_columns
+        ):
+            dictionary.append(path)
+            continue
+        for column, encoding in column_encodings.items():
+            if _covers(column, path):
+                encodings[path] = encoding
+
+    options = {
+        "compression": codecs,
+        "use_dictionary": True if dictionary_columns is True else dictionary,
+        "write_statistics": True,
+        "write_page_index": settings.PARQUET_WRITE_PAGE_INDEX,
+    }
+    if levels:
+        options["compression_level"] = levels
+    if encodings:
+        options["column_encoding"] = encodings
+    return options
+
+
+# --- Bloom Filters ---
+
+# Footer key of the per-row-group bloom filters, as JSON:
+# {column: [filter of row group 0, filter of row group 1, ...]}
+BLOOM_FILTERS_KEY = b"tadpole.bloom_filters"
+
+
+def read_bloom_filters(metadata):
+    """Bloom filters of a file's row groups by column, from its FileMetaData."""
+    data = (metadata.metadata or {}).get(BLOOM_FILTERS_KEY)
+    if data is None:
+        return {}
+    return {
+        column: [BloomFilter.from_dict(bloom) for bloom in blooms]
+        for column, blooms in json.loads(data).items()
+    }
+
+
+# --- Writers ---
+
+
+class StreamingParquetWriter:
+    """
+    Writes records to a Parquet file incrementally, one row group at a time.
+    Accepts records as dicts (write) or as Arrow tables (write_table); only
+    the rows of the current row group are held in memory. Every row group
+    uses the schema (OUTPUT_SCHEMA by default), so files of different runs
+    share one schema. Codecs and encodings follow writer_options; each row
+    group gets a bloom filter of the PARQUET_BLOOM_FILTER_COLUMNS, stored in
+    the footer under BLOOM_FILTERS_KEY.
+    The file is written to <path>.tmp and moved into place on close, so a
+    failed run never leaves a truncated file that looks complete, nor replaces
+    the output of an earlier run; leaving the with block on an exception
+    discards it.
+    """
+
+    def __init__(self, path, row_group_size=None, schema=OUTPUT_SCHEMA, options=None):
+        self.path = path
+        self.temp_path = f"{path}.tmp"
+        self.row_group_size = row_group_size or settings.PARQUET_ROW_GROUP_SIZE
+        self.schema = schema
+        # pq.ParquetWriter arguments, from the PARQUET_* settings by default
+        self.options = options or writer_options(schema)
+        self._bloom_filters = {
+            column: []
+            for column in settings.PARQUET_BLOOM_FILTER_COLUMNS
+            if column in schema.names
+        }
+        self.rows_written = 0
+        self.bytes_written = 0
+        self._buffer = []
+        self._tables = []
+        self._buffered_rows = 0
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+            return
+        try:
+            self.close()
+        except BaseException:
+            self.abort()
+            raise
+
+    @property
+    def buffered_rows(self):
+        """Rows held in memory, waiting for the next row group."""
+        return len(self._buffer) + self._buffered_rows
+
+    def write(self, record):
+        """Buffers a record, flushing a row group once the buffer is full."""
+        self._buffer.append(record)
+        if len(self._buffer) >= self.row_group_size:
+            self.flush()
+
+    def write_table(self, table):
+        """Buffers an Arrow table of records, writing out every full row group."""
+        self._tables.append(conform_table(table, self.schema))
+        self._buffered_rows += table.num_rows
+        if self._buffered_rows < self.row_group_size:
+            return
+
+        table = pa.concat_tables(self._tables)
+        full_rows = table.num_rows - table.num_rows % self.row_group_size
+        self._write(table.slice(0, full_rows))
+        self._tables = [table.slice(full_rows)]
+        self._buffered_rows = table.num_rows - full_rows
+
+    def flush(self):
+        """Writes the buffered records as a single row group."""
+        if self._buffer:
+            with profiler.stage("to_arrow", items=len(self._buffer)):
+                table = records_to_table(self._buffer, self.schema)
+            self._buffer = []
+            self._write(table)
+        if self._buffered_rows:
+            table = pa.concat_tables(self._tables)
+            self._tables = []
+            self._buffered_rows = 0
+            self._write(table)
+
+    def _write(self, table):
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.temp_path, self.schema, **self.options)
+        with profiler.stage("parquet_write", items=table.num_rows):
+            self._writer.write_table(table, row_group_size=self.row_group_size)
+        # The writer splits the table at the same row group boundaries
+        with profiler.stage("bloom_filter", items=table.num_rows):
+            for offset in range(0, table.num_rows, self.row_group_size):
+                row_group = table.slice(offset, self.row_group_size)
+                for column, blooms in self._bloom_filters.items():
+                    values = row_group.column(column).unique().to_pylist()
+                    blooms.append(BloomFilter.build(values))
+        self.rows_written += table.num_rows
+        self.bytes_written = os.path.getsize(self.temp_path)
+        logger.debug(f"Flushed row group ({self.rows_written} rows written so far).")
+
+    def close(self):
+        """Flushes any remaining records, finalizes the file and moves it into place."""
+        self.flush()
+        if self._writer is not None:
+            if self._bloom_filters:
+                blooms = {
+                    column: [bloom.to_dict() for bloom in blooms]
+                    for column, blooms in self._bloom_filters.items()
+                }
+                self._writer.add_key_value_metadata(
+                    {BLOOM_FILTERS_KEY: json.dumps(blooms, separators=(",", ":"))}
+                )
+            with profiler.stage("parquet_write", items=0):
+                self._writer.close()
+            self._writer = None
+            os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        """Drops the buffered records and deletes the unfinished file."""
+        self._buffer = []
+        self._tables = []
+        self._buffered_rows = 0
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except Exception as e:
+                logger.warning(f"Could not close '{self.temp_path}': {e}")
+            self._writer = None
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+def parquet_files(path):
+    """The Parquet file at path, or every shard of the dataset directory, in order."""
+    if not os.path.isdir(path):
+        return [path]
+    return [
+        os.path.join(directory, name)
+        for directory, _, files in sorted(os.walk(path))
+        for name in sorted(files)
+        if name.endswith(".parquet")
+    ]
+
+
+def quality_bucket(score):
+    """Label of the quality-score bucket, e.g. '0.70' for scores in [0.7, 0.8)."""
+    if score is None:
+        return None
+    width = settings.QUALITY_BUCKET_WIDTH
+    # Rounded first, so 0.7 / 0.1 lands in bucket 7 rather than 6.999...;
+    # a perfect score belongs to the top bucket
+    index = min(math.floor(round(score / width, 6)), round(1 / width) - 1)
+    bucket = index * width
+    return f"{bucket:.2f}"
+
+
+class PartitionedDatasetWriter:
+    """
+    Writes records as a Hive-partitioned dataset of Parquet shards
+    (<root>/license=MIT/quality_bucket=0.70/part-<run>-00000.parquet), so
+    readers can prune partitions and read shards in parallel.
+    Each partition has one open shard at a time; once a shard reaches the
+    target size it is closed and the next one started. Every open shard
+    buffers its own row group, so once max_buffered_rows are buffered across
+    all of them, the largest buffer is flushed early as a smaller row group;
+    memory stays bounded however many partitions there are. Partition values live
+    in the directory names only. On close, _common_metadata and a _metadata
+    summary of every shard in the dataset, including earlier runs', are written.
+    Shards and metadata files are moved into place once complete; leaving the
+    with block on an exception deletes every shard of the run instead, so the
+    dataset keeps only the output of successful runs.
+    """
+
+    def __init__(
+        self,
+        root,
+        partition_by=None,
+        shard_target_bytes=None,
+        row_group_size=None,
+        max_buffered_rows=None,
+    ):
+        self.root = root
+        self.partition_by = tuple(partition_by or settings.DATASET_PARTITION_BY)
+        unknown = set(self.partition_by) - {"license", "quality_bucket"}
+        if unknown:
+            raise ValueError(f"Unsupported partition columns: {sorted(unknown)}")
+        self.shard_target_bytes = (
+            shard_target_bytes or settings.DATASET_SHARD_TARGET_BYTES
+        )
+        self.row_group_size = row_group_size
+        self.max_buffered_rows = max_buffered_rows or settings.DATASET_MAX_BUFFERED_ROWS
+        # Partition columns are not stored in the shards themselves
+        self.file_schema = pa.schema(
+            [field for field in OUTPUT_SCHEMA if field.name not in self.partition_by]
+        )
+        # Shards of different runs never collide, so runs can add to a dataset;
+        # the random suffix keeps apart runs started within the same second
+        self.run_id = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex}"
+        self.rows_written = 0
+        self.shards_written = 0
+        self._shards = {}  # Partition key -> (open shard writer, shard number)
+        self._closed_paths = []  # Shards of this run already moved into place
+        self._buffered_rows = 0  # Across all open shards
+        os.makedirs(root, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+            return
+        try:
+            self.close()
+        except BaseException:
+            self.abort()
+            raise
+
+    def _partition_key(self, license, score):
+        values = {"license": license, "quality_bucket": quality_bucket(score)}
+        return tuple(values[column] for column in self.partition_by)
+
+    def _partition_dir(self, key):
+        parts = [
+            f"{column}={quote(value, safe='') if value is not None else '__HIVE_DEFAULT_PARTITION__'}"
+            for column, value in zip(self.partition_by, key)
+        ]
+        return os.path.join(self.root, *parts)
+
+    def _shard(self, key):
+        """Returns the open shard writer of a partition, starting a new shard if needed."""
+        writer, number = self._shards.get(key, (None, -1))
+        if writer is not None and writer.bytes_written < self.shard_target_bytes:
+            return writer
+        if writer is not None:
+            self._close_shard(writer)
+
+        directory = self._partition_dir(key)
+        os.makedirs(directory, exist_ok=True)
+        number += 1
+        writer = StreamingParquetWriter(
+            os.path.join(directory, f"part-{self.run_id}-{number:05d}.parquet"),
+            row_group_size=self.row_group_size,
+            schema=self.file_schema,
+        )
+        self._shards[key] = (writer, number)
+        return writer
+
+    def _close_shard(self, writer):
+        self._buffered_rows -= writer.buffered_rows
+        writer.close()
+        self.rows_written += writer.rows_written
+        if writer.rows_written:
+            self.shards_written += 1
+            self._closed_paths.append(writer.path)
+            logger.debug(f"Closed shard '{writer.path}' ({writer.rows_written} rows)")
+
+    def _buffer(self, key, write, data):
+        """Buffers data in the shard of a partition, keeping the total buffer bounded."""
+        writer = self._shard(key)
+        buffered = writer.buffered_rows
+        write(writer, data)
+        self._buffered_rows += writer.buffered_rows - buffered
+        while self._buffered_rows > self.max_buffered_rows:
+            largest = max(
+                (writer for writer, _ in self._shards.values()),
+                key=lambda writer: writer.buffered_rows,
+            )
+            self._buffered_rows -= largest.buffered_rows
+            largest.flush()
+
+    def write(self, record):
+        """Buffers a record in the shard of its partition."""
+        key = self._partition_key(record.get("license"), record.get("quality_score"))
+        self._buffer(key, StreamingParquetWriter.write, record)
+
+    def write_table(self, table):
+        """Splits an Arrow table of records by partition and buffers each part."""
+        rows_by_key = {}
+        for i, key in enumerate(
+            map(
+                self._partition_key,
+                table.column("license").to_pylist(),
+                table.column("quality_score").to_pylist(),
+            )
+        ):
+            rows_by_key.setdefault(key, []).append(i)
+        for key, rows in rows_by_key.items():
+            self._buffer(key, StreamingParquetWriter.write_table, table.take(rows))
+
+    def close(self):
+        """Closes every open shard and writes the dataset metadata files."""
+        for writer, _ in self._shards.values():
+            self._close_shard(writer)
+        self._shards = {}
+        self.write_metadata()
+
+    def abort(self):
+        """Deletes every shard of this run, leaving the dataset as it was."""
+        for writer, _ in self._shards.values():
+            writer.abort()
+        self._shards = {}
+        self._buffered_rows = 0
+        for path in self._closed_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        self._closed_paths = []
+
+    def write_metadata(self):
+        """Writes _common_metadata and a _metadata summary of every shard under the root."""
+        collected = []
+        for path in parquet_files(self.root):
+            metadata = pq.read_metadata(path)
+            metadata.set_file_path(os.path.relpath(path, self.root))
+            collected.append(metadata)
+
+        for name, collector in (("_common_metadata", None), ("_metadata", collected)):
+            path = os.path.join(self.root, name)
+            pq.write_metadata(
+                self.file_schema, f"{path}.tmp", metadata_collector=collector
+            )
+            os.replace(f"{path}.tmp", path)
+        logger.debug(f"Wrote _metadata for {len(collected)} shards in '{self.root}'")
@@ -1,12 +1,32 @@
+import argparse
 import json
 import hashlib
 import os
+import re
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from loguru import logger
 import pyarrow as pa
-import pyarrow.parquet as pq
+import pyarrow.compute as pc
+import pyarrow.json as pj
 
 import settings
+from dedup_index import DedupIndex
 from helpers import sanitize_content  # Import the existing sanitizer
+from near_dedup import NearDuplicateIndex, minhash_signatures
+from parquet_output import (
+    ANNOTATIONS_TYPE,
+    FINDINGS_TYPE,
+    PartitionedDatasetWriter,
+    StreamingParquetWriter,
+)
+from profiling import (
+    add_profiling_arguments,
+    call_profiled,
+    profiler,
+    start_from_args,
+)
 
 logger.remove()
 logger.add("pipeline_debug.log", rotation="10 MB", level="TRACE", encoding="utf-8")
@@ -14,23 +34,149 @@ logger.add(lambda msg: print(msg, end=""), level="DEBUG", format="{message}")
 
 # --- Pipeline Stage Functions ---
 
+# First non-blank character of each line after the first, empty for blank
+# lines. Anchoring on the newline lets the regex engine skip ahead between lines.
+_LINE_START_RE = re.compile(r"\n[^\S\n]*(\S?)")
+_FIRST_LINE_START_RE = re.compile(r"[^\S\n]*(\S?)")
+# Line breaks str.splitlines() splits on besides \n, \r\n and a lone \r
+_OTHER_LINE_BREAKS = ("\v", "\f", "\x1c", "\x1d", "\x1e", "\x85", "\u2028", "\u2029")
+# Keywords suggesting the file contains tests, matched case-insensitively
+TEST_KEYWORDS = ("import unittest", "import pytest", " test", " assert ")
+
+
+@dataclass
+class LineStats:
+    """Line counts and keyword hits of a file, shared by Stage 1 and Stage 2."""
+
+    line_count: int  # Newline count + 1, as stored in the record
+    total_lines: int  # Lines as splitlines() counts them (no trailing empty line)
+    blank_lines: int
+    comment_lines: int
+    code_lines: int
+    has_tests_keyword: bool
+
+
+def analyze_lines(content):
+    """
+    Classifies every line of the content by its first non-blank character in a
+    single regex pass, without splitting the content into lists of lines.
+    Lines are those of str.splitlines(): the rare content with other line
+    breaks than \n and \r\n is split with it instead.
+    """
+    if _has_other_line_breaks(content):
+        return _analyze_split_lines(content)
+    first_chars = Counter(_LINE_START_RE.findall(content))
+    first_chars[_FIRST_LINE_START_RE.match(content).group(1)] += 1
+    line_count = first_chars.total()
+    # The empty "line" after a trailing newline (or of empty content) is not
+    # counted for scoring
+    trailing = 1 if not content or content.endswith("\n") else 0
+    blank_lines = first_chars[""] - trailing
+    comment_lines = first_chars["#"]
+    return LineStats(
+        line_count=line_count,
+        total_lines=line_count - trailing,
+        blank_lines=blank_lines,
+        comment_lines=comment_lines,
+        code_lines=line_count - trailing - blank_lines - comment_lines,
+        has_tests_keyword=has_tests_keyword(content),
+    )
+
+
+def _has_other_line_breaks(content):
+    """
+    Checks for line breaks other than \n and \r\n. Substring checks, unlike
+    a regex, run at memory-scan speed; characters wider than the content's
+    own are ruled out without a scan.
+    """
+    if "\r" in content and content.count("\r") != content.count("\r\n"):
+        return True
+    return any(line_break in content for line_break in _OTHER_LINE_BREAKS)
+
+
+def _analyze_split_lines(content):
+    """analyze_lines over the lines of str.splitlines()."""
+    lines = [line.strip() for line in content.splitlines()]
+    blank_lines = lines.count("")
+    comment_lines = sum(1 for line in lines if line.startswith("#"))
+    return LineStats(
+        line_count=content.count("\n") + 1,
+        total_lines=len(lines),
+        blank_lines=blank_lines,
+        comment_lines=comment_lines,
+        code_lines=len(lines) - blank_lines - comment_lines,
+        has_tests_keyword=has_tests_keyword(content),
+    )
+
+
+def has_tests_keyword(content):
+    """
+    Checks for test keywords, ignoring case.
+    The keywords are lowercase, so an exact match is tried first; the content
+    is only lowercased when none occurs as is.
+    """
+    if any(keyword in content for keyword in TEST_KEYWORDS):
+        return True
+    lowered = content.lower()
+    return any(keyword in lowered for keyword in TEST_KEYWORDS)
+
 
 def calculate_content_hash(content):
     """Calculates the SHA256 hash of the content."""
     return hashlib.sha256(content.encode("utf-8", errors="replace")).hexdigest()
 
 
-def filter_and_sanitize(record, seen_hashes):
+@profiler.timed("dedup")
+def is_duplicate(record, content_hash, seen_hashes):
+    """
+    Checks a content hash against the hashes seen so far.
+    Does not register it: call remember_hash once the record is kept, so
+    records dropped by a later stage (e.g. near-deduplication) leave no hash.
+    """
+    if content_hash in seen_hashes:
+        logger.trace(
+            f"Skipping {record.get('path', 'N/A')} as duplicate content (hash: {content_hash[:8]})"
+        )
+        return True
+    return False
+
+
+def remember_hash(content_hash, seen_hashes):
+    """Registers the hash of a kept record when the deduplication scope is file-level."""
+    if settings.DEDUPLICATION_SCOPE == "file":
+        seen_hashes.add(content_hash)
+
+
+def is_near_duplicate(record, near_duplicates):
+    """
+    Checks a record's MinHash signature against the near-duplicate index.
+    Removes the signature from the record, as it is not part of the output.
+    """
+    signature = record.pop("minhash_signature", None)
+    if signature is None or not near_duplicates.is_near_duplicate(signature):
+        return False
+    logger.trace(f"Skipping {record.get('path', 'N/A')} as a near duplicate")
+    return True
+
+
+def filter_and_sanitize(record, seen_hashes=None, redact=False, stats=None):
     """
     Applies filtering, sanitization, and exact deduplication.
     Returns the processed record if it passes, otherwise None.
+    Deduplication is skipped when seen_hashes is None (e.g. in worker processes,
+    where the parent process owns the seen hashes); otherwise the hash of a
+    passing record is registered, so callers that may still drop it pass None.
+    With redact, PII and secrets in the content are replaced with placeholders;
+    the content hash is still taken over the original content.
+    stats are the LineStats of the content, computed here if not given.
     """
     content = record.get("content")
     if not content:
         return None  # Skip if no content
 
     # Basic Filtering (Example: line count)
-    line_count = content.count("\n") + 1
+    stats = stats or analyze_lines(content)
+    line_count = stats.line_count
     if line_count < settings.MIN_FILE_LINES:
         logger.trace(
             f"Skipping {record.get('path', 'N/A')} due to line count ({line_count} < {settings.MIN_FILE_LINES})"
@@ -38,21 +184,18 @@ def filter_and_sanitize(record, seen_hashes):
         return None
 
     # Calculate Hash for Deduplication
-    content_hash = calculate_content_hash(content)
+    with profiler.stage("hash"):
+        content_hash = calculate_content_hash(content)
 
     # Deduplication Check
-    if content_hash in seen_hashes:
-        logger.trace(
-            f"Skipping {record.get('path', 'N/A')} as duplicate content (hash: {content_hash[:8]})"
-        )
-        return None  # Skip duplicate
-
-    # Add hash to seen set *only if* scope is file-level
-    if settings.DEDUPLICATION_SCOPE == "file":
-        seen_hashes.add(content_hash)
+    if seen_hashes is not None:
+        if is_duplicate(record, content_hash, seen_hashes):
+            return None  # Skip duplicate
+        remember_hash(content_hash, seen_hashes)
 
     # Sanitization (PII/Secrets)
-    findings = sanitize_content(content)
+    with profiler.stage("sanitize"):
+        record["content"], findings = sanitize_content(content, redact=redact)
 
     # Add hash and findings to the record
     record["processed_content_hash"] = content_hash
@@ -66,25 +209,21 @@ def filter_and_sanitize(record, seen_hashes):
     return record
 
 
-def score_and_annotate(record):
+def score_and_annotate(record, stats=None):
     """
     Applies scoring heuristics and adds annotations.
     Returns the annotated record.
+    stats are the LineStats of the content, computed here if not given.
     """
-    content = record.get("content", "")
-    lines = content.splitlines()
-    code_lines = [
-        line for line in lines if line.strip() and not line.strip().startswith("#")
-    ]
-    comment_lines = [line for line in lines if line.strip().startswith("#")]
+    stats = stats or analyze_lines(record.get("content", ""))
 
     score = 0.0
     annotations = {}
 
-    total_lines = len(lines)
+    total_lines = stats.total_lines
     if total_lines > 0:
-        comment_ratio = len(comment_lines) / total_lines
-        density = len(code_lines) / total_lines
+        comment_ratio = stats.comment_lines / total_lines
+        density = stats.code_lines / total_lines
         annotations["comment_ratio"] = round(comment_ratio, 3)
         annotations["code_density"] = round(density, 3)
 
@@ -94,10 +233,7 @@ def score_and_annotate(record):
             score += 0.2
 
     # Check for test keywords (very basic)
-    if any(
-        kw in content.lower()
-        for kw in ["import unittest", "import pytest", " test", " assert "]
-    ):
+    if stats.has_tests_keyword:
         annotations["has_tests_keyword"] = True
         score += 0.3
     else:
@@ -111,106 +247,535 @@ def score_and_annotate(record):
     return record
 
 
-# --- Main Pipeline Execution ---
+# --- Batch Execution ---
 
+# Outcome of a raw line after Stage 1 and Stage 2
+RESULT_INVALID = "invalid"
+RESULT_FILTERED = "filtered"
+RESULT_KEPT = "kept"
 
-def run_pipeline():
-    """Runs the full data processing pipeline."""
-    logger.info("Starting data processing pipeline...")
 
-    if not os.path.exists(settings.RAW_OUTPUT_FILE):
-        logger.error(f"Raw input file not found: {settings.RAW_OUTPUT_FILE}")
+def process_batch(lines, near_dedup=False, redact=False):
+    """
+    Runs Stage 1 (without deduplication) and Stage 2 over a batch of raw JSONL lines.
+    Returns one (outcome, payload) tuple per line, in input order. The payload is
+    the scored record for kept lines and the raw line for invalid ones.
+    With near_dedup, kept records also carry their MinHash signature, computed
+    for the whole batch at once.
+    Safe to run in worker processes: it does not touch any shared state.
+    """
+    results = []
+    for line in lines:
+        try:
+            with profiler.stage("parse"):
+                raw_record = json.loads(line)
+        except json.JSONDecodeError:
+            results.append((RESULT_INVALID, line))
+            continue
+
+        # Analyze the original content once for both stages
+        with profiler.stage("analyze_lines"):
+            stats = analyze_lines(raw_record.get("content") or "")
+        processed_record = filter_and_sanitize(raw_record, redact=redact, stats=stats)
+        if processed_record:
+            with profiler.stage("score_and_annotate"):
+                processed_record = score_and_annotate(processed_record, stats)
+            results.append((RESULT_KEPT, processed_record))
+        else:
+            results.append((RESULT_FILTERED, None))
+
+    if near_dedup:
+        kept = [payload for outcome, payload in results if outcome == RESULT_KEPT]
+        with profiler.stage("minhash", items=len(kept)):
+            signatures = minhash_signatures([record["content"] for record in kept])
+        for record, signature in zip(kept, signatures):
+            record["minhash_signature"] = signature
+    return results
+
+
+def iter_batches(lines, batch_size):
+    """Groups an iterable of lines into lists of at most batch_size lines."""
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_processed_batches(batches, workers, batch_function=None, **options):
+    """
+    Yields batch_function (process_batch by default) results in input order,
+    passing options on to it.
+    Batches run inline when workers <= 1, otherwise across a process pool with a
+    bounded number of batches in flight so the reader never runs far ahead.
+    When profiling, the stage timings of each worker batch are merged into
+    this process's profiler.
+    """
+    batch_function = batch_function or process_batch
+    if workers <= 1:
+        for batch in batches:
+            yield batch_function(batch, **options)
         return
 
-    processed_records = []
-    seen_content_hashes = set()  # For file-level deduplication
-    records_read = 0
-    records_filtered = 0
-    records_deduplicated = 0
-
-    logger.info(
-        f"Stage 1: Reading '{settings.RAW_OUTPUT_FILE}', Filtering, Sanitizing, Deduplicating..."
-    )
-
-    # Process line by line to handle large files
-    with open(settings.RAW_OUTPUT_FILE, "r", encoding="utf-8") as infile:
-        for line in infile:
-            records_read += 1
+    profiled = profiler.enabled
+
+    def result_of(future):
+        with profiler.stage("wait_for_workers"):
+            result = future.result()
+        if not profiled:
+            return result
+        result, timings = result
+        profiler.merge(timings)
+        return result
+
+    max_pending = workers * settings.PIPELINE_MAX_PENDING_BATCHES_PER_WORKER
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for batch in batches:
+            if profiled:
+                future = executor.submit(
+                    call_profiled, batch_function, batch, **options
+                )
+            else:
+                future = executor.submit(batch_function, batch, **options)
+            pending.append(future)
+            if len(pending) >= max_pending:
+                yield result_of(pending.popleft())
+        while pending:
+            yield result_of(pending.popleft())
+
+
+# --- Arrow Execution ---
+
+# Columns of the raw crawl output
+RAW_SCHEMA = pa.schema(
+    [
+        ("repo_url", pa.string()),
+        ("path", pa.string()),
+        ("size", pa.int64()),
+        ("license", pa.string()),
+        ("content_sha", pa.string()),
+        ("content", pa.string()),
+    ]
+)
+_RAW_PARSE_OPTIONS = pj.ParseOptions(
+    explicit_schema=RAW_SCHEMA, unexpected_field_behavior="ignore"
+)
+# RE2 equivalents of analyze_lines (Arrow regexes only know ASCII whitespace)
+_BLANK_LINE_RE = r"(?m)^[^\S\n]*\n"  # Blank lines followed by a newline
+_BLANK_LAST_LINE_RE = r"(?:\A|\n)[^\S\n]*\z"
+_COMMENT_LINE_RE = r"(?m)^[^\S\n]*#"
+_OTHER_LINE_BREAK_RE2 = r"\r(?:[^\n]|\z)|[\v\f\x1c-\x1e\x{85}\x{2028}\x{2029}]"
+_TEST_KEYWORDS_PATTERN = "|".join(TEST_KEYWORDS)
+
+
+def read_raw_table(lines):
+    """
+    Parses raw JSONL lines (bytes) into an Arrow table with RAW_SCHEMA.
+    Returns (table, invalid lines). The lines are parsed together by the Arrow
+    JSON reader; only a batch containing an invalid line is parsed line by line.
+    """
+    data = b"".join(lines)
+    # One block per batch, so no record straddles a block boundary
+    read_options = pj.ReadOptions(block_size=min(len(data) + 1, 2**31 - 1))
+    try:
+        table = pj.read_json(
+            pa.BufferReader(data),
+            read_options=read_options,
+            parse_options=_RAW_PARSE_OPTIONS,
+        )
+        return table, []
+    except pa.ArrowInvalid:
+        records, invalid_lines = [], []
+        for line in lines:
             try:
-                raw_record = json.loads(line)
+                records.append(json.loads(line))
             except json.JSONDecodeError:
-                logger.warning(f"Skipping invalid JSON line: {line.strip()}")
-                continue
+                invalid_lines.append(line.decode("utf-8", errors="replace"))
+        return pa.Table.from_pylist(records, schema=RAW_SCHEMA), invalid_lines
 
-            # Apply Stage 1: Filter, Sanitize, Deduplicate
-            processed_record = filter_and_sanitize(raw_record, seen_content_hashes)
 
-            if processed_record:
-                processed_records.append(processed_record)
-            else:
-                # Crude way to check if it was deduplicated vs other filters
-                temp_hash = calculate_content_hash(raw_record.get("content", ""))
-                if temp_hash in seen_content_hashes:
-                    records_deduplicated += 1
-                else:
-                    records_filtered += (
-                        1  # Filtered for other reasons (size, lines, etc.)
-                    )
+def _round_like_python(values, ndigits=3):
+    """
+    Rounds a float array exactly like round(value, ndigits). pc.round scales
+    values before rounding, so values just below a half can round up; the
+    few distinct values of a batch are rounded in Python instead.
+    """
+    distinct = pc.unique(values)
+    rounded = pa.array(
+        [
+            None if value is None else round(value, ndigits)
+            for value in distinct.to_pylist()
+        ],
+        pa.float64(),
+    )
+    return pc.take(rounded, pc.index_in(values, value_set=distinct))
 
-            if records_read % 1000 == 0:
-                logger.debug(
-                    f"Read: {records_read}, Filtered: {records_filtered}, Deduplicated: {records_deduplicated}, Kept: {len(processed_records)}"
-                )
 
-    logger.info(
-        f"Finished Stage 1. Read: {records_read}, Filtered: {records_filtered}, Deduplicated: {records_deduplicated}, Kept: {len(processed_records)}"
+def score_and_annotate_arrow(content, line_count):
+    """
+    Stage 2 over a whole column of contents with Arrow compute kernels.
+    Mirrors analyze_lines and score_and_annotate, and returns
+    (quality_score, annotations) arrays with the same values. Like
+    analyze_lines, the rare contents with line breaks other than \n and \r\n
+    are scored in Python over str.splitlines() instead.
+    """
+    trailing = pc.cast(pc.ends_with(content, "\n"), pa.int64())
+    total = pc.subtract(line_count, trailing)
+    blank = pc.subtract(
+        pc.add(
+            pc.cast(pc.count_substring_regex(content, _BLANK_LINE_RE), pa.int64()),
+            pc.cast(pc.match_substring_regex(content, _BLANK_LAST_LINE_RE), pa.int64()),
+        ),
+        trailing,
+    )
+    comment = pc.cast(pc.count_substring_regex(content, _COMMENT_LINE_RE), pa.int64())
+    code = pc.subtract(pc.subtract(total, blank), comment)
+
+    # Null ratios for files without lines, like the missing keys of score_and_annotate
+    total = pc.if_else(
+        pc.greater(total, 0),
+        pc.cast(total, pa.float64()),
+        pa.scalar(None, pa.float64()),
+    )
+    comment_ratio = pc.divide(pc.cast(comment, pa.float64()), total)
+    density = pc.divide(pc.cast(code, pa.float64()), total)
+    has_tests = pc.match_substring_regex(
+        content, _TEST_KEYWORDS_PATTERN, ignore_case=True
+    )
+
+    score = pc.fill_null(pc.multiply(density, 0.5), 0.0)
+    comments_in_range = pc.and_(
+        pc.greater(comment_ratio, 0.05), pc.less(comment_ratio, 0.3)
+    )
+    score = pc.add(score, pc.if_else(pc.fill_null(comments_in_range, False), 0.2, 0.0))
+    score = pc.add(score, pc.if_else(has_tests, 0.3, 0.0))
+    # Clamp score between 0 and 1
+    score = _round_like_python(
+        pc.min_element_wise(pc.max_element_wise(score, 0.0), 1.0)
+    )
+
+    annotations = pa.StructArray.from_arrays(
+        [_round_like_python(comment_ratio), _round_like_python(density), has_tests],
+        fields=list(ANNOTATIONS_TYPE),
     )
 
-    if not processed_records:
-        logger.warning(
-            "No records remaining after filtering and deduplication. Exiting."
+    other_line_breaks = pc.match_substring_regex(content, _OTHER_LINE_BREAK_RE2)
+    if pc.any(other_line_breaks).as_py():
+        scores = score.to_pylist()
+        annotation_rows = annotations.to_pylist()
+        for i in pc.indices_nonzero(other_line_breaks).to_pylist():
+            record = score_and_annotate({"content": content[i].as_py()})
+            scores[i] = record["quality_score"]
+            annotation_rows[i] = record["annotations"]
+        score = pa.array(scores, pa.float64())
+        annotations = pa.array(annotation_rows, ANNOTATIONS_TYPE)
+    return score, annotations
+
+
+def process_arrow_batch(lines, near_dedup=False, redact=False):
+    """
+    Runs Stage 1 (without deduplication) and Stage 2 over a batch of raw JSONL
+    lines as one Arrow table. Line counts, filtering and scoring are Arrow
+    compute kernels over whole columns; hashing and sanitization still run per
+    record. Returns (table, MinHash signatures or None, invalid lines, number
+    of filtered records). Safe to run in worker processes.
+    """
+    with profiler.stage("parse", items=len(lines)):
+        table, invalid_lines = read_raw_table(lines)
+
+    # Stage 1: filtering
+    with profiler.stage("filter", items=table.num_rows):
+        content = table.column("content").combine_chunks()
+        line_count = pc.add(pc.cast(pc.count_substring(content, "\n"), pa.int64()), 1)
+        passes = pc.fill_null(
+            pc.and_(
+                pc.greater(pc.utf8_length(content), 0),
+                pc.greater_equal(line_count, settings.MIN_FILE_LINES),
+            ),
+            False,
         )
-        return
+        table = table.filter(passes)
+        filtered = len(passes) - table.num_rows
+        content = content.filter(passes)
+        line_count = line_count.filter(passes)
+
+    # Stage 1: hashing and sanitization, on the original content
+    contents = content.to_pylist()
+    with profiler.stage("hash", items=len(contents)):
+        hashes = [calculate_content_hash(text) for text in contents]
+    with profiler.stage("sanitize", items=len(contents)):
+        sanitized = [sanitize_content(text, redact=redact) for text in contents]
+
+    # Stage 2: scoring, on the original content like the record path
+    with profiler.stage("score_and_annotate", items=len(contents)):
+        quality_score, annotations = score_and_annotate_arrow(content, line_count)
+
+    if redact:
+        contents = [text for text, _ in sanitized]
+        table = table.set_column(
+            table.schema.get_field_index("content"),
+            "content",
+            pa.array(contents, pa.string()),
+        )
+    table = (
+        table.append_column("processed_content_hash", pa.array(hashes, pa.string()))
+        .append_column(
+            "sanitization_findings",
+            pa.array([findings for _, findings in sanitized], FINDINGS_TYPE),
+        )
+        .append_column("line_count", line_count)
+        .append_column("quality_score", quality_score)
+        .append_column("annotations", annotations)
+    )
+    signatures = None
+    if near_dedup:
+        with profiler.stage("minhash", items=len(contents)):
+            signatures = minhash_signatures(contents)
+    return table, signatures, invalid_lines, filtered
 
-    logger.info("Stage 2: Scoring and Annotating...")
-    scored_records = []
-    for i, record in enumerate(processed_records):
-        scored_record = score_and_annotate(record)
-        scored_records.append(scored_record)
-        if (i + 1) % 1000 == 0:
-            logger.debug(f"Scored {i + 1}/{len(processed_records)} records.")
 
-    logger.info(f"Finished Stage 2. Scored {len(scored_records)} records.")
+# --- Main Pipeline Execution ---
 
-    # Optional: Save intermediate scored data as jsonl for inspection
-    # logger.info(f"Saving intermediate scored data to {settings.SCORED_OUTPUT_FILE}...")
-    # with open(settings.SCORED_OUTPUT_FILE, 'w', encoding='utf-8') as outfile:
-    #     for record in scored_records:
-    #         outfile.write(json.dumps(record) + '\n')
 
-    logger.info("Stage 3: Converting to Parquet format...")
-    try:
-        # Define the schema (optional but good practice)
-        # Inferring schema can work but explicit is safer
-        # NOTE: PyArrow might struggle with nested dicts ('annotations', 'findings') directly
-        # We might need to flatten or serialize them first for robust Parquet writing.
+def format_counts(counts):
+    """Formats the record counters of a pipeline run for logging."""
+    return (
+        f"Read: {counts['read']}, Filtered: {counts['filtered']}, "
+        f"Deduplicated: {counts['deduplicated']}, "
+        f"Near-duplicates: {counts['near_duplicates']}, Kept: {counts['kept']}"
+    )
 
-        table = pa.Table.from_pylist(scored_records)
 
-        # Write table to Parquet file
-        pq.write_table(table, settings.FINAL_PARQUET_FILE, compression="snappy")
+def run_record_stages(writer, counts, seen_hashes, near_duplicates, workers, redact):
+    """Streams raw records through the stages as Python dicts."""
+    with open(settings.RAW_OUTPUT_FILE, "r", encoding="utf-8") as infile:
+        batches = iter_batches(infile, settings.PIPELINE_BATCH_SIZE)
+        for results in iter_processed_batches(
+            batches, workers, near_dedup=near_duplicates is not None, redact=redact
+        ):
+            for outcome, payload in results:
+                counts["read"] += 1
+
+                if outcome == RESULT_INVALID:
+                    logger.warning(f"Skipping invalid JSON line: {payload.strip()}")
+                elif outcome == RESULT_FILTERED:
+                    # Filtered for other reasons (size, lines, etc.)
+                    counts["filtered"] += 1
+                elif is_duplicate(
+                    payload, payload["processed_content_hash"], seen_hashes
+                ):
+                    counts["deduplicated"] += 1
+                elif near_duplicates is not None and is_near_duplicate(
+                    payload, near_duplicates
+                ):
+                    counts["near_duplicates"] += 1
+                else:
+                    remember_hash(payload["processed_content_hash"], seen_hashes)
+                    # Apply Stage 3: Buffer for the next row group
+                    writer.write(payload)
+                    counts["kept"] += 1
+
+                if counts["read"] % 1000 == 0:
+                    logger.debug(format_counts(counts))
+
+
+def run_arrow_stages(writer, counts, seen_hashes, near_duplicates, workers, redact):
+    """Streams raw records through the stages as Arrow tables."""
+    with open(settings.RAW_OUTPUT_FILE, "rb") as infile:
+        batches = iter_batches(infile, settings.ARROW_BATCH_SIZE)
+        for table, signatures, invalid_lines, filtered in iter_processed_batches(
+            batches,
+            workers,
+            batch_function=process_arrow_batch,
+            near_dedup=near_duplicates is not None,
+            redact=redact,
+        ):
+            for line in invalid_lines:
+                logger.warning(f"Skipping invalid JSON line: {line.strip()}")
+            counts["read"] += len(invalid_lines) + filtered + table.num_rows
+            counts["filtered"] += filtered
+
+            # Deduplication stays per record, in input order
+            keep = []
+            paths = table.column("path").to_pylist()
+            hashes = table.column("processed_content_hash").to_pylist()
+            for i, (path, content_hash) in enumerate(zip(paths, hashes)):
+                if is_duplicate({"path": path}, content_hash, seen_hashes):
+                    counts["deduplicated"] += 1
+                    keep.append(False)
+                elif (
+                    near_duplicates is not None
+                    and signatures[i] is not None
+                    and near_duplicates.is_near_duplicate(signatures[i])
+                ):
+                    counts["near_duplicates"] += 1
+                    keep.append(False)
+                else:
+                    remember_hash(content_hash, seen_hashes)
+                    keep.append(True)
+
+            kept = table.filter(pa.array(keep, pa.bool_()))
+            # Apply Stage 3: Buffer for the next row group
+            writer.write_table(kept)
+            counts["kept"] += kept.num_rows
+            logger.debug(format_counts(counts))
+
+
+def run_pipeline(
+    workers=None,
+    dedup_index_path=None,
+    near_dedup=None,
+    redact=None,
+    engine=None,
+    dataset_dir=None,
+):
+    """
+    Runs the full data processing pipeline.
+    With a dedup index, content shipped by earlier runs is dropped as duplicate
+    and the hashes of kept records are committed to the index on success.
+    The 'arrow' engine runs Stage 1 filtering and Stage 2 with Arrow compute
+    kernels over whole batches instead of per-record Python code.
+    With a dataset directory, the output is a Hive-partitioned dataset of
+    Parquet shards instead of a single file.
+    """
+    workers = workers or settings.PIPELINE_WORKERS
+    engine = engine or settings.PIPELINE_ENGINE
+    if near_dedup is None:
+        near_dedup = settings.NEAR_DEDUPLICATION
+    if redact is None:
+        redact = settings.SANITIZE_MODE == "redact"
+    logger.info(
+        f"Starting data processing pipeline with the {engine} engine and {workers} worker(s)..."
+    )
+
+    if not os.path.exists(settings.RAW_OUTPUT_FILE):
+        logger.error(f"Raw input file not found: {settings.RAW_OUTPUT_FILE}")
+        return
+
+    if dedup_index_path:
+        seen_content_hashes = DedupIndex(dedup_index_path)
         logger.info(
-            f"Finished Stage 3. Final dataset saved to '{settings.FINAL_PARQUET_FILE}'"
+            f"Deduplicating against {len(seen_content_hashes)} hashes in '{dedup_index_path}'"
         )
+    else:
+        seen_content_hashes = set()  # For file-level deduplication
+    near_duplicates = NearDuplicateIndex() if near_dedup else None
+    counts = Counter(read=0, filtered=0, deduplicated=0, near_duplicates=0, kept=0)
+    run_stages = run_arrow_stages if engine == "arrow" else run_record_stages
+    if dataset_dir:
+        writer = PartitionedDatasetWriter(dataset_dir)
+        output = (
+            f"dataset '{dataset_dir}' (partitioned by {', '.join(writer.partition_by)})"
+        )
+    else:
+        writer = StreamingParquetWriter(settings.FINAL_PARQUET_FILE)
+        output = f"'{settings.FINAL_PARQUET_FILE}'"
+
+    # Records flow through every stage in batches and are streamed to the
+    # Parquet file in row groups, so memory does not grow with the dataset.
+    # Stage 1 and Stage 2 may run in worker processes; deduplication always
+    # happens here, in input order, so results are exact and deterministic.
+    logger.info(
+        f"Reading '{settings.RAW_OUTPUT_FILE}' and streaming records through "
+        f"Filter/Sanitize (Stage 1), Score/Annotate (Stage 2), Deduplicate, "
+        f"{'Near-deduplicate, ' if near_dedup else ''}and "
+        f"Parquet output (Stage 3, {output}, row groups of {settings.PARQUET_ROW_GROUP_SIZE})..."
+    )
+
+    try:
+        with writer:
+            run_stages(
+                writer,
+                counts,
+                seen_content_hashes,
+                near_duplicates,
+                workers,
+                redact,
+            )
 
     except Exception as e:
         logger.error(f"Failed to write Parquet file: {e}")
-        logger.error(
-            "Consider flattening nested structures (findings, annotations) or ensuring consistent keys if errors persist."
+        if isinstance(seen_content_hashes, DedupIndex):
+            seen_content_hashes.rollback()
+            seen_content_hashes.close()
+        return
+
+    if isinstance(seen_content_hashes, DedupIndex):
+        seen_content_hashes.commit()
+        logger.info(
+            f"Dedup index '{dedup_index_path}' now holds {len(seen_content_hashes)} hashes"
         )
+        seen_content_hashes.close()
+
+    logger.info(f"Finished processing. {format_counts(counts)}")
+    for name, count in counts.items():
+        profiler.count(name, count)
+
+    if not counts["kept"]:
+        logger.warning("No records remaining after filtering and deduplication.")
+    else:
+        logger.info(f"Finished Stage 3. Final dataset saved to {output}")
 
     logger.info("Data processing pipeline finished.")
 
 
+def parse_args():
+    """Parses command line arguments for the pipeline."""
+    parser = argparse.ArgumentParser(description="Run the data processing pipeline.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.PIPELINE_WORKERS,
+        help="Number of worker processes for Stage 1 and Stage 2 (1 runs inline).",
+    )
+    parser.add_argument(
+        "--dedup-index",
+        default=settings.DEDUP_INDEX_FILE,
+        help="Persistent index of content hashes shipped by earlier runs, "
+        "created if missing.",
+    )
+    parser.add_argument(
+        "--near-dedup",
+        action=argparse.BooleanOptionalAction,
+        default=settings.NEAR_DEDUPLICATION,
+        help="MinHash LSH near-duplicate detection (off by default).",
+    )
+    parser.add_argument(
+        "--redact",
+        action="store_true",
+        default=settings.SANITIZE_MODE == "redact",
+        help="Replace PII and secrets in the content with typed placeholders.",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=["python", "arrow"],
+        default=settings.PIPELINE_ENGINE,
+        help="Run Stage 1 and Stage 2 per record ('python') or over Arrow batches ('arrow').",
+    )
+    parser.add_argument(
+        "--dataset-dir",
+        default=settings.FINAL_DATASET_DIR,
+        help="Write a Hive-partitioned dataset of Parquet shards to this directory "
+        "instead of a single Parquet file.",
+    )
+    add_profiling_arguments(parser, settings.PIPELINE_PROFILE_FILE)
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    run_pipeline()
+    args = parse_args()
+    profile_path = start_from_args(args, settings.PIPELINE_PROFILE_FILE)
+    run_pipeline(
+        workers=args.workers,
+        dedup_index_path=args.dedup_index,
+        near_dedup=args.near_dedup,
+        redact=args.redact,
+        engine=args.engine,
+        dataset_dir=args.dataset_dir,
+    )
+    if profile_path:
+        profiler.write_summary(profile_path, args.cprofile)
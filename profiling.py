@@ -0,0 +1,296 @@
+import cProfile
+import inspect
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import nullcontext
+from functools import wraps
+
+from loguru import logger
+
+import settings
+
+# Returned by Profiler.stage while profiling is off; reusable, and does nothing
+_DISABLED_STAGE = nullcontext()
+
+
+class _StageTimer:
+    """Adds the wall-clock time spent in a with block to one stage of a Profiler."""
+
+    __slots__ = ("profiler", "name", "items", "start")
+
+    def __init__(self, profiler, name, items):
+        self.profiler = profiler
+        self.name = name
+        self.items = items
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.add(self.name, time.perf_counter() - self.start, self.items)
+
+
+class Profiler:
+    """
+    Wall-clock timers and item counts per named stage, plus free-form counters,
+    with optional cProfile and tracemalloc sampling of the whole run.
+    Off until start() is called; while off, stage() hands back a shared no-op
+    context manager and timed() functions call straight through, so
+    instrumented code pays one attribute check per call.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._cprofile = None
+        self._started = None
+        self._stopped = None
+        self.reset()
+
+    def reset(self):
+        """Clears the stage timings and counters."""
+        self.seconds = Counter()
+        self.calls = Counter()
+        self.items = Counter()
+        self.counters = Counter()
+
+    def start(self, cprofile=False, tracemalloc_frames=0):
+        """
+        Turns the stage timers on, and cProfile and tracemalloc (keeping
+        tracemalloc_frames frames per allocation) when asked for.
+        """
+        self.enabled = True
+        self._started = time.perf_counter()
+        if tracemalloc_frames:
+            tracemalloc.start(tracemalloc_frames)
+        if cprofile:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def stop(self):
+        """Stops cProfile and the wall clock; the timings are kept for the summary."""
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        self._stopped = time.perf_counter()
+
+    def stage(self, name, items=1):
+        """Context manager timing a with block as one call of a stage, covering items."""
+        if not self.enabled:
+            return _DISABLED_STAGE
+        return _StageTimer(self, name, items)
+
+    def timed(self, name):
+        """Decorator timing every call of a function or coroutine function as a stage."""
+
+        def decorator(function):
+            if inspect.iscoroutinefunction(function):
+
+                @wraps(function)
+                async def wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await function(*args, **kwargs)
+                    start = time.perf_counter()
+                    try:
+                        return await function(*args, **kwargs)
+                    finally:
+                        self.add(name, time.perf_counter() - start)
+
+            else:
+
+                @wraps(function)
+                def wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return function(*args, **kwargs)
+                    start = time.perf_counter()
+                    try:
+                        return function(*args, **kwargs)
+                    finally:
+                        self.add(name, time.perf_counter() - start)
+
+            return wrapper
+
+        return decorator
+
+    def add(self, name, seconds, items=1):
+        """Records one call of a stage."""
+        self.seconds[name] += seconds
+        self.calls[name] += 1
+        self.items[name] += items
+
+    def count(self, name, amount=1):
+        """Increments a counter, when profiling."""
+        if self.enabled:
+            self.counters[name] += amount
+
+    def snapshot(self):
+        """The stage timings and counters, as plain dicts that can cross processes."""
+        return {
+            "seconds": dict(self.seconds),
+            "calls": dict(self.calls),
+            "items": dict(self.items),
+            "counters": dict(self.counters),
+        }
+
+    def merge(self, snapshot):
+        """Adds the timings and counters of a snapshot, e.g. from a worker process."""
+        self.seconds.update(snapshot["seconds"])
+        self.calls.update(snapshot["calls"])
+        self.items.update(snapshot["items"])
+        self.counters.update(snapshot["counters"])
+
+    def summary(self, top=None):
+        """
+        Machine-readable summary of the run: wall time, every stage (slowest
+        first) with its calls, items and throughput, the counters, and the
+        top functions and allocation sites when cProfile or tracemalloc ran.
+        Stage times of worker processes are included, so with several workers
+        (or concurrent requests) they may add up to more than the wall time.
+        """
+        top = top or settings.PROFILE_TOP_ENTRIES
+        end = self._stopped or time.perf_counter()
+        stages = {}
+        for name, seconds in self.seconds.most_common():
+            stages[name] = {
+                "seconds": round(seconds, 6),
+                "calls": self.calls[name],
+                "items": self.items[name],
+                "mean_ms": round(seconds * 1000 / self.calls[name], 4),
+                "items_per_second": round(self.items[name] / seconds, 1)
+                if seconds
+                else None,
+            }
+        summary = {
+            "wall_seconds": round(end - self._started, 6) if self._started else None,
+            "pid": os.getpid(),
+            "stages": stages,
+            "counters": dict(self.counters),
+        }
+        if self._cprofile is not None:
+            summary["cprofile"] = self._cprofile_top(top)
+        if tracemalloc.is_tracing():
+            summary["tracemalloc"] = self._tracemalloc_top(top)
+        return summary
+
+    def _cprofile_top(self, top):
+        """The functions with the most cumulative time, from cProfile."""
+        stats = pstats.Stats(self._cprofile, stream=io.StringIO())
+        entries = []
+        for (filename, line, function), (
+            primitive_calls,
+            calls,
+            total_time,
+            cumulative_time,
+            _,
+        ) in stats.stats.items():
+            entries.append(
+                {
+                    "function": f"{filename}:{line}({function})",
+                    "calls": calls,
+                    "primitive_calls": primitive_calls,
+                    "tottime": round(total_time, 6),
+                    "cumtime": round(cumulative_time, 6),
+                }
+            )
+        entries.sort(key=lambda entry: entry["cumtime"], reverse=True)
+        return entries[:top]
+
+    def _tracemalloc_top(self, top):
+        """Current and peak traced memory, and the largest allocation sites."""
+        current, peak = tracemalloc.get_traced_memory()
+        statistics = tracemalloc.take_snapshot().statistics("traceback")
+        return {
+            "current_mb": round(current / 1e6, 3),
+            "peak_mb": round(peak / 1e6, 3),
+            "top": [
+                {
+                    "traceback": [str(frame) for frame in statistic.traceback],
+                    "size_mb": round(statistic.size / 1e6, 3),
+                    "blocks": statistic.count,
+                }
+                for statistic in statistics[:top]
+            ],
+        }
+
+    def write_summary(self, path, cprofile_path=None):
+        """
+        Stops the profiler and writes its summary as JSON to path, and the raw
+        cProfile stats (for pstats or snakeviz) to cprofile_path.
+        """
+        self.stop()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+        logger.info(f"Profile summary written to '{path}'")
+        if cprofile_path and self._cprofile is not None:
+            self._cprofile.dump_stats(cprofile_path)
+            logger.info(f"cProfile stats written to '{cprofile_path}'")
+
+
+# The process-wide profiler that instrumented modules report to
+profiler = Profiler()
+
+
+def call_profiled(function, *args, **kwargs):
+    """
+    Calls function in a worker process with the stage timers on, returning
+    (result, snapshot of the timings of this call) for the parent to merge.
+    cProfile and tracemalloc inherited from a forked parent are turned off,
+    as their results would be lost with the worker.
+    """
+    if profiler._cprofile is not None:
+        profiler._cprofile.disable()
+        profiler._cprofile = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    profiler.reset()
+    profiler.enabled = True
+    result = function(*args, **kwargs)
+    return result, profiler.snapshot()
+
+
+def add_profiling_arguments(parser, default_summary_file):
+    """Adds the --profile, --cprofile and --tracemalloc options to an argument parser."""
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=default_summary_file,
+        default=None,
+        metavar="PATH",
+        help="Time every stage and write a JSON summary to PATH "
+        f"(default '{default_summary_file}').",
+    )
+    parser.add_argument(
+        "--cprofile",
+        metavar="PATH",
+        help="Also run cProfile, adding the top functions to the summary "
+        "and writing the raw stats to PATH. Implies --profile.",
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        type=int,
+        nargs="?",
+        const=settings.TRACEMALLOC_FRAMES,
+        default=0,
+        metavar="FRAMES",
+        help="Also trace memory allocations, adding the peak and the largest "
+        "allocation sites to the summary. Implies --profile.",
+    )
+
+
+def start_from_args(args, default_summary_file):
+    """
+    Starts the profiler as asked for on the command line.
+    Returns the path of the JSON summary, or None when not profiling.
+    """
+    summary_path = args.profile
+    if summary_path is None and (args.cprofile or args.tracemalloc):
+        summary_path = default_summary_file
+    if summary_path is not None:
+        profiler.start(
+            cprofile=bool(args.cprofile), tracemalloc_frames=args.tracemalloc
+        )
+    return summary_path
@@ -0,0 +1,201 @@
+import asyncio
+import time
+
+from loguru import logger
+
+import settings
+from retry import parse_retry_after
+
+
+class TokenBucket:
+    """
+    Async token bucket pacing requests against one GitHub rate-limit resource.
+    Tokens refill continuously. Every response re-derives the refill rate from
+    X-RateLimit-Remaining/Reset so the remaining quota is spread evenly over
+    what is left of the window, instead of being burned early and then
+    waiting out the reset.
+    """
+
+    def __init__(self, name, quota, window, capacity, max_rate):
+        self.name = name
+        rate = quota / window
+        self.initial_rate = min(rate, max_rate)
+        self.rate = self.initial_rate  # Tokens per second
+        self.capacity = capacity
+        self.max_rate = max_rate
+        self.tokens = float(capacity)
+        # Quota left in the current window: the last reported value, minus the
+        # requests reserved since then
+        self.remaining = quota
+        self.reset_at = None  # Epoch time at which the window resets
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0  # Monotonic time before which nothing may be sent
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    async def acquire(self):
+        """Waits until a request may be sent and takes a token for it."""
+        # The lock queues waiters in FIFO order, so requests go out in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def reserve(self):
+        """Counts a request about to be sent against the remaining quota estimate."""
+        self.remaining -= 1
+
+    def blocked_for(self):
+        """Seconds until this bucket accepts requests again (0 if it is not blocked)."""
+        return max(0.0, self._blocked_until - time.monotonic())
+
+    def block_for(self, seconds):
+        """Stops all requests on this bucket for the given number of seconds."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    def update(self, remaining, reset_at):
+        """Adapts the refill rate to the quota reported by the latest response."""
+        self._refill()
+        self.remaining = remaining
+        self.reset_at = reset_at
+        window = max(reset_at - time.time(), 1.0)
+        usable = remaining - settings.RATE_LIMIT_SAFETY_MARGIN
+
+        if usable <= 0:
+            logger.warning(
+                f"{self.name} rate limit nearly exhausted ({remaining} left). "
+                f"Pausing for {window + settings.RATE_LIMIT_SLEEP_BUFFER:.2f} seconds."
+            )
+            self.block_for(window + settings.RATE_LIMIT_SLEEP_BUFFER)
+            # The next window starts with a fresh quota
+            self.rate = self.initial_rate
+            return
+
+        self.rate = min(usable / window, self.max_rate)
+        # Never hold more tokens than the quota left in the window
+        self.tokens = min(self.tokens, usable)
+
+
+class RateLimiter:
+    """Separate token buckets for the GitHub 'core' and 'search' rate limits."""
+
+    def __init__(self, label="core"):
+        self.buckets = {
+            "core": TokenBucket(
+                f"{label} core",
+                settings.CORE_RATE_LIMIT_PER_HOUR,
+                3600,
+                settings.CORE_BURST,
+                settings.CORE_MAX_REQUESTS_PER_SECOND,
+            ),
+            "search": TokenBucket(
+                f"{label} search",
+                settings.SEARCH_RATE_LIMIT_PER_MINUTE,
+                60,
+                settings.SEARCH_BURST,
+                settings.SEARCH_RATE_LIMIT_PER_MINUTE / 60,
+            ),
+        }
+
+    def bucket(self, resource):
+        return self.buckets[resource]
+
+    def update(self, resource, response_headers):
+        """Feeds the rate-limit headers of a response to the bucket it counted against."""
+        remaining = response_headers.get("X-RateLimit-Remaining")
+        reset_time = response_headers.get("X-RateLimit-Reset")
+        if remaining is None or reset_time is None:
+            return
+        # GitHub names the resource a request was charged to
+        resource = response_headers.get("X-RateLimit-Resource", resource)
+        bucket = self.buckets.get(resource)
+        if bucket is None:
+            return
+        logger.trace(f"{resource} rate limit remaining: {remaining}")
+        bucket.update(int(remaining), int(reset_time))
+
+
+class PooledToken:
+    """A GitHub token with its own rate-limit state."""
+
+    def __init__(self, label, value):
+        self.label = label  # Safe to log, unlike the token itself
+        self.value = value
+        self.limiter = RateLimiter(label)
+
+    def auth_headers(self):
+        """Authorization header for requests made with this token."""
+        return {"Authorization": f"token {self.value}"} if self.value else {}
+
+
+class TokenPool:
+    """
+    Pool of GitHub tokens, each with its own rate limits.
+    Every request is routed to the token with the most remaining budget, so
+    throughput scales with the number of tokens.
+    """
+
+    def __init__(self, tokens):
+        # Without any token, requests are sent unauthenticated
+        values = list(tokens) or [None]
+        self.tokens = [
+            PooledToken(f"token{i}", value) for i, value in enumerate(values)
+        ]
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def select(self, resource):
+        """Picks the token that can serve a request soonest and has the most quota left."""
+        return max(
+            self.tokens,
+            key=lambda token: (
+                -token.limiter.bucket(resource).blocked_for(),
+                token.limiter.bucket(resource).remaining,
+            ),
+        )
+
+    async def acquire(self, resource):
+        """Waits for the rate limit of the selected token and returns that token."""
+        token = self.select(resource)
+        bucket = token.limiter.bucket(resource)
+        # Reserve before waiting so concurrent callers spread over the pool
+        bucket.reserve()
+        await bucket.acquire()
+        return token
+
+
+def is_rate_limited(status, response_headers):
+    """Checks whether an error response was caused by a primary or secondary rate limit."""
+    if status == 429:
+        return True
+    return status == 403 and (
+        response_headers.get("X-RateLimit-Remaining") == "0"
+        or "Retry-After" in response_headers
+    )
+
+
+def rate_limit_wait(response_headers):
+    """Number of seconds to wait before retrying a rate-limited request."""
+    retry_after = parse_retry_after(response_headers.get("Retry-After"))
+    if retry_after is not None:
+        return retry_after
+    reset_time = response_headers.get("X-RateLimit-Reset")
+    if response_headers.get("X-RateLimit-Remaining") == "0" and reset_time:
+        return max(0, int(reset_time) - time.time()) + settings.RATE_LIMIT_SLEEP_BUFFER
+    # Secondary limits without headers: GitHub asks for at least a minute
+    return settings.SECONDARY_RATE_LIMIT_WAIT
@@ -0,0 +1,139 @@
+import asyncio
+import json
+
+from loguru import logger
+
+import metrics
+import settings
+
+# Kinds of items flowing through the writer queue
+_RECORD = "record"
+_REPO_STATUS = "repo_status"
+_STOP = "stop"
+
+
+class RawOutput:
+    """
+    Raw JSONL output of the crawl, written by a single background task.
+    Crawl coroutines hand records to a bounded queue, so a slow disk applies
+    backpressure to fetching instead of blocking the event loop. The writer
+    serializes and writes records in large batches from a worker thread, in
+    the order they were queued.
+    When a CrawlState is given, files are marked done (and repository statuses
+    recorded) only after the preceding records have been flushed, so a resumed
+    crawl never skips a file that did not reach the output. Each batch's
+    progress is committed at once, from the same worker thread.
+    """
+
+    def __init__(self, file_handle, crawl_state=None):
+        self.file_handle = file_handle
+        self.crawl_state = crawl_state
+        self.records_written = 0
+        self.error = None
+        self._queue = asyncio.Queue(maxsize=settings.RAW_WRITER_QUEUE_SIZE)
+        self._task = None
+
+    def start(self):
+        """Starts the writer task."""
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Writes out everything still queued and stops the writer task."""
+        if self._task is None:
+            return
+        await self._queue.put((_STOP,))
+        await self._task
+        self._task = None
+        if self.error is not None:
+            logger.error(f"Raw output writer failed: {self.error}")
+
+    def queue_depth(self):
+        """Number of items waiting to be written."""
+        return self._queue.qsize()
+
+    async def write_record(self, full_name, repo_url, repo_license, file_info, content):
+        """Queues a single raw file record, waiting while the queue is full."""
+        if self.error is not None:
+            raise RuntimeError(f"Raw output writer failed: {self.error}")
+        # Prepare RAW output data - Sanitization will happen in the next pipeline stage
+        output_data = {
+            "repo_url": repo_url,
+            "path": file_info["path"],
+            "size": file_info.get("size"),
+            "license": repo_license,
+            "content_sha": file_info["sha"],  # Git SHA of the blob
+            "content": content,  # Store the full content
+        }
+        await self._queue.put((_RECORD, output_data, full_name))
+        metrics.files_written_total.inc()
+
+    async def completed_files(self, full_name):
+        """Paths of a repository's files written by an earlier, interrupted crawl."""
+        if self.crawl_state is None:
+            return set()
+        return await asyncio.to_thread(self.crawl_state.completed_files, full_name)
+
+    async def mark_repo(self, full_name, status):
+        """Records the crawl status of a repository once its queued records are written."""
+        metrics.repos_total.labels(status).inc()
+        if self.crawl_state is not None:
+            await self._queue.put((_REPO_STATUS, full_name, status))
+
+    async def _next_batch(self):
+        """Waits for at least one item, then takes whatever else is queued up to the batch size."""
+        batch = [await self._queue.get()]
+        batch_bytes = 0
+        while batch[-1][0] != _STOP:
+            if batch[-1][0] == _RECORD:
+                batch_bytes += len(batch[-1][1]["content"])
+            if batch_bytes >= settings.RAW_WRITER_BATCH_BYTES:
+                break
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    def _write_batch(self, batch):
+        """
+        Serializes and writes the batch's records in one chunk, then records
+        the progress they make. Runs in a worker thread.
+        """
+        records = [item[1] for item in batch if item[0] == _RECORD]
+        if records:
+            self.file_handle.write(
+                "".join(json.dumps(record) + "\n" for record in records)
+            )
+            self.file_handle.flush()
+            self.records_written += len(records)
+        if self.crawl_state is not None:
+            with self.crawl_state.batch():
+                self._record_progress(batch)
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                if self.error is None:
+                    await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                # Keep draining the queue so producers never block on a dead writer
+                self.error = e
+                logger.error(f"Failed to write raw output: {e}")
+
+            if batch[-1][0] == _STOP:
+                return
+
+    def _record_progress(self, batch):
+        """Marks written files done and applies repository statuses, in queue order."""
+        written_files = []
+        for item in batch:
+            if item[0] == _RECORD:
+                record, full_name = item[1], item[2]
+                written_files.append((full_name, record["path"], record["content_sha"]))
+            elif item[0] == _REPO_STATUS:
+                # Files queued before this status must be recorded first
+                self.crawl_state.mark_files_done(written_files)
+                written_files = []
+                self.crawl_state.mark_repo(item[1], item[2])
+        self.crawl_state.mark_files_done(written_files)
@@ -0,0 +1,91 @@
+import random
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+
+import settings
+
+# Error classes of failed requests, each with its own retry budget
+RATE_LIMITED = "rate_limited"
+SERVER_ERROR = "server_error"
+CONNECTION = "connection"
+TIMEOUT = "timeout"
+
+# Server errors worth retrying; other error statuses will not change on retry
+RETRYABLE_STATUSES = frozenset({500, 502, 503, 504})
+
+
+def parse_retry_after(value):
+    """
+    Seconds to wait from a Retry-After header, given either as a number of
+    seconds or as an HTTP date. Returns None when missing or malformed.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class RetryPolicy:
+    """
+    Bounded retries of transient request failures. Every error class has its
+    own budget of retries per request, so e.g. a flaky connection cannot use
+    up the retries meant for rate limits. Delays grow exponentially with full
+    jitter: a uniform draw between zero and base_delay * 2**retry, capped at
+    max_delay, which keeps retrying clients from synchronizing. A Retry-After
+    from the server takes precedence, up to max_retry_after.
+    """
+
+    def __init__(
+        self,
+        budgets=None,
+        base_delay=None,
+        max_delay=None,
+        max_retry_after=None,
+        rng=None,
+    ):
+        self.budgets = settings.RETRY_BUDGETS if budgets is None else budgets
+        self.base_delay = base_delay or settings.RETRY_BASE_DELAY
+        self.max_delay = max_delay or settings.RETRY_MAX_DELAY
+        self.max_retry_after = max_retry_after or settings.RETRY_MAX_RETRY_AFTER
+        self.rng = rng or random.Random()
+
+    def backoff(self, retry):
+        """Fully jittered exponential delay before the given retry (0 for the first)."""
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * 2**retry))
+
+    def start(self):
+        """Retry state for one request."""
+        return RetryState(self)
+
+
+class RetryState:
+    """The retries a single request has used so far, by error class."""
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.retries = Counter()
+
+    @property
+    def attempts(self):
+        """Attempts made so far, counting the one in progress."""
+        return self.retries.total() + 1
+
+    def allow(self, error_class):
+        """Takes one retry from the error class's budget; False once it is spent."""
+        if self.retries[error_class] >= self.policy.budgets.get(error_class, 0):
+            return False
+        self.retries[error_class] += 1
+        return True
+
+    def delay(self, retry_after=None):
+        """Seconds to wait before the next attempt."""
+        if retry_after is not None:
+            return min(retry_after, self.policy.max_retry_after)
+        return self.policy.backoff(self.retries.total() - 1)
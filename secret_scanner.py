@@ -0,0 +1,305 @@
+import math
+import re
+import string
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+
+import settings
+
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    A secret or PII pattern.
+    The rule only runs on content containing one of its keywords, a cheap
+    literal prefilter (compared case-insensitively with keywords_ignore_case),
+    and, if given, prefilter(content) returns True; rules without keywords
+    run on every file. The prefilter is checked first.
+    When the pattern needs context around the secret (e.g. the name of the
+    variable it is assigned to), the secret itself goes in a (?P<value>...)
+    group: only that span is reported and redacted.
+    Patterns that start with a literal are fast, as the re module searches for
+    the literal first; a leading \\b or lookbehind makes it try every position,
+    so word boundaries go in a lookbehind after the literal.
+    """
+
+    name: str  # Finding type, also the name of the rule's regex group
+    pattern: str  # No capturing groups, except an optional (?P<value>...)
+    keywords: tuple = ()
+    keywords_ignore_case: bool = False  # Keywords given in lower case
+    prefilter: object = None  # Optional cheap check of the content
+    report_matches: bool = False  # Record the matched values (PII only, never secrets)
+    validate: object = None  # Optional check on the matched text
+
+    @property
+    def placeholder(self):
+        """Text that replaces a match in redaction mode."""
+        return f"<REDACTED_{self.name.upper()}>"
+
+
+def _shannon_entropy(text):
+    """Shannon entropy of a string, in bits per character."""
+    length = len(text)
+    return -sum(
+        count / length * math.log2(count / length) for count in Counter(text).values()
+    )
+
+
+def _is_high_entropy(text):
+    return _shannon_entropy(text) >= settings.HIGH_ENTROPY_THRESHOLD
+
+
+_EMAIL_LOCAL_CHARS = frozenset(string.ascii_letters + string.digits + "._%+-")
+_EMAIL_DOMAIN_CHARS = frozenset(string.ascii_letters + string.digits + ".-")
+
+
+def _has_quotes(content):
+    return '"' in content or "'" in content
+
+
+def _may_contain_email(content):
+    """
+    Whether any @ in the content sits between address characters. Most @ in
+    code are decorators or operators after a space, where no address starts.
+    """
+    at = content.find("@", 1)
+    while at != -1:
+        if (
+            content[at - 1] in _EMAIL_LOCAL_CHARS
+            and content[at + 1 : at + 2] in _EMAIL_DOMAIN_CHARS
+        ):
+            return True
+        at = content.find("@", at + 1)
+    return False
+
+
+# Ordered from most to least specific: at a given position the first rule wins
+RULES = (
+    Rule(
+        "potential_private_key",
+        r"-----BEGIN (?:RSA |OPENSSH |EC |DSA |PGP |ENCRYPTED )?PRIVATE KEY(?: BLOCK)?-----"
+        # The whole block when it is complete, so redaction removes the key material
+        r"(?:[\s\S]*?-----END [A-Z ]*PRIVATE KEY(?: BLOCK)?-----)?",
+        keywords=("-----BEGIN",),
+    ),
+    Rule(
+        "aws_access_key_id",
+        r"(?:AKIA|ASIA)(?<!\w....)[0-9A-Z]{16}\b",
+        keywords=("AKIA", "ASIA"),
+    ),
+    Rule(
+        "aws_secret_access_key",
+        r"(?:SECRET_ACCESS_KEY|secret_access_key|SecretAccessKey)"
+        r"[\"']?\s*[:=]\s*[\"']?(?P<value>[A-Za-z0-9/+=]{40})(?![A-Za-z0-9/+=])",
+        keywords=("SECRET_ACCESS_KEY", "secret_access_key", "SecretAccessKey"),
+    ),
+    Rule(
+        "github_token",
+        r"(?:gh[pousr]_(?<!\wgh._)[A-Za-z0-9]{36}"
+        r"|github_pat_(?<!\wgithub_pat_)[A-Za-z0-9_]{82})\b",
+        keywords=("ghp_", "gho_", "ghu_", "ghs_", "ghr_", "github_pat_"),
+    ),
+    Rule(
+        "gcp_api_key",
+        r"AIza(?<!\wAIza)[0-9A-Za-z_\-]{35}",
+        keywords=("AIza",),
+    ),
+    Rule(
+        # The private key of a service account key file (which names its type)
+        "gcp_service_account_key",
+        r"\"private_key\"\s*:\s*\"(?P<value>-----BEGIN[^\"]*)\"",
+        keywords=("service_account",),
+    ),
+    Rule(
+        "slack_webhook",
+        r"https://hooks\.slack\.com/services/T[A-Za-z0-9_]+/B[A-Za-z0-9_]+/[A-Za-z0-9_]+",
+        keywords=("hooks.slack.com",),
+    ),
+    Rule(
+        "slack_token",
+        r"xox(?<!\wxox)[abprs]-[A-Za-z0-9-]{10,}",
+        keywords=("xox",),
+    ),
+    Rule(
+        "jwt",
+        r"eyJ(?<!\weyJ)[A-Za-z0-9_-]{10,}\.eyJ[A-Za-z0-9_-]{10,}\.[A-Za-z0-9_-]{10,}",
+        keywords=("eyJ",),
+    ),
+    Rule(
+        "pii_email",
+        # Starts only where a local part can start, and never backtracks into it
+        r"(?<![a-zA-Z0-9._%+-])[a-zA-Z0-9._%+-]++@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}",
+        keywords=("@",),
+        prefilter=_may_contain_email,
+        report_matches=True,
+    ),
+    Rule(
+        # Quoted random-looking strings, in files that name secrets at all
+        "high_entropy_string",
+        # Starts at the string itself, so rules for known token formats win
+        rf"(?<=[\"'])[A-Za-z0-9+/=_\-]{{{settings.HIGH_ENTROPY_MIN_LENGTH},}}(?=[\"'])",
+        keywords=settings.HIGH_ENTROPY_KEYWORDS,
+        keywords_ignore_case=True,
+        prefilter=_has_quotes,
+        validate=_is_high_entropy,
+    ),
+)
+
+_RULES_BY_NAME = {rule.name: rule for rule in RULES}
+
+
+def _value_group(name):
+    """Name of a rule's value group in the combined regex."""
+    return f"{name}__value"
+
+
+@lru_cache(maxsize=256)
+def _combined_regex(rule_names):
+    """
+    One alternation of the given rules, each in a group named after the rule,
+    with value groups renamed after their rule so the names stay unique.
+    """
+    return re.compile(
+        "|".join(
+            f"(?P<{name}>"
+            + _RULES_BY_NAME[name].pattern.replace(
+                "(?P<value>", f"(?P<{_value_group(name)}>"
+            )
+            + ")"
+            for name in rule_names
+        )
+    )
+
+
+def secret_span(match):
+    """Start and end of the secret in a match of the combined regex."""
+    name = match.lastgroup
+    if _value_group(name) in match.re.groupindex:
+        return match.span(_value_group(name))
+    return match.span(name)
+
+
+# Compile the full ruleset at import time, so a bad pattern fails early
+_combined_regex(tuple(rule.name for rule in RULES))
+
+
+def active_rules(content):
+    """
+    Names of the rules whose keywords occur in the content, in rule order.
+    Every keyword is one substring search over the content (stopping at the
+    first keyword found per rule), so this cost grows with the number of
+    keywords. Plain `in` searches still beat one alternation regex of all
+    keywords, which the re module cannot match in a single fast pass.
+    Case-insensitive keywords are searched in a lower-cased copy, made once
+    and only for content that passes the rule's prefilter.
+    """
+    names = []
+    lowered = None
+    for rule in RULES:
+        if rule.prefilter is not None and not rule.prefilter(content):
+            continue
+        text = content
+        if rule.keywords_ignore_case:
+            if lowered is None:
+                lowered = content.lower()
+            text = lowered
+        if not rule.keywords or any(keyword in text for keyword in rule.keywords):
+            names.append(rule.name)
+    return tuple(names)
+
+
+def iter_matches(content):
+    """
+    Yields (rule, match) for every secret or PII match, scanning the content once.
+    secret_span(match) gives the span of the secret itself.
+    Only the few rules whose keywords occur take part in the combined regex,
+    so the regex pass does not grow with the size of the ruleset; the keyword
+    prefilter does (see active_rules).
+    """
+    rule_names = active_rules(content)
+    if not rule_names:
+        return
+    for match in _combined_regex(rule_names).finditer(content):
+        rule = _RULES_BY_NAME[match.lastgroup]
+        start, end = secret_span(match)
+        if rule.validate is None or rule.validate(content[start:end]):
+            yield rule, match
+
+
+def _summarize(hits, record_values):
+    """
+    Groups (rule, text, start, end) hits into one finding per rule, in rule order:
+    {"type", "count", "matches", "spans"}. matches lists the unique matched
+    values of PII rules when record_values is set and is None otherwise;
+    secrets are never copied to the output.
+    """
+    by_rule = {}
+    for rule, text, start, end in hits:
+        by_rule.setdefault(rule.name, []).append((text, start, end))
+
+    findings = []
+    for rule in RULES:
+        rule_hits = by_rule.get(rule.name)
+        if not rule_hits:
+            continue
+        findings.append(
+            {
+                "type": rule.name,
+                "count": len(rule_hits),
+                "matches": sorted({text for text, _, _ in rule_hits})
+                if record_values and rule.report_matches
+                else None,
+                "spans": [{"start": start, "end": end} for _, start, end in rule_hits],
+            }
+        )
+    return findings
+
+
+def scan_content(content):
+    """
+    Scans content for secrets and PII and returns the findings.
+    Spans are character offsets of the matches in the content.
+    """
+    hits = []
+    for rule, match in iter_matches(content):
+        start, end = secret_span(match)
+        hits.append((rule, content[start:end], start, end))
+    return _summarize(hits, record_values=True)
+
+
+def redact_content(content):
+    """
+    Replaces secrets and PII with typed placeholders in the same single scan
+    that detects them. Returns (redacted content, findings). Spans are the
+    character offsets of the placeholders in the redacted content, and matched
+    values are not recorded.
+    """
+    rule_names = active_rules(content)
+    if not rule_names:
+        return content, []
+
+    hits = []
+    shift = 0  # Length difference between the redacted output and the input so far
+
+    def replace(match):
+        nonlocal shift
+        rule = _RULES_BY_NAME[match.lastgroup]
+        text = match.group()
+        value_start, value_end = secret_span(match)
+        value = content[value_start:value_end]
+        if rule.validate is not None and not rule.validate(value):
+            return text
+        placeholder = rule.placeholder
+        start = value_start + shift
+        hits.append((rule, value, start, start + len(placeholder)))
+        shift += len(placeholder) - len(value)
+        # Context around the secret (e.g. the assignment) is kept as is
+        return (
+            text[: value_start - match.start()]
+            + placeholder
+            + text[value_end - match.start() :]
+        )
+
+    redacted = _combined_regex(rule_names).sub(replace, content)
+    return redacted, _summarize(hits, record_values=False)
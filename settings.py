@@ -4,6 +4,14 @@ from datetime import datetime, timedelta
 GITHUB_API_URL = "https://api.github.com"
 # !! IMPORTANT: Set this environment variable before running !!
 GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN")
+# Optional pool of tokens (comma-separated), e.g. one per service account.
+# Each token has its own rate limits and requests go to the one with the most
+# budget left. Falls back to GITHUB_TOKEN when unset.
+GITHUB_TOKENS = [
+    token.strip()
+    for token in os.environ.get("GITHUB_TOKENS", "").split(",")
+    if token.strip()
+] or ([GITHUB_TOKEN] if GITHUB_TOKEN else [])
 
 # --- Search Criteria ---
 TARGET_LANGUAGE = "python"
@@ -46,23 +54,182 @@ MAX_FILE_SIZE = 1024 * 1024  # 1 MB limit
 MIN_FILE_LINES = 10
 
 # --- Processing Limits ---
-MAX_REPOS_TO_PROCESS = 20  # Max repos to attempt to fetch trees for
+MAX_REPOS_TO_PROCESS = 20  # Max repos to attempt to fetch trees for (None for no limit)
 MAX_FILES_PER_REPO = 50  # Max files to fetch content for per repo
 MAX_CONCURRENT_REQUESTS = 20  # Max simultaneous API requests
 
+# --- Crawl Mode ---
+# 'blobs' fetches the tree and then one blob per file through the API.
+# 'archive' downloads a single tarball per repository and extracts files locally.
+CRAWL_MODE = "blobs"
+ARCHIVE_CHUNK_SIZE = 64 * 1024  # Bytes read from the archive response at a time
+ARCHIVE_MAX_BUFFERED_CHUNKS = 64  # Chunks buffered between download and extraction
+ARCHIVE_READER_THREADS = MAX_CONCURRENT_REQUESTS  # Archive extraction threads
+
 # --- Output ---
 # Output from the initial crawl stage
 RAW_OUTPUT_FILE = "raw_crawled_data.jsonl"
+# Ledger of crawl progress (per-repository status, files written), used by --resume
+CRAWL_STATE_FILE = "crawl_state.sqlite"
+# Records queued for the raw output writer before fetching waits for the disk
+RAW_WRITER_QUEUE_SIZE = 1000
+# Content bytes gathered into one write
+RAW_WRITER_BATCH_BYTES = 4 * 1024 * 1024
 # Intermediate and final files for the pipeline
 FILTERED_OUTPUT_FILE = "filtered_data.jsonl"
 SCORED_OUTPUT_FILE = "scored_data.jsonl"
 FINAL_PARQUET_FILE = "final_dataset.parquet"
+# Number of records buffered before a row group is flushed to the Parquet file.
+# Bounds the pipeline's peak memory to roughly one row group of records.
+PARQUET_ROW_GROUP_SIZE = 5000
+# Compression codec of every Parquet column not listed below (None for the
+# codec's default level)
+PARQUET_COMPRESSION = "snappy"
+PARQUET_COMPRESSION_LEVEL = None
+# Per-column (codec, level) overrides. Columns are dotted paths such as
+# "annotations.code_density"; a struct or list name covers all its children.
+PARQUET_COLUMN_COMPRESSION = {"content": ("zstd", 9)}
+# Columns written with dictionary + RLE encoding (True for all columns)
+PARQUET_DICTIONARY_COLUMNS = (
+    "repo_url",
+    "license",
+    "sanitization_findings.list.element.type",
+)
+# Explicit encodings of non-dictionary columns
+PARQUET_COLUMN_ENCODINGS = {
+    "quality_score": "BYTE_STREAM_SPLIT",
+    "annotations.comment_ratio": "BYTE_STREAM_SPLIT",
+    "annotations.code_density": "BYTE_STREAM_SPLIT",
+    "size": "DELTA_BINARY_PACKED",
+    "line_count": "DELTA_BINARY_PACKED",
+}
+# Page indexes (per-page min/max and offsets) let readers skip pages; row
+# group statistics are always written
+PARQUET_WRITE_PAGE_INDEX = True
+# Columns with a per-row-group bloom filter in the file footer, used by
+# lookup.py to skip row groups that cannot contain a value
+PARQUET_BLOOM_FILTER_COLUMNS = ("processed_content_hash", "repo_url")
+BLOOM_FILTER_FPP = 0.01  # Target false positive rate
+# Hive-partitioned dataset of Parquet shards, written instead of
+# FINAL_PARQUET_FILE when set. Each run adds its own shards and rebuilds the
+# _metadata summary over all shards in the directory.
+FINAL_DATASET_DIR = None  # e.g. "final_dataset"
+# Partition columns: 'license' and/or 'quality_bucket' (derived from quality_score)
+DATASET_PARTITION_BY = ("license", "quality_bucket")
+QUALITY_BUCKET_WIDTH = 0.1
+# A shard is closed and a new one started once it reaches this size
+DATASET_SHARD_TARGET_BYTES = 256 * 1024 * 1024
+# Rows buffered across all open shards; beyond this the largest buffer is
+# flushed early as a smaller row group, bounding memory with many partitions
+DATASET_MAX_BUFFERED_ROWS = 2 * PARQUET_ROW_GROUP_SIZE
+
 
+# --- HTTP Cache ---
+# API responses are cached on disk and revalidated with ETag/Last-Modified;
+# 304 Not Modified answers do not count against the rate limit.
+HTTP_CACHE_DIR = ".cache/http"  # None disables the cache
+HTTP_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2 GB, least recently used evicted first
+
+# --- Blob Store ---
+# Decoded file contents are stored locally by git blob SHA, so blobs shared by
+# forks or already fetched by earlier crawls are never requested again.
+BLOB_STORE_DIR = ".cache/blobs"  # None disables the store
 
 # --- Rate Limiting ---
+# Requests are paced by one token bucket per rate-limit resource. The refill
+# rate follows X-RateLimit-Remaining/Reset so each window's quota is spread
+# evenly over the window; the limits below only apply until the first response.
 RATE_LIMIT_SLEEP_BUFFER = 5  # Add a small buffer to sleep time
-REQUEST_DELAY = 0.05  # Minimum delay between requests (adjust based on observation)
+RATE_LIMIT_SAFETY_MARGIN = 10  # Requests left unused in each window
+RATE_LIMIT_MAX_RETRIES = 3  # Retries of a request rejected by a rate limit
+SECONDARY_RATE_LIMIT_WAIT = (
+    60  # Seconds to wait on a secondary limit without Retry-After
+)
+CORE_RATE_LIMIT_PER_HOUR = 5000
+CORE_BURST = 10  # Requests that may be sent back to back
+# Ceiling on the request rate, keeping clear of secondary (abuse) rate limits
+CORE_MAX_REQUESTS_PER_SECOND = 10
+SEARCH_RATE_LIMIT_PER_MINUTE = 30
+SEARCH_BURST = 1
+
+# --- Retries ---
+# Retries per request for each class of transient failure (see retry.RetryPolicy).
+# Client errors such as 404 are never retried.
+RETRY_BUDGETS = {
+    "rate_limited": RATE_LIMIT_MAX_RETRIES,
+    "server_error": 3,  # 500, 502, 503, 504
+    "connection": 3,
+    "timeout": 2,
+}
+RETRY_BASE_DELAY = 1.0  # Seconds before the first retry, doubled for each retry
+RETRY_MAX_DELAY = 30.0  # Cap of the backoff; the actual delay is jittered below it
+RETRY_MAX_RETRY_AFTER = 120  # Longest Retry-After honored on server errors
+
+# --- Search ---
+# The search API returns at most 1000 results per query; larger result sets
+# are split into date/star shards.
+SEARCH_PER_PAGE = 100
+SEARCH_RESULT_CAP = 1000
+MAX_CONCURRENT_SEARCH_REQUESTS = 2
+
+# --- Metrics ---
+# Port of the crawler's Prometheus /metrics endpoint; None disables it
+METRICS_PORT = None  # e.g. 9108
+METRICS_HOST = "127.0.0.1"
+# Histogram buckets of request latencies and semaphore waits, in seconds
+METRICS_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
 
 # --- Pipeline Settings ---
+# Sanitization mode: 'report' only records findings, 'redact' also replaces
+# matched PII and secrets in the content with typed placeholders
+SANITIZE_MODE = "report"
+# Quoted strings at least this long are checked for secret-like entropy
+HIGH_ENTROPY_MIN_LENGTH = 32
+HIGH_ENTROPY_THRESHOLD = 4.5  # Bits per character; hex digests stay below 4
+# Lower-case names of secrets; high-entropy strings are only looked for in
+# files mentioning one, as most long random-looking strings in code are not secrets
+HIGH_ENTROPY_KEYWORDS = (
+    "secret",
+    "passw",
+    "api_key",
+    "apikey",
+    "credential",
+    "private_key",
+    "access_token",
+    "auth_token",
+    "api_token",
+)
 # Deduplication scope ('file' or 'repo') - 'file' means unique content across all repos
 DEDUPLICATION_SCOPE = "file"
+# Execution engine for Stage 1 and Stage 2: 'python' processes records as dicts,
+# 'arrow' runs filtering and scoring as Arrow compute kernels over whole batches
+PIPELINE_ENGINE = "python"
+# Raw JSONL lines parsed into one Arrow table by the 'arrow' engine
+ARROW_BATCH_SIZE = 8192
+# Worker processes for Stage 1 and Stage 2 (1 runs everything in the main process)
+PIPELINE_WORKERS = 1
+# Raw JSONL lines sent to a worker at a time
+PIPELINE_BATCH_SIZE = 256
+# Batches queued per worker before the reader waits for results
+PIPELINE_MAX_PENDING_BATCHES_PER_WORKER = 2
+# Persistent index of content hashes shipped by earlier runs (None deduplicates
+# each run on its own). Kept records are committed to it when a run succeeds.
+DEDUP_INDEX_FILE = None  # e.g. "dedup_index.bin"
+# Slots allocated for a new index (rounded up to a power of two, 32 bytes each).
+# The index doubles at 70% load; size it for the expected corpus to avoid rehashing.
+DEDUP_INDEX_INITIAL_CAPACITY = 1 << 20
+# Near-duplicate detection with MinHash LSH, after exact deduplication.
+# The first file of each cluster of similar files is kept. Off by default: it
+# costs MinHash time and about 2 KB of memory per kept file.
+NEAR_DEDUPLICATION = False
+NEAR_DEDUP_NUM_PERM = 128  # MinHash signature length
+NEAR_DEDUP_BANDS = 16  # LSH bands; must divide NEAR_DEDUP_NUM_PERM
+NEAR_DEDUP_THRESHOLD = 0.8  # Estimated Jaccard similarity of near duplicates
+NEAR_DEDUP_SHINGLE_SIZE = 5  # Words per shingle
+
+# --- Profiling ---
+# Off unless --profile, --cprofile or --tracemalloc is passed to main.py or process_pipeline.py
+CRAWLER_PROFILE_FILE = "crawler_profile.json"
+PIPELINE_PROFILE_FILE = "pipeline_profile.json"
+PROFILE_TOP_ENTRIES = 25  # Functions and allocation sites listed in the summary
+TRACEMALLOC_FRAMES = 1  # Frames kept per allocation; more group by call path
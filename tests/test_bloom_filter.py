@@ -0,0 +1,40 @@
+import hashlib
+
+from bloom_filter import BloomFilter
+
+
+def values(prefix, count):
+    return [hashlib.sha256(f"{prefix}{i}".encode()).hexdigest() for i in range(count)]
+
+
+def test_no_false_negatives():
+    members = values("member", 5000)
+    bloom = BloomFilter.build(members + [None])
+    assert all(value in bloom for value in members)
+
+
+def test_false_positive_rate_within_bounds():
+    bloom = BloomFilter.build(values("member", 5000), false_positive_rate=0.01)
+    others = values("other", 20000)
+    false_positives = sum(value in bloom for value in others)
+    assert false_positives / len(others) < 0.02
+
+
+def test_sized_for_distinct_values():
+    once = BloomFilter.build(values("member", 1000))
+    repeated = BloomFilter.build(values("member", 1000) * 3)
+    assert (once.num_bits, once.num_hashes) == (repeated.num_bits, repeated.num_hashes)
+    assert once.bits == repeated.bits
+
+
+def test_empty_filter_contains_nothing():
+    bloom = BloomFilter.build([None])
+    assert not any(value in bloom for value in values("other", 100))
+
+
+def test_round_trips_through_dict():
+    members = values("member", 200)
+    bloom = BloomFilter.build(members)
+    restored = BloomFilter.from_dict(bloom.to_dict())
+    assert restored.bits == bloom.bits
+    assert all(value in restored for value in members)
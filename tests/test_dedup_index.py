@@ -0,0 +1,114 @@
+import hashlib
+import random
+
+import pytest
+
+from dedup_index import DedupIndex
+
+
+def digest(home, tag):
+    """A raw digest whose leading 8 bytes (its hash) select the given home slot."""
+    return home.to_bytes(8, "little") + tag.to_bytes(24, "little")
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "dedup_index.bin")
+
+
+def test_add_and_contains_hex_and_raw(path):
+    index = DedupIndex(path, initial_capacity=16)
+    content_hash = hashlib.sha256(b"print('hello')").hexdigest()
+    assert content_hash not in index
+    assert index.add(content_hash)
+    assert not index.add(content_hash)
+    assert content_hash in index
+    assert bytes.fromhex(content_hash) in index
+    assert len(index) == 1
+    index.close()
+
+
+def test_colliding_digests_probe_past_each_other(path):
+    index = DedupIndex(path, initial_capacity=16)
+    # Same home slot, and a run wrapping around the end of the table
+    colliding = [digest(3, tag) for tag in range(1, 5)]
+    wrapping = [digest(15, tag) for tag in range(1, 4)]
+    for value in colliding + wrapping:
+        assert index.add(value)
+    assert all(value in index for value in colliding + wrapping)
+    assert digest(3, 99) not in index
+    assert digest(15, 99) not in index
+    index.close()
+
+
+def test_growth_keeps_every_digest(path):
+    index = DedupIndex(path, initial_capacity=16)
+    hashes = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(1000)]
+    for content_hash in hashes:
+        index.add(content_hash)
+    assert index.capacity >= len(hashes) / 0.7
+    assert len(index) == len(hashes)
+    assert all(content_hash in index for content_hash in hashes)
+    index.commit()
+    index.close()
+
+    reopened = DedupIndex(path)
+    assert len(reopened) == len(hashes)
+    assert all(content_hash in reopened for content_hash in hashes)
+    reopened.close()
+
+
+def test_backward_shift_delete_keeps_probe_runs_reachable(path):
+    rng = random.Random(0)
+    index = DedupIndex(path, initial_capacity=64)
+    # Few home slots, including the last one, so probe runs overlap and wrap
+    values = [digest(rng.choice([0, 1, 2, 30, 31, 62, 63]), tag) for tag in range(40)]
+    for value in values:
+        index.add(value)
+    assert index.capacity == 64
+
+    removed = set(rng.sample(values, 20))
+    for value in removed:
+        index._remove(value)
+    assert len(index) == len(values) - len(removed)
+    for value in values:
+        assert (value in index) == (value not in removed)
+    index.close()
+
+
+def test_rollback_removes_only_uncommitted_digests(path):
+    index = DedupIndex(path, initial_capacity=16)
+    committed = [digest(5, tag) for tag in range(1, 4)]
+    for value in committed:
+        index.add(value)
+    index.commit()
+
+    uncommitted = [digest(5, tag) for tag in range(4, 7)]
+    for value in uncommitted:
+        index.add(value)
+    index.rollback()
+    assert len(index) == len(committed)
+    assert all(value in index for value in committed)
+    assert not any(value in index for value in uncommitted)
+    index.close()
+
+
+def test_reopen_rolls_back_a_run_that_never_committed(path):
+    index = DedupIndex(path, initial_capacity=16)
+    index.add(digest(1, 1))
+    index.commit()
+    index.add(digest(1, 2))
+    index.close()  # Interrupted before commit
+
+    reopened = DedupIndex(path)
+    assert digest(1, 1) in reopened
+    assert digest(1, 2) not in reopened
+    assert len(reopened) == 1
+    reopened.close()
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "not_an_index.bin"
+    path.write_bytes(b"x" * 64)
+    with pytest.raises(ValueError):
+        DedupIndex(str(path))
@@ -0,0 +1,79 @@
+import hashlib
+
+import pytest
+
+from lookup import lookup
+from parquet_output import PartitionedDatasetWriter, StreamingParquetWriter
+
+
+def record(i):
+    return {
+        "repo_url": f"https://github.com/owner/repo{i % 5}",
+        "path": f"src/module_{i}.py",
+        "size": 100,
+        "license": "MIT" if i % 2 else "Apache-2.0",
+        "content_sha": f"{i:040x}",
+        "content": f"def f():\n    return {i}\n",
+        "processed_content_hash": hashlib.sha256(str(i).encode()).hexdigest(),
+        "sanitization_findings": [],
+        "line_count": 3,
+        "quality_score": (i % 10) / 10,
+        "annotations": {
+            "comment_ratio": 0.0,
+            "code_density": 1.0,
+            "has_tests_keyword": False,
+        },
+    }
+
+
+RECORDS = [record(i) for i in range(2000)]
+
+
+@pytest.fixture(scope="module")
+def parquet_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("lookup") / "final_dataset.parquet")
+    with StreamingParquetWriter(path, row_group_size=100) as writer:
+        for row in RECORDS:
+            writer.write(row)
+    return path
+
+
+def test_finds_records_reading_only_candidate_row_groups(parquet_path):
+    wanted = [
+        RECORDS[5]["processed_content_hash"],
+        RECORDS[1500]["processed_content_hash"],
+    ]
+    table, read, total = lookup(
+        parquet_path, "processed_content_hash", wanted, columns=["path"]
+    )
+    assert sorted(table.column("path").to_pylist()) == [
+        "src/module_1500.py",
+        "src/module_5.py",
+    ]
+    assert total == 20
+    # Hashes are spread over every row group's min/max range; the bloom
+    # filters leave the two that hold them, plus rare false positives
+    assert 2 <= read <= 4
+
+
+def test_missing_value_reads_few_row_groups(parquet_path):
+    missing = hashlib.sha256(b"not in the dataset").hexdigest()
+    table, read, total = lookup(parquet_path, "processed_content_hash", [missing])
+    # A false positive of the bloom filter reads a row group without matches
+    assert table is None or table.num_rows == 0
+    assert read <= 2
+
+
+def test_fills_in_partition_columns_of_dataset_shards(tmp_path):
+    root = str(tmp_path / "dataset")
+    with PartitionedDatasetWriter(root, row_group_size=100) as writer:
+        for row in RECORDS:
+            writer.write(row)
+
+    wanted = RECORDS[7]["processed_content_hash"]
+    table, _, _ = lookup(
+        root, "processed_content_hash", [wanted], columns=["path", "license"]
+    )
+    assert table.to_pylist() == [
+        {"path": "src/module_7.py", "license": "MIT", "processed_content_hash": wanted}
+    ]
@@ -0,0 +1,41 @@
+import numpy as np
+
+from near_dedup import NearDuplicateIndex, minhash_signatures
+
+
+def signature(*values):
+    return np.array(values, dtype=np.uint32)
+
+
+def test_edited_copy_is_near_duplicate():
+    lines = [f"def function_{i}(value):\n    return value * {i}\n" for i in range(200)]
+    original = "".join(lines)
+    edited = "".join(lines[:100] + ["# edited\n"] + lines[101:])
+    unrelated = "".join(f"class Model{i}:\n    size = {i}\n" for i in range(200))
+
+    index = NearDuplicateIndex()
+    first, copy, other = minhash_signatures([original, edited, unrelated])
+    assert not index.is_near_duplicate(first)
+    assert index.is_near_duplicate(copy)
+    assert not index.is_near_duplicate(other)
+    assert len(index) == 2
+
+
+def test_every_representative_sharing_a_band_is_a_candidate():
+    # Two bands of two rows; b shares band 0 with a but is not similar enough
+    index = NearDuplicateIndex(num_perm=4, bands=2, threshold=0.75)
+    assert not index.is_near_duplicate(signature(1, 2, 3, 4))
+    assert not index.is_near_duplicate(signature(1, 2, 9, 9))
+    # Similar to b (3 of 4 values), reachable only through the shared band 0
+    # key, which a claimed first
+    assert index.is_near_duplicate(signature(1, 2, 9, 8))
+    assert len(index) == 2
+
+
+def test_signatures_outgrow_initial_storage():
+    rng = np.random.default_rng(0)
+    signatures = rng.integers(0, 2**32, size=(1500, 128), dtype=np.uint32)
+    index = NearDuplicateIndex()
+    assert not any(index.is_near_duplicate(s) for s in signatures)
+    assert all(index.is_near_duplicate(s) for s in signatures[::100])
+    assert len(index) == 1500
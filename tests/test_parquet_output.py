@@ -0,0 +1,33 @@
+import pyarrow.parquet as pq
+
+from parquet_output import PartitionedDatasetWriter, parquet_files
+
+
+def record(i):
+    return {
+        "repo_url": "https://github.com/owner/repo",
+        "path": f"src/module_{i}.py",
+        "size": 100,
+        "license": "MIT",
+        "content_sha": f"{i:040x}",
+        "content": f"x = {i}\n",
+        "processed_content_hash": f"{i:064x}",
+        "sanitization_findings": [],
+        "line_count": 1,
+        "quality_score": 0.5,
+        "annotations": {
+            "comment_ratio": 0.0,
+            "code_density": 1.0,
+            "has_tests_keyword": False,
+        },
+    }
+
+
+def test_runs_in_the_same_second_add_separate_shards(tmp_path):
+    root = str(tmp_path / "dataset")
+    for i in range(2):
+        with PartitionedDatasetWriter(root) as writer:
+            writer.write(record(i))
+
+    assert len(parquet_files(root)) == 2
+    assert pq.read_metadata(f"{root}/_metadata").num_rows == 2
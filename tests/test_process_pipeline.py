@@ -0,0 +1,152 @@
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+CONTENTS = [
+    "import os\n# comment\n\nprint(os.name)\n",
+    "import os\r\n# comment\r\n\r\nprint(os.name)\r\n",
+    "import os\r# comment\r\rprint(os.name)\r",
+    "import os\r\n# comment\rprint(os.name)",
+    "def f():\n    pass\f\n# page x = 1\x85\n",
+    "   \n\t\n",
+    "no newline",
+    "",
+]
+
+
+@pytest.fixture(scope="module")
+def pipeline(tmp_path_factory):
+    # process_pipeline opens its log file in the working directory on import
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(tmp_path_factory.mktemp("pipeline"))
+        import process_pipeline
+    return process_pipeline
+
+
+@pytest.mark.parametrize("content", CONTENTS)
+def test_analyze_lines_counts_lines_like_splitlines(pipeline, content):
+    lines = [line.strip() for line in content.splitlines()]
+    comment_lines = sum(1 for line in lines if line.startswith("#"))
+    code_lines = sum(1 for line in lines if line and not line.startswith("#"))
+
+    stats = pipeline.analyze_lines(content)
+    assert stats.line_count == content.count("\n") + 1
+    assert stats.total_lines == len(lines)
+    assert stats.blank_lines == lines.count("")
+    assert stats.comment_lines == comment_lines
+    assert stats.code_lines == code_lines
+
+
+def test_arrow_scores_match_record_scores(pipeline):
+    # Empty content is filtered out before Arrow scoring
+    contents = [text for text in CONTENTS if text]
+    content = pa.array(contents, pa.string())
+    line_count = pa.array([text.count("\n") + 1 for text in contents], pa.int64())
+    scores, annotations = pipeline.score_and_annotate_arrow(content, line_count)
+
+    for text, score, annotation in zip(
+        contents, scores.to_pylist(), annotations.to_pylist()
+    ):
+        record = pipeline.score_and_annotate({"content": text})
+        assert score == record["quality_score"]
+        expected = {"comment_ratio": None, "code_density": None}
+        assert annotation == {**expected, **record["annotations"]}
+
+
+def write_raw(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            record = {
+                "repo_url": f"https://github.com/owner/repo{i % 3}",
+                "path": f"src/module_{i}.py",
+                "size": 100,
+                "license": "MIT",
+                "content_sha": f"{i:040x}",
+                "content": "import os\n"
+                + "# value\n" * (i % 4)
+                + "".join(f"x_{j} = {i}\n" for j in range(10)),
+            }
+            f.write(json.dumps(record) + "\n")
+
+
+@pytest.mark.parametrize("engine", ["python", "arrow"])
+def test_failed_run_keeps_previous_output(pipeline, tmp_path, monkeypatch, engine):
+    raw, final = tmp_path / "raw.jsonl", tmp_path / "final.parquet"
+    write_raw(raw, 300)
+    monkeypatch.setattr(pipeline.settings, "RAW_OUTPUT_FILE", str(raw))
+    monkeypatch.setattr(pipeline.settings, "FINAL_PARQUET_FILE", str(final))
+    monkeypatch.setattr(pipeline.settings, "PARQUET_ROW_GROUP_SIZE", 50)
+    pipeline.run_pipeline(workers=1, engine=engine)
+    assert pq.read_metadata(final).num_rows == 300
+
+    # Fails after several row groups were written
+    write_raw(raw, 600)
+    calls = []
+
+    def failing(*args, **kwargs):
+        calls.append(1)
+        if len(calls) > 1:
+            raise RuntimeError("scoring failed")
+        return score(*args, **kwargs)
+
+    name = "score_and_annotate_arrow" if engine == "arrow" else "score_and_annotate"
+    score = getattr(pipeline, name)
+    monkeypatch.setattr(pipeline, name, failing)
+    monkeypatch.setattr(pipeline.settings, "PIPELINE_BATCH_SIZE", 100)
+    monkeypatch.setattr(pipeline.settings, "ARROW_BATCH_SIZE", 100)
+    pipeline.run_pipeline(workers=1, engine=engine)
+    assert pq.read_metadata(final).num_rows == 300
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "final.parquet",
+        "raw.jsonl",
+    ]
+
+
+def test_failed_run_leaves_dataset_unchanged(pipeline, tmp_path, monkeypatch):
+    raw, dataset = tmp_path / "raw.jsonl", tmp_path / "dataset"
+    write_raw(raw, 300)
+    monkeypatch.setattr(pipeline.settings, "RAW_OUTPUT_FILE", str(raw))
+    monkeypatch.setattr(pipeline.settings, "PARQUET_ROW_GROUP_SIZE", 50)
+    monkeypatch.setattr(pipeline.settings, "PIPELINE_BATCH_SIZE", 100)
+    monkeypatch.setattr(pipeline.settings, "DATASET_SHARD_TARGET_BYTES", 1)
+    pipeline.run_pipeline(workers=1, dataset_dir=str(dataset))
+    before = sorted(p.relative_to(dataset) for p in dataset.rglob("*"))
+    metadata = (dataset / "_metadata").read_bytes()
+
+    calls = []
+    score = pipeline.score_and_annotate
+
+    def failing(*args, **kwargs):
+        calls.append(1)
+        if len(calls) > 250:
+            raise RuntimeError("scoring failed")
+        return score(*args, **kwargs)
+
+    monkeypatch.setattr(pipeline, "score_and_annotate", failing)
+    pipeline.run_pipeline(workers=1, dataset_dir=str(dataset))
+    assert sorted(p.relative_to(dataset) for p in dataset.rglob("*")) == before
+    assert (dataset / "_metadata").read_bytes() == metadata
+
+
+def test_arrow_rounding_matches_record_scores(pipeline):
+    # Ratios of many line counts, some of which Arrow's scaled rounding
+    # would put on the other side of a half
+    contents = [
+        "# note\n" * comments
+        + "x = 1\n" * code
+        + "\n" * blank
+        + "def test_x(): pass\n" * tests
+        for comments in range(0, 40, 3)
+        for code in range(1, 200, 7)
+        for blank in (0, 1, 5)
+        for tests in (0, 1)
+    ]
+    content = pa.array(contents, pa.string())
+    line_count = pa.array([text.count("\n") + 1 for text in contents], pa.int64())
+    scores, annotations = pipeline.score_and_annotate_arrow(content, line_count)
+
+    records = [pipeline.score_and_annotate({"content": text}) for text in contents]
+    assert scores.to_pylist() == [record["quality_score"] for record in records]
+    assert annotations.to_pylist() == [record["annotations"] for record in records]
@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+import pytest
+
+import settings
+from rate_limit import (
+    RateLimiter,
+    TokenBucket,
+    TokenPool,
+    is_rate_limited,
+    rate_limit_wait,
+)
+
+
+def bucket(quota=3600, window=3600, capacity=5, max_rate=100):
+    return TokenBucket("test", quota, window, capacity, max_rate)
+
+
+def test_rate_spreads_remaining_quota_over_the_window():
+    paced = bucket()
+    paced.update(remaining=1010, reset_at=time.time() + 100)
+    # The safety margin is left unused
+    assert paced.rate == pytest.approx(
+        (1010 - settings.RATE_LIMIT_SAFETY_MARGIN) / 100, rel=0.01
+    )
+    assert paced.remaining == 1010
+
+
+def test_rate_is_capped():
+    paced = bucket(max_rate=2)
+    paced.update(remaining=5000, reset_at=time.time() + 10)
+    assert paced.rate == 2
+
+
+def test_exhausted_quota_blocks_until_the_reset():
+    paced = bucket()
+    paced.update(remaining=settings.RATE_LIMIT_SAFETY_MARGIN, reset_at=time.time() + 30)
+    assert paced.blocked_for() == pytest.approx(
+        30 + settings.RATE_LIMIT_SLEEP_BUFFER, abs=1
+    )
+    assert paced.tokens == 0
+    assert paced.rate == paced.initial_rate
+
+
+def test_block_for_only_extends():
+    paced = bucket()
+    paced.block_for(10)
+    paced.block_for(1)
+    assert paced.blocked_for() == pytest.approx(10, abs=0.1)
+
+
+def test_acquire_allows_a_burst_then_paces():
+    async def acquire_all(paced, count):
+        start = time.monotonic()
+        for _ in range(count):
+            await paced.acquire()
+        return time.monotonic() - start
+
+    burst = asyncio.run(acquire_all(bucket(quota=10, window=1, capacity=5), 5))
+    assert burst < 0.05
+    paced = asyncio.run(acquire_all(bucket(quota=10, window=1, capacity=5), 8))
+    # Three requests past the burst at 10 per second
+    assert 0.25 <= paced < 0.6
+
+
+def test_limiter_updates_the_bucket_the_response_was_charged_to():
+    limiter = RateLimiter()
+    reset = int(time.time()) + 60
+    limiter.update(
+        "core",
+        {
+            "X-RateLimit-Remaining": "20",
+            "X-RateLimit-Reset": str(reset),
+            "X-RateLimit-Resource": "search",
+        },
+    )
+    assert limiter.bucket("search").remaining == 20
+    assert limiter.bucket("core").remaining == settings.CORE_RATE_LIMIT_PER_HOUR
+    # Responses without rate-limit headers change nothing
+    limiter.update("core", {})
+    assert limiter.bucket("core").reset_at is None
+
+
+def test_pool_prefers_unblocked_tokens_with_most_quota():
+    pool = TokenPool(["a", "b", "c"])
+    first, second, third = pool.tokens
+    first.limiter.bucket("core").remaining = 4000
+    second.limiter.bucket("core").remaining = 100
+    third.limiter.bucket("core").remaining = 4500
+    assert pool.select("core") is third
+    third.limiter.bucket("core").block_for(60)
+    assert pool.select("core") is first
+
+
+def test_pool_without_tokens_sends_unauthenticated_requests():
+    pool = TokenPool([])
+    assert len(pool) == 1
+    assert pool.tokens[0].auth_headers() == {}
+    assert TokenPool(["secret"]).tokens[0].auth_headers() == {
+        "Authorization": "token secret"
+    }
+
+
+@pytest.mark.parametrize(
+    "status, headers, limited",
+    [
+        (429, {}, True),
+        (403, {"X-RateLimit-Remaining": "0"}, True),
+        (403, {"Retry-After": "60"}, True),
+        (403, {"X-RateLimit-Remaining": "12"}, False),
+        (404, {"X-RateLimit-Remaining": "0"}, False),
+        (502, {"Retry-After": "5"}, False),
+    ],
+)
+def test_is_rate_limited(status, headers, limited):
+    assert is_rate_limited(status, headers) is limited
+
+
+def test_rate_limit_wait():
+    assert rate_limit_wait({"Retry-After": "42"}) == 42
+    reset = time.time() + 20
+    wait = rate_limit_wait(
+        {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(reset))}
+    )
+    assert wait == pytest.approx(20 + settings.RATE_LIMIT_SLEEP_BUFFER, abs=1.5)
+    assert rate_limit_wait({}) == settings.SECONDARY_RATE_LIMIT_WAIT
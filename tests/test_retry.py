@@ -0,0 +1,80 @@
+import random
+import time
+from email.utils import formatdate
+
+import pytest
+
+from retry import CONNECTION, RATE_LIMITED, SERVER_ERROR, RetryPolicy, parse_retry_after
+
+
+def policy(**options):
+    return RetryPolicy(
+        budgets={SERVER_ERROR: 2, CONNECTION: 1},
+        base_delay=1.0,
+        max_delay=5.0,
+        max_retry_after=60,
+        rng=random.Random(0),
+        **options,
+    )
+
+
+def test_each_error_class_has_its_own_budget():
+    retries = policy().start()
+    assert retries.allow(SERVER_ERROR)
+    assert retries.allow(CONNECTION)
+    assert not retries.allow(CONNECTION)
+    assert retries.allow(SERVER_ERROR)
+    assert not retries.allow(SERVER_ERROR)
+    # Classes without a budget are never retried
+    assert not retries.allow(RATE_LIMITED)
+    assert retries.attempts == 4
+
+
+def test_budgets_are_per_request():
+    retry_policy = policy()
+    first, second = retry_policy.start(), retry_policy.start()
+    assert first.allow(CONNECTION)
+    assert second.allow(CONNECTION)
+
+
+@pytest.mark.parametrize("retry", range(6))
+def test_backoff_is_jittered_below_the_capped_exponential(retry):
+    retry_policy = policy()
+    bound = min(5.0, 2**retry)
+    delays = [retry_policy.backoff(retry) for _ in range(1000)]
+    assert all(0 <= delay <= bound for delay in delays)
+    # Full jitter spreads the delays over the whole range
+    assert min(delays) < bound * 0.1
+    assert max(delays) > bound * 0.9
+
+
+def test_delay_follows_the_retries_used():
+    retries = policy().start()
+    retries.allow(SERVER_ERROR)
+    assert retries.delay() <= 1.0
+    retries.allow(SERVER_ERROR)
+    assert retries.delay() <= 2.0
+
+
+def test_retry_after_takes_precedence_up_to_the_cap():
+    retries = policy().start()
+    retries.allow(SERVER_ERROR)
+    assert retries.delay(retry_after=12) == 12
+    assert retries.delay(retry_after=600) == 60
+
+
+def test_parse_retry_after_seconds():
+    assert parse_retry_after("120") == 120
+    assert parse_retry_after(" 7 ") == 7
+
+
+def test_parse_retry_after_http_date():
+    value = formatdate(time.time() + 30, usegmt=True)
+    assert 28 <= parse_retry_after(value) <= 30
+    # Dates in the past mean retrying right away
+    assert parse_retry_after(formatdate(time.time() - 30, usegmt=True)) == 0
+
+
+@pytest.mark.parametrize("value", [None, "", "soon", "-5", "1.5"])
+def test_parse_retry_after_rejects_malformed_values(value):
+    assert parse_retry_after(value) is None